@@ -0,0 +1,83 @@
+"""
+Benchmark: query_cache value formats.
+
+Run: python bench_cache.py [entries_per_size]
+Stores synthetic federated results (student x course x faculty rows) at 100, 5,000 and 50,000 rows
+in temporary cache.db files, once as the old plain JSON TEXT and once per codec of the compressed
+BLOB format, then reports the file size and the sqlite-tier hit latency (SELECT + decode).
+"""
+import json
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from query_cache import decode_cache_value, encode_cache_value
+from wire_format import CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD, HAS_ZSTD
+
+SIZES = (100, 5000, 50000)
+PROGRAMS = ["Computer Science", "Mathematics", "Physics", "Electronics", "Mechanical"]
+FACULTY = [("Dr. Sharma", "Computer Science"), ("Dr. Rao", "Mathematics"), ("Dr. Iyer", "Physics")]
+
+
+def federated_result(n_rows):
+    rng = random.Random(n_rows)
+    rows = []
+    for i in range(n_rows):
+        student = rng.randrange(20000)
+        faculty, department = rng.choice(FACULTY)
+        course = rng.randrange(200)
+        rows.append({"student_id": f"S{student:05d}", "name": f"Student {student}",
+                     "email": f"student{student}@university.edu", "program": rng.choice(PROGRAMS),
+                     "course_id": f"CS{course:03d}", "course_name": f"Course {course}",
+                     "faculty_name": faculty, "department": department})
+    return {"success": True, "columns": list(rows[0].keys()), "rows": rows, "federated": True}
+
+
+def run_format(path, label, results, entries, encode, decode):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE query_cache (query_hash TEXT PRIMARY KEY, result BLOB)")
+    for size, result in results.items():
+        value = encode(result)
+        conn.executemany("INSERT INTO query_cache VALUES (?, ?)",
+                         ((f"{size}-{i}", value) for i in range(entries)))
+    conn.commit()
+    conn.execute("VACUUM")
+    conn.close()
+    file_kb = os.path.getsize(path) / 1024
+
+    conn = sqlite3.connect(path)
+    latencies = {}
+    for size in results:
+        samples = []
+        for i in range(entries):
+            start = time.perf_counter()
+            value = conn.execute("SELECT result FROM query_cache WHERE query_hash = ?", (f"{size}-{i}",)).fetchone()[0]
+            decode(value)
+            samples.append((time.perf_counter() - start) * 1000)
+        latencies[size] = statistics.median(samples)
+    conn.close()
+    print(f"{label:<14} {file_kb:>10.0f} KB   " + "   ".join(f"{latencies[size]:>8.2f} ms" for size in results))
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    results = {size: federated_result(size) for size in SIZES}
+    formats = [("json text", lambda r: json.dumps(r), json.loads),
+               ("blob none", lambda r: encode_cache_value(r, CODEC_NONE)[0], decode_cache_value),
+               ("blob zlib", lambda r: encode_cache_value(r, CODEC_ZLIB)[0], decode_cache_value)]
+    if HAS_ZSTD:
+        formats.append(("blob zstd", lambda r: encode_cache_value(r, CODEC_ZSTD)[0], decode_cache_value))
+
+    print(f"{entries} entries per size; hit latency is the median SELECT + decode")
+    print(f"{'format':<14} {'file size':>13}   " + "   ".join(f"{size:>8} rows" for size in SIZES))
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, encode, decode in formats:
+            run_format(os.path.join(tmp, label.replace(" ", "_") + ".db"), label, results, entries, encode, decode)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark: how many questions the fuzzy intent matcher keeps away from the LLM.
+
+Run: python bench_fuzzy.py [llm_ms]
+Routes a corpus of paraphrased questions through the regex templates alone and through
+regex + fuzzy_match, reporting the LLM-avoidance rate, wrong-intent matches (from either router),
+matcher latency and the expected per-question latency given an LLM round trip of `llm_ms`
+(default 1500 ms).
+"""
+import statistics
+import sys
+import time
+
+from fuzzy_match import MATCH_THRESHOLD, fuzzy_match, template_match
+
+# (question, target_db, expected intent or None when only the LLM can answer it)
+CORPUS = [
+    ("Show students with attendance greater than 75%", "db1", "attendance_above"),
+    ("which students have attendance above 80 percent", "db1", "attendance_above"),
+    ("students attending more than 90% of their classes", "db1", "attendance_above"),
+    ("who has attendance over 85%", "db1", "attendance_above"),
+    ("Students with attendance below 60%", "db1", "attendance_below"),
+    ("who attends less than 70% of classes", "db1", "attendance_below"),
+    ("list students whose attendance is under 50 percent", "db1", "attendance_below"),
+    ("students at risk: attendance lower than 65%", "db1", "attendance_below"),
+    ("Show attendance for student S001", "db1", "student_attendance"),
+    ("attendance details for S017", "db1", "student_attendance"),
+    ("what is the attendance record of s004", "db1", "student_attendance"),
+    ("S012 attendance per course", "db1", "student_attendance"),
+    ("which classes is s005 enrolled in", "db1", "student_courses"),
+    ("courses taken by S003", "db1", "student_courses"),
+    ("enrollment list for student s010", "db1", "student_courses"),
+    ("details of student S002", "db1", "student_details"),
+    ("give me the profile of s020", "db1", "student_details"),
+    ("student S008 info", "db1", "student_details"),
+    ("students in year 2", "db1", "students_by_year"),
+    ("list all 3rd year students", "db1", "students_by_year"),
+    ("who are the first year students", "db1", None),
+    ("how many students do we have", "db1", "count_students"),
+    ("total number of students", "db1", "count_students"),
+    ("count the students", "db1", "count_students"),
+    ("list all students", "db1", "all_students"),
+    ("display every student", "db1", "all_students"),
+    ("show student data", "db1", "all_students"),
+    ("what courses does Dr. Sharma teach", "db2", "courses_by_faculty"),
+    ("Show courses taught by Rao", "db2", "courses_by_faculty"),
+    ("classes handled by prof Iyer", "db2", "courses_by_faculty"),
+    ("courses taught by sharma from computer science", "db2", "courses_by_faculty"),
+    ("list faculty from the computer science department", "db2", "faculty_by_department"),
+    ("professors in the mathematics department", "db2", "faculty_by_department"),
+    ("who teaches in physics dept", "db2", "faculty_by_department"),
+    ("exam schedule for CS101", "db2", "exams_for_course"),
+    ("when is the MA201 exam", "db2", "exams_for_course"),
+    ("exams for course PH110", "db2", "exams_for_course"),
+    ("remedial resources for CS101", "db2", "resources_for_course"),
+    ("help material for ma201", "db2", "resources_for_course"),
+    ("show all faculty", "db2", "all_faculty"),
+    ("list the faculty members", "db2", "all_faculty"),
+    ("list all courses", "db2", "all_courses"),
+    ("what courses are offered", "db2", "all_courses"),
+    ("show the course catalog", "db2", "all_courses"),
+    ("average number of credits per department", "db2", None),
+    ("which faculty teach more than three courses", "db2", None),
+    ("students enrolled in at least 4 courses", "db1", None),
+    ("students who missed classes last week", "db1", None),
+    ("top 5 students by attendance in CS101", "db1", None),
+    ("which semester had the most enrollments", "db1", None),
+    # a slot the intent does not bind, a keyword of another intent, or a negation: only the LLM is right
+    ("students in year 2 with attendance below 50%", "db1", None),
+    ("students in year 2 with attendance more than 50%", "db1", None),
+    ("attendance of students in year 3", "db1", None),
+    ("students with attendance not above 80%", "db1", None),
+    ("students with attendance not more than 80%", "db1", None),
+    ("students without attendance below 40%", "db1", None),
+    ("all students except year 1", "db1", None),
+]
+
+
+def timed_ms(fn, *args):
+    start = time.perf_counter()
+    out = fn(*args)
+    return (time.perf_counter() - start) * 1000, out
+
+
+def main():
+    llm_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 1500.0
+    for question, target_db, _ in CORPUS:  # warm up regex caches
+        fuzzy_match(question, target_db)
+
+    regex_hits = fuzzy_hits = regex_wrong = fuzzy_wrong = 0
+    regex_times, fuzzy_times = [], []
+    for question, target_db, expected in CORPUS:
+        regex_ms, regex_out = timed_ms(template_match, question, target_db)
+        regex_times.append(regex_ms)
+        if regex_out:
+            regex_hits += 1
+            fuzzy_times.append(regex_ms)
+            if regex_out[0] != expected:
+                regex_wrong += 1
+                print(f"  wrong intent (regex): {question!r} -> {regex_out[0]} (expected {expected})")
+            continue
+        fuzzy_ms, fuzzy_out = timed_ms(fuzzy_match, question, target_db)
+        fuzzy_times.append(regex_ms + fuzzy_ms)
+        if fuzzy_out:
+            fuzzy_hits += 1
+            if fuzzy_out[0] != expected:
+                fuzzy_wrong += 1
+                print(f"  wrong intent (fuzzy): {question!r} -> {fuzzy_out[0]} (expected {expected})")
+        elif expected:
+            print(f"  LLM fallback: {question!r} (expected {expected})")
+
+    n = len(CORPUS)
+    regex_llm = n - regex_hits
+    fuzzy_llm = n - regex_hits - fuzzy_hits
+    before = (sum(regex_times) + regex_llm * llm_ms) / n
+    after = (sum(fuzzy_times) + fuzzy_llm * llm_ms) / n
+    print(f"\nQuestions: {n}, threshold {MATCH_THRESHOLD}, assumed LLM round trip {llm_ms:.0f} ms")
+    print(f"{'router':<16} {'avoid LLM':>10} {'match ms (mean/max)':>22} {'expected ms/question':>22}")
+    print(f"{'regex':<16} {regex_hits / n:>10.0%} {statistics.mean(regex_times):>11.3f} / {max(regex_times):.3f}"
+          f" {before:>22.1f}")
+    print(f"{'regex + fuzzy':<16} {(regex_hits + fuzzy_hits) / n:>10.0%}"
+          f" {statistics.mean(fuzzy_times):>11.3f} / {max(fuzzy_times):.3f} {after:>22.1f}")
+    print(f"Matches with the wrong intent: regex {regex_wrong}, fuzzy {fuzzy_wrong}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark: hash_join vs the old nested-loop merge used in process_federated_query.
+
+Run: python bench_join.py [max_rows]
+Enrollment rows are joined against a course list (one course per 100 enrollments);
+time per row should stay flat as the input grows to 10^6 rows.
+"""
+import random
+import sys
+import time
+
+from join_ops import hash_join
+
+
+def make_rows(n_enrollments, n_courses):
+    courses = [{"course_id": 1000 + i, "course_name": f"Course {i}", "faculty_name": "Dr. Sharma"}
+               for i in range(n_courses)]
+    enrollments = [{"student_id": f"S{i % 5000:04d}", "name": f"Student {i % 5000}",
+                    "course_id": str(1000 + random.randrange(n_courses * 2))}
+                   for i in range(n_enrollments)]
+    return enrollments, courses
+
+
+def nested_loop(students, courses):
+    final_rows = []
+    for student in students:
+        for course in courses:
+            if str(student.get("course_id")) == str(course.get("course_id")):
+                final_rows.append({**student, **course})
+    return final_rows
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    out = fn(*args, **kwargs)
+    return time.perf_counter() - start, out
+
+
+def main():
+    max_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 10 ** 6
+    random.seed(42)
+
+    print(f"{'rows':>10} {'courses':>8} {'join':>6} {'hash_join s':>12} {'us/row':>8} {'nested s':>10}")
+    n = 1000
+    while n <= max_rows:
+        n_courses = max(n // 100, 10)
+        enrollments, courses = make_rows(n, n_courses)
+        for how in ("inner", "left", "semi"):
+            elapsed, out = timed(hash_join, enrollments, courses, "course_id", how=how)
+            nested = ""
+            if how == "inner" and n <= 10 ** 4:
+                nested_elapsed, expected = timed(nested_loop, enrollments, courses)
+                assert len(expected) == len(out)
+                nested = f"{nested_elapsed:.3f}"
+            print(f"{n:>10} {n_courses:>8} {how:>6} {elapsed:>12.3f} {elapsed / n * 1e6:>8.2f} {nested:>10}")
+        n *= 10
+
+
+if __name__ == "__main__":
+    main()
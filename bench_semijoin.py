@@ -0,0 +1,78 @@
+"""
+Benchmark: semijoin transport strategies for pushing DB2 course ids into DB1.
+
+Run: python bench_semijoin.py [enrollment_rows]
+Builds an in-memory Students/Enrollment pair with the import_db1 indexes and times
+each strategy (plus the old literal IN string) at 10, 10^3 and 10^5 keys.
+"""
+import random
+import sqlite3
+import sys
+import time
+
+from semijoin import STRATEGIES, run_semijoin
+
+SQL = """
+SELECT s.student_id, s.name, e.course_id
+FROM Students s
+JOIN Enrollment e ON s.student_id = e.student_id
+WHERE {semijoin}
+ORDER BY s.student_id
+"""
+
+
+def build_db(n_enrollments, n_courses, n_students=20000):
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE Students (student_id TEXT PRIMARY KEY, name TEXT)")
+    conn.execute("CREATE TABLE Enrollment (enrollment_id INTEGER PRIMARY KEY, student_id TEXT, course_id TEXT)")
+    conn.executemany("INSERT INTO Students VALUES (?, ?)",
+                     ((f"S{i:05d}", f"Student {i}") for i in range(n_students)))
+    conn.executemany("INSERT INTO Enrollment (student_id, course_id) VALUES (?, ?)",
+                     ((f"S{random.randrange(n_students):05d}", f"C{random.randrange(n_courses)}")
+                      for _ in range(n_enrollments)))
+    conn.execute("CREATE INDEX idx_enrollment_course ON Enrollment(course_id)")
+    conn.execute("CREATE INDEX idx_enrollment_student ON Enrollment(student_id)")
+    conn.execute("ANALYZE")
+    conn.commit()
+    return conn
+
+
+def literal_in(conn, keys):
+    """The pre-semijoin approach: every id inlined into one SQL string"""
+    course_list = "'" + "','".join(keys) + "'"
+    cursor = conn.execute(SQL.format(semijoin=f"e.course_id IN ({course_list})"))
+    return cursor.fetchall()
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        out = fn(*args, **kwargs)
+    except sqlite3.Error as e:
+        return None, str(e)
+    return time.perf_counter() - start, out
+
+
+def main():
+    n_enrollments = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    n_courses = 200000
+    random.seed(7)
+    conn = build_db(n_enrollments, n_courses)
+    print(f"Enrollment rows: {n_enrollments}, distinct course ids: {n_courses}")
+    print(f"{'keys':>8} {'strategy':>12} {'seconds':>10} {'rows':>8}")
+    for n_keys in (10, 10 ** 3, 10 ** 5):
+        keys = [f"C{k}" for k in random.sample(range(n_courses), n_keys)]
+        elapsed, out = timed(literal_in, conn, keys)
+        print(f"{n_keys:>8} {'literal':>12} {elapsed if elapsed is None else f'{elapsed:.4f}':>10} "
+              f"{len(out) if elapsed is not None else out:>8}")
+        for strategy in STRATEGIES:
+            elapsed, out = timed(run_semijoin, conn, SQL, "e.course_id", keys,
+                                 strategy=strategy, order_by=("student_id",))
+            if elapsed is None:
+                print(f"{n_keys:>8} {strategy:>12} {'n/a':>10}  ({out})")
+            else:
+                print(f"{n_keys:>8} {strategy:>12} {elapsed:>10.4f} {len(out['rows']):>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""
+Connection management for the coordinator.
+
+- DB1: bounded pool of SQLite connections, PRAGMAs applied once per connection
+- PC2: one shared requests.Session (HTTP keep-alive, tuned adapter pool)
+- cache.db: one long-lived connection guarded by a lock
+"""
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DB1_PATH = "db1_student.db"
+CACHE_DB = "cache.db"
+
+DB1_POOL_SIZE = 4
+DB1_ACQUIRE_TIMEOUT = 10  # seconds
+STATEMENT_CACHE_SIZE = 256  # compiled statements kept per SQLite connection (sqlite3 default: 128)
+PC2_POOL_CONNECTIONS = 2
+PC2_POOL_MAXSIZE = 8
+
+DB1_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=67108864",
+)
+CACHE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def open_sqlite(path, pragmas=(), uri=False):
+    """Open a SQLite connection usable from any thread and apply PRAGMAs (uri=True for file:...?mode=ro)"""
+    conn = sqlite3.connect(path, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE, uri=uri)
+    conn.row_factory = sqlite3.Row
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+class SQLitePool:
+    """Bounded pool of SQLite connections. Connections are created lazily up to `size`."""
+
+    def __init__(self, path, size=DB1_POOL_SIZE, pragmas=DB1_PRAGMAS, timeout=DB1_ACQUIRE_TIMEOUT, uri=False):
+        self.path = path
+        self.uri = uri
+        self.size = size
+        self.pragmas = pragmas
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._in_use = 0
+        self._acquired = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def acquire(self, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = open_sqlite(self.path, self.pragmas, uri=self.uri)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                start = time.perf_counter()
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError(f"No DB1 connection available after {timeout}s (pool size {self.size})")
+                finally:
+                    with self._lock:
+                        self._waits += 1
+                        self._wait_time += time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        with self._lock:
+            self._in_use -= 1
+        if not discard:
+            try:
+                if conn.in_transaction:
+                    conn.rollback()
+            except sqlite3.Error:
+                discard = True
+        if discard:
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        broken = False
+        try:
+            yield conn
+        except (sqlite3.ProgrammingError, sqlite3.InterfaceError):
+            broken = True
+            raise
+        finally:
+            self.release(conn, discard=broken)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "created": self._created,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "acquired": self._acquired,
+                "waits": self._waits,
+                "wait_time_s": round(self._wait_time, 4),
+            }
+
+    def close_all(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            conn.close()
+
+
+_db1_pool = None
+_pc2_session = None
+_cache_conn = None
+_cache_lock = threading.RLock()
+_init_lock = threading.Lock()
+
+
+def get_db1_pool():
+    global _db1_pool
+    if _db1_pool is None:
+        with _init_lock:
+            if _db1_pool is None:
+                _db1_pool = SQLitePool(DB1_PATH)
+    return _db1_pool
+
+
+def get_pc2_session():
+    """Shared keep-alive session for PC2 API calls"""
+    global _pc2_session
+    if _pc2_session is None:
+        with _init_lock:
+            if _pc2_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=PC2_POOL_CONNECTIONS,
+                                      pool_maxsize=PC2_POOL_MAXSIZE, pool_block=False)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({"Connection": "keep-alive"})
+                _pc2_session = session
+    return _pc2_session
+
+
+@contextmanager
+def cache_connection():
+    """Yield the long-lived cache.db connection; callers are serialized by a lock"""
+    global _cache_conn
+    with _cache_lock:
+        if _cache_conn is None:
+            _cache_conn = open_sqlite(CACHE_DB, CACHE_PRAGMAS)
+        yield _cache_conn
+
+
+def _pc2_pool_stats():
+    if _pc2_session is None:
+        return {"hosts": 0, "maxsize": PC2_POOL_MAXSIZE, "connections_opened": 0, "requests": 0, "free_slots": 0}
+    adapter = _pc2_session.get_adapter("http://")
+    hosts = opened = served = free = 0
+    for key in list(adapter.poolmanager.pools.keys()):
+        pool = adapter.poolmanager.pools.get(key)
+        if pool is None:
+            continue
+        hosts += 1
+        opened += pool.num_connections
+        served += pool.num_requests
+        free += pool.pool.qsize() if pool.pool is not None else 0
+    return {"hosts": hosts, "maxsize": PC2_POOL_MAXSIZE, "connections_opened": opened,
+            "requests": served, "free_slots": free}
+
+
+def pool_stats():
+    """Occupancy of every managed connection pool"""
+    return {
+        "db1": get_db1_pool().stats() if _db1_pool is not None else {"size": DB1_POOL_SIZE, "created": 0, "in_use": 0},
+        "pc2": _pc2_pool_stats(),
+        "cache": {"open": _cache_conn is not None},
+    }
+
+
+def close_all():
+    global _cache_conn, _pc2_session
+    if _db1_pool is not None:
+        _db1_pool.close_all()
+    with _cache_lock:
+        if _cache_conn is not None:
+            _cache_conn.close()
+            _cache_conn = None
+    if _pc2_session is not None:
+        _pc2_session.close()
+        _pc2_session = None
@@ -0,0 +1,191 @@
+"""
+HTTP service mode for the federated coordinator.
+
+POST /api/ask {"question": "...", "timeout": seconds(optional)} runs execute_query on a bounded
+worker pool. Requests beyond WORKERS running + MAX_QUEUED waiting are refused with 503 and a
+Retry-After header instead of piling up; a request that does not finish within its timeout gets
+504 (the worker finishes in the background and its result still lands in the cache).
+SIGINT/SIGTERM stop accepting connections, let in-flight questions drain, then close pools.
+GET /metrics exposes per-stage latency histograms in the Prometheus text format (see metrics.py).
+
+Run: python coordinator_service.py [--port 5003] [--workers 32] [--queue 256] [--quiet]
+"""
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+import federated_coordinator as coordinator
+from connections import close_all
+from metrics import render_prometheus
+from query_cache import start_sweeper, stop_sweeper
+
+SERVICE_PORT = 5003
+WORKERS = 32
+MAX_QUEUED = 256
+REQUEST_TIMEOUT = 30  # seconds, default per request
+MAX_REQUEST_TIMEOUT = 120
+DRAIN_TIMEOUT = 30  # seconds to wait for in-flight questions on shutdown
+RETRY_AFTER = 1  # seconds, sent with 503
+
+app = Flask(__name__)
+
+_executor = None
+_slots = None  # BoundedSemaphore: running + queued questions
+_accepting = threading.Event()
+service_stats = {"accepted": 0, "completed": 0, "failed": 0, "rejected": 0, "timed_out": 0, "active": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, delta=1):
+    with _stats_lock:
+        service_stats[key] += delta
+
+
+def start_pool(workers=WORKERS, max_queued=MAX_QUEUED):
+    global _executor, _slots
+    _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="coordinator")
+    _slots = threading.BoundedSemaphore(workers + max_queued)
+    _accepting.set()
+
+
+def run_question(question):
+    try:
+        result, from_cache = coordinator.execute_query(question)
+        _count("completed")
+        return result, from_cache
+    except Exception:
+        _count("failed")
+        raise
+    finally:
+        _count("active", -1)
+        _slots.release()
+
+
+def json_response(payload, status=200, headers=None):
+    body = json.dumps(payload, default=str)
+    return Response(body, status=status, mimetype="application/json", headers=headers)
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "healthy" if _accepting.is_set() else "draining"})
+
+
+@app.route('/api/ask', methods=['POST'])
+def ask():
+    data = request.get_json(silent=True) or {}
+    question = (data.get('question') or '').strip()
+    if not question:
+        return jsonify({"success": False, "error": "question is required"}), 400
+    try:
+        timeout = min(float(data.get('timeout', REQUEST_TIMEOUT)), MAX_REQUEST_TIMEOUT)
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "timeout must be a number"}), 400
+
+    if not _accepting.is_set():
+        return json_response({"success": False, "error": "Service is shutting down"}, 503,
+                             {"Retry-After": str(RETRY_AFTER)})
+    if not _slots.acquire(blocking=False):
+        _count("rejected")
+        return json_response({"success": False, "error": "Too many queued queries"}, 503,
+                             {"Retry-After": str(RETRY_AFTER)})
+    _count("accepted")
+    _count("active")
+    start = time.perf_counter()
+    try:
+        future = _executor.submit(run_question, question)
+    except RuntimeError:
+        # executor already shut down
+        _count("active", -1)
+        _slots.release()
+        return json_response({"success": False, "error": "Service is shutting down"}, 503,
+                             {"Retry-After": str(RETRY_AFTER)})
+    try:
+        result, from_cache = future.result(timeout=timeout)
+    except FutureTimeout:
+        _count("timed_out")
+        return jsonify({"success": False, "error": f"Query timed out after {timeout:g}s"}), 504
+    except Exception as e:
+        return jsonify({"success": False, "error": str(e)}), 500
+
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    status = 200 if result.get("success") is not False else 400
+    return json_response({**result, "from_cache": from_cache, "elapsed_ms": round(elapsed_ms, 2)}, status)
+
+
+@app.route('/api/stats', methods=['GET'])
+def stats():
+    with _stats_lock:
+        payload = {"service": dict(service_stats)}
+    payload["flights"] = {flight.name: flight.stats() for flight in
+                          (coordinator.query_flight, coordinator.db2_flight, coordinator.llm_flight)}
+    payload["pools"] = coordinator.pool_stats()
+    payload["cache"] = coordinator.cache_stats()
+    return json_response(payload)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text format: per-stage latency histograms, row/byte/error counters and service gauges"""
+    with _stats_lock:
+        gauges = {"service": dict(service_stats)}
+    for flight in (coordinator.query_flight, coordinator.db2_flight, coordinator.llm_flight):
+        gauges[f"flight_{flight.name}"] = flight.stats()
+    return Response(render_prometheus(gauges), mimetype="text/plain; version=0.0.4")
+
+
+def serve(host="0.0.0.0", port=SERVICE_PORT, workers=WORKERS, max_queued=MAX_QUEUED):
+    """Start the pool and a threaded WSGI server; blocks until SIGINT/SIGTERM, then drains"""
+    coordinator.init_cache()
+    start_sweeper()
+    coordinator.refresh_replica(background=True)
+    start_pool(workers, max_queued)
+
+    server = make_server(host, port, app, threaded=True)
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it cannot run on the serving thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f" Coordinator service on http://{host}:{port} ({workers} workers, {max_queued} queued max)",
+          file=sys.stderr)
+    server.serve_forever()
+
+    shutdown()
+
+
+def shutdown(drain_timeout=DRAIN_TIMEOUT):
+    """Refuse new questions, wait up to drain_timeout for in-flight ones, then release resources"""
+    _accepting.clear()
+    deadline = time.time() + drain_timeout
+    while service_stats["active"] > 0 and time.time() < deadline:
+        time.sleep(0.1)
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+    stop_sweeper()
+    close_all()
+    print(f" Coordinator service stopped ({service_stats['active']} question(s) abandoned)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve execute_query over HTTP")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--queue", type=int, default=MAX_QUEUED)
+    parser.add_argument("--quiet", action="store_true", help="silence per-query progress output")
+    args = parser.parse_args()
+    if args.quiet:
+        sys.stdout = open(os.devnull, "w")
+    serve(args.host, args.port, args.workers, args.queue)
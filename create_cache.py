@@ -9,23 +9,73 @@ def create_cache_db():
             query_hash TEXT PRIMARY KEY,
             query_text TEXT,
             query_type TEXT,
-            result TEXT,
-            created_at TIMESTAMP
+            result BLOB,
+            created_at TIMESTAMP,
+            expires_at REAL,
+            source_versions TEXT,
+            stored_bytes INTEGER,
+            result_bytes INTEGER,
+            last_used REAL
         )
     """)
     
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS joined_cache (
             cache_id INTEGER PRIMARY KEY AUTOINCREMENT,
-            student_id INTEGER,
-            course_id INTEGER,
+            student_id TEXT,
+            course_id TEXT,
             student_name TEXT,
+            student_email TEXT,
+            program TEXT,
             course_name TEXT,
             faculty_name TEXT,
+            department TEXT,
             created_at TIMESTAMP
         )
     """)
-    
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_joined_cache_pair ON joined_cache(student_id, course_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_faculty ON joined_cache(faculty_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_department ON joined_cache(department, faculty_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_course ON joined_cache(course_id)")
+
+    # PC2 course snapshot the joined_cache replica is built from (see materialize.py)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replica_courses (
+            course_id TEXT PRIMARY KEY,
+            course_name TEXT,
+            faculty_name TEXT,
+            department TEXT
+        )
+    """)
+    # DB1 enrollment snapshot, so a PC2-only change does not re-read DB1
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS replica_enrollments (
+            student_id TEXT,
+            course_id TEXT,
+            name TEXT,
+            email TEXT,
+            program TEXT,
+            PRIMARY KEY (student_id, course_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_replica_enrollments_course ON replica_enrollments(course_id)")
+
+    # Questions slower than metrics.SLOW_QUERY_MS, with SQL, plan and per-stage timings
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS slow_queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query_text TEXT,
+            query_type TEXT,
+            elapsed_ms REAL,
+            sql TEXT,
+            params TEXT,
+            plan TEXT,
+            stages TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_slow_queries_elapsed ON slow_queries(elapsed_ms)")
+
     conn.commit()
     conn.close()
     print(" Cache database created successfully!")
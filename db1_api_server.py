@@ -1,113 +1,365 @@
-from flask import Flask, jsonify, request
+"""
+PC1 Student API over db1_student.db.
+
+Development: python db1_api_server.py (Flask debug server, one connection per request).
+Production:  python db1_api_server.py --production [--host 0.0.0.0] [--port 5001] [--readers 8]
+  - threaded WSGI server (werkzeug make_server) with SIGINT/SIGTERM shutdown
+  - a pool of read-only (mode=ro, query_only) connections to the WAL database, reused across requests
+GET endpoints are served from an in-process response cache keyed by path, query string and
+negotiated format. A watcher connection reads PRAGMA data_version, which changes whenever any other
+connection commits to the file; a new value invalidates every cached response. Responses carry an
+ETag, and If-None-Match answers 304 without re-running the query.
+"""
+from flask import Flask, Response, jsonify, request, stream_with_context
+import argparse
+import functools
+import hashlib
+import json
+import signal
 import sqlite3
+import threading
+from contextlib import contextmanager
+from werkzeug.serving import make_server
+from connections import SQLitePool, open_sqlite
+from query_cache import LRUCache
+from sql_guard import (AUTO_LIMIT, QUERY_DEADLINE_MS, aborted_result, clear_deadline, guard_query, is_interrupted,
+                       set_deadline)
+from wire_format import (COLUMNAR_BINARY, columnar_payload, encode_binary, encode_json, negotiate, pick_codec,
+                         to_columnar)
 
 app = Flask(__name__)
 DB_PATH = "db1_student.db"
 
+NDJSON_MIMETYPE = "application/x-ndjson"
+STREAM_BATCH_SIZE = 500
+MAX_PAGE_LIMIT = 10000
+ROWID_KEY = "_rowid"
+QUERY_TIMEOUT_MS = QUERY_DEADLINE_MS  # deadline for /api/query statements
+API_PORT = 5001
+READ_POOL_SIZE = 8
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+READER_PRAGMAS = (
+    "PRAGMA query_only=ON",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=67108864",
+)
+WATCHER_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",  # persistent; read-only connections cannot switch it themselves
+    "PRAGMA busy_timeout=5000",
+)
+
+_read_pool = None  # SQLitePool of read-only connections in production mode
+_watcher = None
+_watcher_lock = threading.Lock()
+response_cache = LRUCache(max_bytes=RESPONSE_CACHE_MAX_BYTES)
+response_stats = {"not_modified": 0, "invalidations": 0}
+_seen_data_version = None
+
 def get_db():
+    """A pooled read-only connection in production mode, otherwise a new connection"""
+    if _read_pool is not None:
+        return _read_pool.acquire()
     conn = sqlite3.connect(DB_PATH)
     conn.row_factory = sqlite3.Row
     return conn
 
+def close_db(conn):
+    if _read_pool is not None:
+        _read_pool.release(conn)
+    else:
+        conn.close()
+
+@contextmanager
+def db_connection():
+    """get_db() for the duration of a block; the connection is returned even if a statement fails"""
+    conn = get_db()
+    try:
+        yield conn
+    finally:
+        close_db(conn)
+
+def data_version():
+    """
+    PRAGMA data_version on the long-lived watcher connection. It changes whenever another
+    connection commits to the database, so a new value means cached responses are stale.
+    """
+    global _watcher, _seen_data_version
+    with _watcher_lock:
+        if _watcher is None:
+            _watcher = open_sqlite(DB_PATH, WATCHER_PRAGMAS)
+        version = _watcher.execute("PRAGMA data_version").fetchone()[0]
+        if version != _seen_data_version:
+            if _seen_data_version is not None:
+                response_stats["invalidations"] += 1
+            response_cache.clear()
+            _seen_data_version = version
+        return version
+
+def etag_for(body):
+    return hashlib.md5(body).hexdigest()
+
+def not_modified(etag):
+    response_stats["not_modified"] += 1
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def cached_read(view):
+    """
+    Serve a GET endpoint from the response cache while the database is unchanged, with ETag /
+    If-None-Match support. NDJSON streams and non-200 responses are passed through uncached.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        if wants_ndjson():
+            return view(*args, **kwargs)
+        version = data_version()
+        key = "|".join((str(version), request.full_path, request.headers.get("Accept", ""),
+                        request.headers.get("Accept-Encoding", "")))
+        entry = response_cache.get(key)
+        if entry is None:
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+            body = response.get_data()
+            entry = (body, response.mimetype, etag_for(body))
+            response_cache.put(key, entry, len(body))
+        body, mimetype, etag = entry
+        if request.if_none_match.contains(etag):
+            return not_modified(etag)
+        response = Response(body, mimetype=mimetype)
+        response.set_etag(etag)
+        return response
+    return wrapper
+
+def wants_ndjson():
+    return NDJSON_MIMETYPE in request.headers.get("Accept", "")
+
+def page_params():
+    """Keyset pagination arguments: after=<rowid>&limit=N (limit clamped to MAX_PAGE_LIMIT)"""
+    after = request.args.get('after', type=int)
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_LIMIT))
+    return after, limit
+
+def keyset_select(table, where, params):
+    """SELECT over `table` ordered by rowid, resuming after the cursor; fetches limit+1 rows to detect a next page"""
+    after, limit = page_params()
+    sql = f"SELECT rowid AS {ROWID_KEY}, * FROM {table} WHERE 1=1{where}"
+    params = list(params)
+    if after is not None:
+        sql += " AND rowid > ?"
+        params.append(after)
+    sql += " ORDER BY rowid"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit + 1)
+    return sql, params, limit
+
+def stream_ndjson(sql, params, limit=None, max_rows=None, timeout_ms=None):
+    """
+    Write rows as NDJSON while they come off the cursor. If a limit is given and more rows
+    remain, a final {"_next_after": <rowid>} line carries the cursor for the next page.
+    With max_rows (an auto-limit) a final {"_truncated": true} line marks a cut result; with
+    timeout_ms a statement past its deadline ends the stream with {"_aborted": true, ...}.
+    """
+    def generate():
+        conn = get_db()
+        if timeout_ms:
+            set_deadline(conn, timeout_ms)
+        sent = 0
+        last_rowid = None
+        cursor = None
+        try:
+            cursor = conn.execute(sql, params)
+            while True:
+                batch = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not batch:
+                    break
+                for row in batch:
+                    if limit is not None and sent >= limit:
+                        yield json.dumps({"_next_after": last_rowid}) + "\n"
+                        return
+                    if max_rows is not None and sent >= max_rows:
+                        yield json.dumps({"_truncated": True, "limit": max_rows}) + "\n"
+                        return
+                    record = dict(row)
+                    last_rowid = record.pop(ROWID_KEY, None)
+                    yield json.dumps(record, default=str) + "\n"
+                    sent += 1
+        except sqlite3.OperationalError as e:
+            if not is_interrupted(e):
+                raise
+            yield json.dumps({"_aborted": True, "error": aborted_result(sql, timeout_ms)["error"],
+                              "rows_sent": sent}) + "\n"
+        finally:
+            if cursor is not None:
+                cursor.close()  # a pooled connection must not keep the statement (and its snapshot) open
+            if timeout_ms:
+                clear_deadline(conn)
+            close_db(conn)
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+
+def columnar_response(media, columns, rows, **extra):
+    """Columnar JSON or compressed binary frame (see wire_format) for tuple rows"""
+    payload = columnar_payload(columns, to_columnar(columns, rows), **extra)
+    if media == COLUMNAR_BINARY:
+        body = encode_binary(payload, pick_codec(request.headers.get("Accept-Encoding")))
+        return Response(body, mimetype=media)
+    return Response(encode_json(payload), mimetype=media)
+
+def table_response(table, where="", params=()):
+    """Serve rows of a table as JSON (optionally one keyset page), columnar, or as an NDJSON stream"""
+    sql, params, limit = keyset_select(table, where, params)
+    if wants_ndjson():
+        return stream_ndjson(sql, params, limit)
+
+    with db_connection() as conn:
+        cursor = conn.execute(sql, params)
+        try:
+            columns = [desc[0] for desc in cursor.description][1:]  # drop the leading rowid column
+            rows = []
+            for batch in iter(lambda: cursor.fetchmany(STREAM_BATCH_SIZE), []):
+                rows.extend(tuple(row) for row in batch)
+        finally:
+            cursor.close()
+
+    next_after = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][0]
+    extra = {}
+    if limit is not None or request.args.get('after') is not None:
+        extra["next_after"] = next_after
+
+    rows = [row[1:] for row in rows]
+    media = negotiate(request.headers.get("Accept"))
+    if media:
+        return columnar_response(media, columns, rows, **extra)
+    return jsonify({"success": True, "data": [dict(zip(columns, row)) for row in rows], **extra})
+
 @app.route('/health', methods=['GET'])
 def health():
     return jsonify({"status": "healthy", "database": "db1_student"})
 
+@app.route('/api/version', methods=['GET'])
+@cached_read
+def get_version():
+    """Per-table change counters (maintained by triggers created in import_db1)"""
+    with db_connection() as conn:
+        try:
+            rows = conn.execute("SELECT table_name, version FROM DataVersion ORDER BY table_name").fetchall()
+        except sqlite3.OperationalError:
+            return jsonify({"success": False, "error": "Version tracking not installed; re-run import_db1.py"}), 404
+    versions = {row["table_name"]: row["version"] for row in rows}
+    version = "|".join(f"{name}:{value}" for name, value in versions.items())
+    # "params": /api/query binds `?` parameters sent alongside the SQL
+    return jsonify({"success": True, "version": version, "tables": versions, "params": True})
+
+@app.route('/api/stats', methods=['GET'])
+@cached_read
+def get_stats():
+    """Table cardinalities from sqlite_stat1 (same shape the coordinator's planner expects from PC2)"""
+    tables = {}
+    with db_connection() as conn:
+        try:
+            rows = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+        except sqlite3.OperationalError:
+            rows = []  # ANALYZE has not been run yet
+    for row in rows:
+        values = [int(x) for x in row["stat"].split() if x.isdigit()]
+        if not values:
+            continue
+        entry = tables.setdefault(row["tbl"], {"rows": values[0], "indexes": {}})
+        if row["idx"] and len(values) > 1:
+            entry["indexes"][row["idx"]] = values[1:]
+    return jsonify({"success": True, "tables": tables})
+
 @app.route('/api/students', methods=['GET'])
+@cached_read
 def get_students():
-    """Get all students or filter by ID"""
+    """Get all students or filter by ID (supports after/limit paging and NDJSON)"""
     student_id = request.args.get('student_id')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     if student_id:
-        cursor.execute("SELECT * FROM Students WHERE student_id = ?", (student_id,))
-    else:
-        cursor.execute("SELECT * FROM Students")
-    
-    students = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify({"success": True, "data": students})
+        return table_response("Students", " AND student_id = ?", [student_id])
+    return table_response("Students")
 
 @app.route('/api/enrollment', methods=['GET'])
+@cached_read
 def get_enrollment():
-    """Get enrollment data with optional filters"""
+    """Get enrollment data with optional filters (supports after/limit paging and NDJSON)"""
     course_id = request.args.get('course_id')
     student_id = request.args.get('student_id')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM Enrollment WHERE 1=1"
+    where = ""
     params = []
     
     if course_id:
-        query += " AND course_id = ?"
+        where += " AND course_id = ?"
         params.append(course_id)
     if student_id:
-        query += " AND student_id = ?"
+        where += " AND student_id = ?"
         params.append(student_id)
     
-    cursor.execute(query, params)
-    enrollments = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify({"success": True, "data": enrollments})
+    return table_response("Enrollment", where, params)
 
 @app.route('/api/attendance', methods=['GET'])
+@cached_read
 def get_attendance():
-    """Get attendance records with optional filters"""
+    """Get attendance records with optional filters (supports after/limit paging and NDJSON)"""
     student_id = request.args.get('student_id')
     course_id = request.args.get('course_id')
     status = request.args.get('status')
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    query = "SELECT * FROM Attendance WHERE 1=1"
+    where = ""
     params = []
     
     if student_id:
-        query += " AND student_id = ?"
+        where += " AND student_id = ?"
         params.append(student_id)
     if course_id:
-        query += " AND course_id = ?"
+        where += " AND course_id = ?"
         params.append(course_id)
     if status:
-        query += " AND status = ?"
+        where += " AND status = ?"
         params.append(status)
     
-    cursor.execute(query, params)
-    attendance = [dict(row) for row in cursor.fetchall()]
-    conn.close()
-    return jsonify({"success": True, "data": attendance})
+    return table_response("Attendance", where, params)
 
 @app.route('/api/attendance/summary', methods=['GET'])
+@cached_read
 def get_attendance_summary():
-    """Get attendance summary per student per course"""
-    conn = get_db()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT 
-            student_id,
-            course_id,
-            COUNT(*) as total_classes,
-            SUM(CASE WHEN status = 'Present' THEN 1 ELSE 0 END) as present_count,
-            ROUND(100.0 * SUM(CASE WHEN status = 'Present' THEN 1 ELSE 0 END) / COUNT(*), 2) as attendance_percentage
-        FROM Attendance
-        GROUP BY student_id, course_id
-    """)
-    
-    summary = [dict(row) for row in cursor.fetchall()]
-    conn.close()
+    """Get attendance summary per student per course (read from the trigger-maintained rollup)"""
+    with db_connection() as conn:
+        summary = [dict(row) for row in conn.execute("""
+            SELECT 
+                student_id,
+                course_id,
+                total_classes,
+                present_count,
+                ROUND(100.0 * present_count / total_classes, 2) as attendance_percentage
+            FROM AttendanceRollup
+            ORDER BY student_id, course_id
+        """).fetchall()]
     return jsonify({"success": True, "data": summary})
 
 @app.route('/api/query', methods=['POST'])
 def execute_custom_query():
-    """Execute custom SQL query (SELECT only)"""
+    """
+    Execute custom SQL query (SELECT only).
+    Statements go through sql_guard: cartesian products are rejected, a LIMIT of AUTO_LIMIT rows is
+    added when missing ("truncated" in the response) and execution stops at QUERY_TIMEOUT_MS ("aborted").
+    """
     data = request.json
     sql = data.get('sql', '').strip()
+    params = data.get('params') or []
+    if not isinstance(params, list):
+        return jsonify({"success": False, "error": "params must be a list"}), 400
     
     # Security: Only allow SELECT
     if not sql.upper().startswith('SELECT'):
@@ -116,25 +368,81 @@ def execute_custom_query():
     if any(word in sql.upper() for word in ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER']):
         return jsonify({"success": False, "error": "Destructive queries not allowed"}), 403
     
+    # Validate and inspect the plan before any response (streaming or not) commits to a 200
+    conn = get_db()
+    try:
+        guard = guard_query(conn, sql, params, limit=AUTO_LIMIT)
+    except Exception as e:
+        close_db(conn)
+        return jsonify({"success": False, "error": str(e)}), 400
+    if guard.get("error"):
+        close_db(conn)
+        return jsonify({"success": False, "rejected": True, "error": guard["error"]}), 400
+    sql, limit = guard["sql"], guard["limit"]
+
+    if wants_ndjson():
+        close_db(conn)
+        return stream_ndjson(sql, params, max_rows=limit, timeout_ms=QUERY_TIMEOUT_MS)
+
+    set_deadline(conn, QUERY_TIMEOUT_MS)
     try:
-        conn = get_db()
         cursor = conn.cursor()
-        cursor.execute(sql)
+        cursor.execute(sql, params)
         
         columns = [desc[0] for desc in cursor.description]
-        results = [dict(zip(columns, row)) for row in cursor.fetchall()]
-        
-        conn.close()
-        return jsonify({"success": True, "data": results, "columns": columns})
+        rows = []
+        for batch in iter(lambda: cursor.fetchmany(STREAM_BATCH_SIZE), []):
+            rows.extend(batch)
     except Exception as e:
+        if is_interrupted(e):
+            return jsonify(aborted_result(sql, QUERY_TIMEOUT_MS)), 504
         return jsonify({"success": False, "error": str(e)}), 400
+    finally:
+        clear_deadline(conn)
+        close_db(conn)
+
+    extra = {}
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        extra = {"truncated": True, "limit": limit}
+    media = negotiate(request.headers.get("Accept"))
+    if media:
+        return columnar_response(media, columns, rows, **extra)
+    return jsonify({"success": True, "data": [dict(zip(columns, row)) for row in rows], "columns": columns, **extra})
+
+def serve(host="0.0.0.0", port=API_PORT, readers=READ_POOL_SIZE):
+    """Production mode: threaded WSGI server over a pool of read-only connections"""
+    global _read_pool
+    data_version()  # opens the watcher, which also puts the database in WAL mode
+    _read_pool = SQLitePool(f"file:{DB_PATH}?mode=ro", size=readers, pragmas=READER_PRAGMAS, uri=True)
+    server = make_server(host, port, app, threaded=True)
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f" Serving on http://{host}:{port} ({readers} read-only connections)")
+    server.serve_forever()
+    _read_pool.close_all()
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="PC1 Student API Server")
+    parser.add_argument("--production", action="store_true", help="threaded WSGI server with read-only pooled connections")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=API_PORT)
+    parser.add_argument("--readers", type=int, default=READ_POOL_SIZE)
+    args = parser.parse_args()
     print("="*60)
     print(" PC1 Student API Server")
     print("="*60)
     print("Database: db1_student.db (SQLite)")
     print("Tables: Students, Enrollment, Attendance")
-    print("Port: 5001")
+    print(f"Port: {args.port}")
+    print(f"Mode: {'production' if args.production else 'development (debug)'}")
     print("="*60)
-    app.run(host='0.0.0.0', port=5001, debug=True)
+    if args.production:
+        serve(args.host, args.port, args.readers)
+    else:
+        app.run(host=args.host, port=args.port, debug=True)
@@ -0,0 +1,310 @@
+"""
+Decomposition of multi-part questions into a DAG of sub-queries, run concurrently.
+
+"exams and remedial resources for courses where attendance is below 60%" becomes
+
+    course_ids (DB1: AttendanceRollup per course)
+      |-> exams      (DB2, course ids pushed in)
+      |-> resources  (DB2, course ids pushed in)
+
+Conditions (attendance threshold, a student id, a faculty name) produce course-id sets; when several
+are present they run side by side and an `intersect` node combines them. Each requested entity is a
+node fed by that set; an explanation clause ("... and suggest what to do") adds an LLM node over all
+of them. run_dag() starts every node as soon as its inputs are ready, so latency follows the critical
+path instead of the sum of all calls.
+
+An attendance threshold has the grain of its subject: "courses where attendance is below 60%" selects
+courses by their average, while "students with attendance below 60%" selects students by their own
+attendance; that student-grain node answers the students part itself, and other entities follow the
+courses those students are enrolled in.
+
+Only questions with a filter condition, or with two or more entities and a retrieval verb, are
+decomposed; "explain the importance of exams" or "why do students miss exams" stay with the regular
+routing. The LLM node runs even when a data node failed, and is told which data is missing.
+
+Nodes are plain dicts: {"name", "source": "db1"|"db2"|"llm"|"intersect", "deps": [...], ...};
+the caller supplies run_node(node, inputs) to execute one node against the real sources. A dependent
+node reads its key values from the "key" column (default course_id) of its first input.
+"""
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pushdown import extract_aggregate
+from sql_templates import like_param
+
+DAG_WORKERS = 8
+
+LOW_ATTENDANCE_COURSES_SQL = """
+SELECT course_id,
+       ROUND(100.0 * SUM(present_count) / SUM(total_classes), 2) as attendance_percentage
+FROM AttendanceRollup
+GROUP BY course_id
+HAVING CAST(SUM(present_count) AS FLOAT) / SUM(total_classes) < ?
+ORDER BY course_id;
+"""
+
+HIGH_ATTENDANCE_COURSES_SQL = """
+SELECT course_id,
+       ROUND(100.0 * SUM(present_count) / SUM(total_classes), 2) as attendance_percentage
+FROM AttendanceRollup
+GROUP BY course_id
+HAVING CAST(SUM(present_count) AS FLOAT) / SUM(total_classes) > ?
+ORDER BY course_id;
+"""
+
+# Students whose own attendance (over the courses passed in {semijoin}) is below/above a threshold;
+# the threshold is bound first because semijoin keys follow all other parameters
+STUDENT_ATTENDANCE_SQL = """
+WITH threshold(value) AS (SELECT ?)
+SELECT s.student_id, s.name, s.email, r.courses,
+       ROUND(100.0 * r.present_count / r.total_classes, 2) as attendance_percentage
+FROM threshold
+CROSS JOIN (SELECT student_id, COUNT(*) AS courses, SUM(present_count) AS present_count,
+                   SUM(total_classes) AS total_classes
+            FROM AttendanceRollup
+            WHERE {semijoin}
+            GROUP BY student_id) r
+JOIN Students s ON s.student_id = r.student_id
+WHERE CAST(r.present_count AS FLOAT) / r.total_classes {op} threshold.value
+ORDER BY s.student_id;
+"""
+LOW_ATTENDANCE_STUDENTS_SQL = STUDENT_ATTENDANCE_SQL.replace("{op}", "<")
+HIGH_ATTENDANCE_STUDENTS_SQL = STUDENT_ATTENDANCE_SQL.replace("{op}", ">")
+
+ENROLLED_COURSE_IDS_SQL = """
+SELECT DISTINCT e.course_id
+FROM Enrollment e
+WHERE {semijoin}
+ORDER BY e.course_id;
+"""
+
+STUDENT_COURSE_IDS_SQL = "SELECT DISTINCT course_id FROM Enrollment WHERE student_id = ? ORDER BY course_id;"
+
+FACULTY_COURSE_IDS_SQL = """
+SELECT c.course_id
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id
+WHERE f.name LIKE ? ESCAPE '!';
+"""
+
+# Entity lookups; {semijoin} is replaced by the course-id predicate (or 1=1 when unrestricted)
+ENTITIES = {
+    "exams": ("db2", r'\bexams?\b|\bexaminations?\b', "e.course_id", """
+SELECT e.exam_id, e.course_id, e.exam_date, e.eligibility_criteria
+FROM Exams e
+WHERE {semijoin}
+ORDER BY e.course_id, e.exam_date;
+"""),
+    "resources": ("db2", r'\bremedial\b|\bresources?\b|\bstudy materials?\b', "r.course_id", """
+SELECT r.resource_id, r.course_id, r.type, r.description
+FROM Remedial_Resources r
+WHERE {semijoin}
+ORDER BY r.course_id;
+"""),
+    "faculty": ("db2", r'\bfaculty\b|\bprofessors?\b|\bteachers?\b|\binstructors?\b|\bwho teach', "c.course_id", """
+SELECT c.course_id, c.course_name, f.name as faculty_name, f.department, f.email
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id
+WHERE {semijoin}
+ORDER BY c.course_id;
+"""),
+    "students": ("db1", r'\bstudents?\b|\bpupils?\b', "e.course_id", """
+SELECT s.student_id, s.name, s.email, e.course_id
+FROM Enrollment e
+CROSS JOIN Students s ON s.student_id = e.student_id
+WHERE {semijoin}
+ORDER BY s.student_id;
+"""),
+}
+
+LLM_CLAUSE = r'\b(explain|suggest|recommend|summari[sz]e|advise|why)\b'
+RETRIEVAL_VERB = r'\b(show|list|get|find|display|fetch|retrieve|give me|which|what are)\b'
+SUBJECT_NOUN = r'\b(students?|pupils?|courses?|class(?:es)?|subjects?)\b'
+
+
+def attendance_grain(q, start):
+    """'student' or 'course': the nearest subject noun before the attendance phrase (default: student)"""
+    nouns = re.findall(SUBJECT_NOUN, q[:start])
+    if nouns and not nouns[-1].startswith(("student", "pupil")):
+        return "course"
+    return "student"
+
+
+def find_conditions(q):
+    """
+    Course-id producing condition nodes in a lowercased question.
+    Returns (nodes, remaining text) with each condition's words blanked out.
+    """
+    nodes = []
+    attendance = re.search(r'attendance\s*(?:is\s*)?(below|less than|under|lower than|<|above|more than|over|greater than|>)'
+                           r'\s*(\d+(?:\.\d+)?)\s*(?:%|percent)?', q)
+    if attendance:
+        below = attendance.group(1) in ("below", "less than", "under", "lower than", "<")
+        params = (float(attendance.group(2)) / 100.0,)
+        if attendance_grain(q, attendance.start()) == "student":
+            nodes.append({"name": "attendance_students", "source": "db1", "deps": [], "grain": "student",
+                          "sql": LOW_ATTENDANCE_STUDENTS_SQL if below else HIGH_ATTENDANCE_STUDENTS_SQL,
+                          "params": params})
+        else:
+            nodes.append({"name": "attendance_courses", "source": "db1", "deps": [], "grain": "course",
+                          "sql": LOW_ATTENDANCE_COURSES_SQL if below else HIGH_ATTENDANCE_COURSES_SQL,
+                          "params": params})
+        q = q[:attendance.start()] + " " + q[attendance.end():]
+    student = re.search(r'\b(?:student\s+)?s(\d{3})\b', q)
+    if student:
+        nodes.append({"name": "student_courses", "source": "db1", "deps": [], "grain": "course",
+                      "sql": STUDENT_COURSE_IDS_SQL, "params": ("S" + student.group(1),)})
+        q = q[:student.start()] + " " + q[student.end():]
+    faculty = re.search(r'(?:taught by|professor|\bdr\.?)\s+([a-z]+(?:\s+[a-z]+)*)', q)
+    if faculty:
+        name = re.split(r'\s+(?:in|with|who|whose|where|and|for|of|from)\b', faculty.group(1))[0].strip()
+        nodes.append({"name": "faculty_courses", "source": "db2", "deps": [], "grain": "course",
+                      "sql": FACULTY_COURSE_IDS_SQL, "params": (like_param(name),)})
+        q = q[:faculty.start()] + " " + q[faculty.start(1) + len(name):]
+    return nodes, q
+
+
+def find_entities(q):
+    """Requested entities in order of appearance"""
+    found = []
+    for name, (_, pattern, _, _) in ENTITIES.items():
+        match = re.search(pattern, q)
+        if match:
+            found.append((match.start(), name))
+    return [name for _, name in sorted(found)]
+
+
+def decompose(nl_query):
+    """
+    Return the DAG nodes (in a valid execution order) for a multi-part question,
+    or None when the question is a single lookup or an explanation that the regular path handles.
+    """
+    q = nl_query.lower()
+    if extract_aggregate(q)[0]:
+        return None  # grouped counts and averages are answered by aggregate pushdown
+    conditions, remaining = find_conditions(q)
+    entities = find_entities(remaining)
+    student_filter = next((node for node in conditions if node["grain"] == "student"), None)
+    if student_filter and "students" not in entities:
+        entities.insert(0, "students")
+    wants_llm = bool(re.search(LLM_CLAUSE, q))
+    if len(entities) < 2 and not (wants_llm and entities):
+        return None
+    if not conditions and not (len(entities) >= 2 and re.search(RETRIEVAL_VERB, q)):
+        return None
+
+    course_filters = [node for node in conditions if node["grain"] == "course"]
+    nodes = list(course_filters)
+    keys_node = None
+    if len(course_filters) == 1:
+        keys_node = course_filters[0]["name"]
+    elif len(course_filters) > 1:
+        keys_node = "course_ids"
+        nodes.append({"name": keys_node, "source": "intersect", "deps": [node["name"] for node in course_filters]})
+
+    entity_keys = keys_node
+    if student_filter:
+        # the student-grain filter is the students part; the other parts follow those students' courses
+        nodes.append({**student_filter, "name": "students", "deps": [keys_node] if keys_node else [],
+                      "key_column": "course_id", "strategy": "temp_table", "part": True})
+        if len(entities) > 1:
+            nodes.append({"name": "enrolled_courses", "source": "db1", "deps": ["students"], "grain": "course",
+                          "sql": ENROLLED_COURSE_IDS_SQL, "key": "student_id", "key_column": "e.student_id",
+                          "params": (), "order_by": ("course_id",)})
+            entity_keys = "enrolled_courses"
+            if keys_node:
+                entity_keys = "entity_course_ids"
+                nodes.append({"name": entity_keys, "source": "intersect", "deps": [keys_node, "enrolled_courses"]})
+
+    for name in entities:
+        if student_filter and name == "students":
+            continue
+        source, _, key_column, sql = ENTITIES[name]
+        nodes.append({"name": name, "source": source, "deps": [entity_keys] if entity_keys else [],
+                      "sql": sql, "key_column": key_column, "params": (), "part": True})
+
+    if wants_llm:
+        # runs even if some data parts failed, so the question still gets an answer
+        nodes.append({"name": "answer", "source": "llm", "deps": list(entities), "question": nl_query,
+                      "tolerant": True})
+    return nodes
+
+
+def key_values(result, key="course_id"):
+    rows = result.get("rows", []) if result else []
+    return list(dict.fromkeys(str(row[key]) for row in rows if row.get(key) is not None))
+
+
+def course_ids(result):
+    return key_values(result, "course_id")
+
+
+def intersect(inputs):
+    """Course ids present in every input result"""
+    sets = [course_ids(result) for result in inputs.values()]
+    common = set(sets[0]).intersection(*sets[1:]) if sets else set()
+    rows = [{"course_id": cid} for cid in sets[0] if cid in common] if sets else []
+    return {"success": True, "columns": ["course_id"], "rows": rows}
+
+
+def sources_of(nodes):
+    return sorted({node["source"] for node in nodes if node["source"] in ("db1", "db2")})
+
+
+def run_dag(nodes, run_node, max_workers=DAG_WORKERS):
+    """
+    Execute nodes concurrently, each as soon as all of its deps have finished.
+    run_node(node, {dep: result}) -> result dict. A node whose dependency failed is skipped,
+    unless it is marked "tolerant" (then it receives the failed results among its inputs).
+    Returns ({name: result}, {name: elapsed_ms}).
+    """
+    by_name = {node["name"]: node for node in nodes}
+    results, timings = {}, {}
+    pending = dict(by_name)
+    running = {}
+
+    def timed(node, inputs):
+        start = time.perf_counter()
+        try:
+            result = intersect(inputs) if node["source"] == "intersect" else run_node(node, inputs)
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+        return result, round((time.perf_counter() - start) * 1000, 2)
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dag") as executor:
+        while pending or running:
+            progressed = True
+            while progressed:  # a skipped node can unblock (and skip) its own dependents
+                progressed = False
+                for name, node in list(pending.items()):
+                    if not all(dep in results for dep in node["deps"]):
+                        continue
+                    del pending[name]
+                    progressed = True
+                    failed = [dep for dep in node["deps"] if results[dep].get("success") is False]
+                    if failed and not node.get("tolerant"):
+                        results[name] = {"success": False, "error": f"skipped: {', '.join(failed)} failed"}
+                        timings[name] = 0.0
+                        continue
+                    inputs = {dep: results[dep] for dep in node["deps"]}
+                    running[executor.submit(timed, node, inputs)] = name
+            if not running:
+                # whatever is left depends on a node that is not in the DAG
+                for name in pending:
+                    results[name] = {"success": False, "error": "unresolvable dependency"}
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                results[name], timings[name] = future.result()
+    return results, timings
+
+
+def critical_path_ms(nodes, timings):
+    """Longest chain of node timings through the DAG"""
+    finish = {}
+    for node in nodes:  # decompose() emits nodes in dependency order
+        finish[node["name"]] = timings.get(node["name"], 0.0) + max(
+            (finish.get(dep, 0.0) for dep in node["deps"]), default=0.0)
+    return round(max(finish.values(), default=0.0), 2)
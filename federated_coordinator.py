@@ -1,10 +1,33 @@
 import sqlite3
 import requests
+import functools
 import hashlib
 import json
 import sys
+import time
 import re
 from datetime import datetime, timedelta
+from join_ops import hash_join
+from connections import cache_connection, get_db1_pool, get_pc2_session, pool_stats, close_all
+from streaming import MAX_RESULT_ROWS, StreamingResult, estimate_row_bytes
+from semijoin import run_semijoin
+from wire_format import CLIENT_ACCEPT, client_accept_encoding, decode_response
+from planner import (DB2_IDS_PER_REQUEST, DEFAULT_DB1_STATS, DEFAULT_DB2_STATS, cached_stats, choose_plan,
+                     collect_db1_stats, estimate_plans, parse_db2_stats, record_plan)
+from query_cache import get_translation, save_translation, translation_key, init_translation_cache, normalize_question
+from query_cache import result_cache, sqlite_stats, cache_stats, start_sweeper, stop_sweeper, sweep_expired
+from query_cache import MAX_ENTRY_BYTES, decode_cache_value, encode_cache_value
+from query_cache import subquery_cache, subquery_key, subquery_stats
+from sql_templates import FACULTY_PATTERN, inline_params, like_param
+from fuzzy_match import fuzzy_match, matcher_stats, template_match
+from singleflight import SingleFlight
+from sql_guard import QUERY_DEADLINE_MS, aborted_result, clear_deadline, guard_query, is_interrupted, set_deadline
+from pushdown import (DB2_PROJECTIONS, PARTIAL_KEY_COLUMN, combine_partials, extract_aggregate, partial_sql,
+                      students_sql)
+from decomposer import critical_path_ms, decompose, key_values, run_dag, sources_of
+from materialize import ensure_replica, is_fresh, query_replica, refresh, refresh_in_background, replica_stats, META_DB1, META_DB2
+from metrics import (SLOW_QUERY_MS, annotate, bind_trace, end_trace, init_slow_log, instrument, log_slow_query,
+                     result_bytes, span, start_trace, summary as stage_summary)
 try:
     from google import genai
     # import google.generativeai as genai
@@ -14,6 +37,7 @@ except Exception:
     HAS_GENAI = False
 
 PC2_URL = "http://192.168.42.7:5002"
+LLM_MODEL = "gemini-2.0-flash-exp"
 
 client = None
 if HAS_GENAI:
@@ -22,65 +46,249 @@ if HAS_GENAI:
     except Exception:
         client = None
 
-CACHE_DB = "cache.db"
-CACHE_TTL = 300  # seconds
+CACHE_TTL = 300  # seconds, for entries whose sources cannot report a data version
+CACHE_MAX_AGE = 24 * 3600  # seconds, upper bound for version-validated entries
+VERSION_POLL_INTERVAL = 2  # seconds between PC2 /api/version checks
+DISPLAY_PAGE_SIZE = 20
+DB1_QUERY_TIMEOUT_MS = QUERY_DEADLINE_MS  # per-statement deadline for generated DB1 SQL
+
+# Concurrent identical work is done once (see singleflight.py)
+query_flight = SingleFlight("execute_query")
+db2_flight = SingleFlight("query_db2")
+llm_flight = SingleFlight("call_llm")
+
+DB1_SCHEMA = """
+Database: SQLite (db1_student.db)
+Tables:
+Students(student_id TEXT PRIMARY KEY, name TEXT, email TEXT, program TEXT, year INTEGER)
+Enrollment(enrollment_id INTEGER PRIMARY KEY, student_id TEXT, course_id TEXT, semester TEXT, enrollment_date DATE)
+Attendance(attendance_id INTEGER PRIMARY KEY, student_id TEXT, course_id TEXT, date DATE, status TEXT)
+AttendanceRollup(student_id TEXT, course_id TEXT, total_classes INTEGER, present_count INTEGER)
+  -- one row per (student_id, course_id), kept current from Attendance; prefer it for attendance percentages
+"""
+DB1_EXAMPLES = """
+Q: Get all students
+A: SELECT * FROM Students;
+
+Q: Students with more than 75% attendance
+A: SELECT DISTINCT s.student_id, s.name, s.email
+   FROM Students s
+   JOIN Attendance a ON s.student_id = a.student_id
+   GROUP BY s.student_id
+   HAVING (CAST(SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) AS FLOAT) / COUNT(*)) > 0.75;
+"""
+DB2_SCHEMA = """
+Database: MySQL (smart_campus_db2)
+Tables:
+Faculty(faculty_id INT PRIMARY KEY, name VARCHAR(100), department VARCHAR(50), email VARCHAR(100))
+Courses(course_id INT PRIMARY KEY, course_name VARCHAR(100), faculty_id INT, credits INT)
+Exams(exam_id INT PRIMARY KEY, course_id INT, exam_date DATE, eligibility_criteria TEXT)
+Remedial_Resources(resource_id INT PRIMARY KEY, course_id INT, type VARCHAR(50), description TEXT)
+"""
+DB2_EXAMPLES = """
+Q: All courses taught by Dr. Smith
+A: SELECT c.* FROM Courses c JOIN Faculty f ON c.faculty_id = f.faculty_id WHERE f.name LIKE '%Smith%';
+
+Q: Get all faculty in Computer Science
+A: SELECT * FROM Faculty WHERE department = 'Computer Science';
+"""
 
 def init_cache():
-    """Initialize cache database (only query_cache used)"""
-    conn = sqlite3.connect(CACHE_DB)
-    cursor = conn.cursor()
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS query_cache (
-            query_hash TEXT PRIMARY KEY,
-            query_text TEXT,
-            query_type TEXT,
-            result TEXT,
-            created_at TIMESTAMP
-        )
-    """)
-    conn.commit()
-    conn.close()
+    """Initialize cache database (query_cache, slow_queries, cache_meta bookkeeping and the joined_cache replica)"""
+    with cache_connection() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS query_cache (
+                query_hash TEXT PRIMARY KEY,
+                query_text TEXT,
+                query_type TEXT,
+                result BLOB,
+                created_at TIMESTAMP,
+                expires_at REAL,
+                source_versions TEXT,
+                stored_bytes INTEGER,
+                result_bytes INTEGER,
+                last_used REAL
+            )
+        """)
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(query_cache)")]
+        if "expires_at" not in columns:
+            conn.execute("ALTER TABLE query_cache ADD COLUMN expires_at REAL")
+        if "source_versions" not in columns:
+            conn.execute("ALTER TABLE query_cache ADD COLUMN source_versions TEXT")
+        # older rows hold plain JSON TEXT; decode_cache_value reads both, and their size falls back to LENGTH(result)
+        for column in ("stored_bytes INTEGER", "result_bytes INTEGER", "last_used REAL"):
+            if column.split()[0] not in columns:
+                conn.execute(f"ALTER TABLE query_cache ADD COLUMN {column}")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_expires ON query_cache(expires_at)")
+        init_translation_cache(conn)
+        init_slow_log(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS cache_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        """)
+        conn.commit()
+        ensure_replica(conn)  # replica DDL runs here once, not on every freshness check
+
+def get_source_versions(sources):
+    """
+    Current data version per source, e.g. {"db1": "Attendance:4|Enrollment:2|Students:2"}.
+    A value of None means the source cannot report a version right now.
+    """
+    versions = {}
+    for source in sources:
+        if source == "db1":
+            versions["db1"] = get_db1_version()
+        elif source == "db2":
+            versions["db2"] = get_db2_version()
+    return versions
+
+def get_db1_version():
+    """Read the trigger-maintained DataVersion counters from the local DB1 file"""
+    try:
+        with get_db1_pool().connection() as conn:
+            rows = conn.execute("SELECT table_name, version FROM DataVersion ORDER BY table_name").fetchall()
+        return "|".join(f"{name}:{value}" for name, value in rows) or None
+    except Exception:
+        return None
 
+_db2_version = {"value": None, "fetched_at": 0.0, "params": False}
+
+def get_db2_version():
+    """Ask PC2's /api/version, re-polling at most every VERSION_POLL_INTERVAL seconds"""
+    now = time.time()
+    if now - _db2_version["fetched_at"] < VERSION_POLL_INTERVAL:
+        return _db2_version["value"]
+    value, binds_params = None, False
+    try:
+        response = get_pc2_session().get(f"{PC2_URL}/api/version", timeout=2)
+        if response.status_code == 200:
+            payload = response.json()
+            value = payload.get("version")
+            value = str(value) if value is not None else None
+            binds_params = payload.get("params") is True
+    except Exception:
+        value = None
+    _db2_version["value"] = value
+    _db2_version["params"] = binds_params
+    _db2_version["fetched_at"] = now
+    return value
+
+def pc2_binds_params():
+    """True when PC2's /api/version advertises {"params": true}; otherwise values are sent inlined"""
+    get_db2_version()
+    return _db2_version["params"]
+
+def versions_current(recorded):
+    """True if every source version recorded with a cache entry is still the live version"""
+    if not recorded:
+        return True
+    current = get_source_versions(recorded.keys())
+    return all(current.get(source) is not None and current[source] == version
+               for source, version in recorded.items())
+
+def _drop_cache_entry(query_hash):
+    result_cache.invalidate(query_hash)
+    with cache_connection() as conn:
+        conn.execute("DELETE FROM query_cache WHERE query_hash = ?", (query_hash,))
+        conn.commit()
+
+@instrument("cache_lookup", rows=None)
 def get_from_cache(query_hash):
-    """Retrieve from cache if not expired"""
-    conn = sqlite3.connect(CACHE_DB)
-    cursor = conn.cursor()
-    cursor.execute("SELECT result, created_at FROM query_cache WHERE query_hash = ?", (query_hash,))
-    row = cursor.fetchone()
-    conn.close()
-    if row:
-        result_json, created_at = row
+    """
+    Retrieve from cache (memory tier first, then cache.db).
+    Entries that recorded source versions are valid while those versions are unchanged;
+    entries without versions fall back to CACHE_TTL expiry.
+    """
+    cached = result_cache.get(query_hash)
+    if cached is not None:
+        result, versions = cached
+        if versions_current(versions):
+            return result
+        sqlite_stats["stale"] += 1
+        _drop_cache_entry(query_hash)
+        return None
+
+    with cache_connection() as conn:
+        row = conn.execute("""
+            SELECT result, created_at, expires_at, source_versions, COALESCE(result_bytes, LENGTH(result))
+            FROM query_cache WHERE query_hash = ?
+        """, (query_hash,)).fetchone()
+    if not row:
+        sqlite_stats["misses"] += 1
+        return None
+
+    value, created_at, expires_at, versions_json, result_bytes = row
+    if expires_at is None:
+        # rows written before expires_at existed
         try:
-            created_time = datetime.fromisoformat(created_at)
-            if datetime.now() - created_time < timedelta(seconds=CACHE_TTL):
-                return json.loads(result_json)
+            expires_at = datetime.fromisoformat(created_at).timestamp() + CACHE_TTL
         except Exception:
-            # if created_at stored in another format, attempt best-effort parse / return cached
-            try:
-                return json.loads(result_json)
-            except Exception:
-                return None
-    return None
-
-def save_to_cache(query_hash, query_text, query_type, result):
-    """Save result to cache"""
-    conn = sqlite3.connect(CACHE_DB)
-    cursor = conn.cursor()
-    cursor.execute("""
-        INSERT OR REPLACE INTO query_cache
-        (query_hash, query_text, query_type, result, created_at)
-        VALUES (?, ?, ?, ?, ?)
-    """, (query_hash, query_text, query_type, json.dumps(result), datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+            expires_at = None
+    remaining = expires_at - time.time() if expires_at is not None else CACHE_TTL
+    if remaining <= 0:
+        sqlite_stats["expired"] += 1
+        _drop_cache_entry(query_hash)
+        return None
 
+    try:
+        versions = json.loads(versions_json) if versions_json else None
+        if not versions_current(versions):
+            sqlite_stats["stale"] += 1
+            _drop_cache_entry(query_hash)
+            return None
+        result = decode_cache_value(value)
+    except Exception:
+        return None
+    sqlite_stats["hits"] += 1
+    with cache_connection() as conn:
+        conn.execute("UPDATE query_cache SET last_used = ? WHERE query_hash = ?", (time.time(), query_hash))
+        conn.commit()
+    result_cache.put(query_hash, (result, versions), result_bytes, ttl=remaining)
+    return result
+
+def save_to_cache(query_hash, query_text, query_type, result, versions=None):
+    """
+    Save result to both cache tiers. With a complete set of source versions the entry lives
+    until a version changes (capped at CACHE_MAX_AGE); otherwise it expires after CACHE_TTL.
+    cache.db stores the compressed encoding; results above MAX_ENTRY_BYTES are not cached.
+    """
+    if versions is not None and any(v is None for v in versions.values()):
+        versions = None
+    ttl = CACHE_MAX_AGE if versions is not None else CACHE_TTL
+    with span("cache_store") as stage:
+        value, result_bytes = encode_cache_value(result)
+        if result_bytes > MAX_ENTRY_BYTES:
+            sqlite_stats["too_large"] += 1
+            print(f"  Result not cached ({result_bytes} bytes > {MAX_ENTRY_BYTES})")
+            return
+        stage["bytes"] = len(value)
+        now = datetime.now()
+        with cache_connection() as conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO query_cache
+                (query_hash, query_text, query_type, result, created_at, expires_at, source_versions,
+                 stored_bytes, result_bytes, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (query_hash, query_text, query_type, value, now.isoformat(), now.timestamp() + ttl,
+                  json.dumps(versions) if versions is not None else None, len(value), result_bytes, now.timestamp()))
+            conn.commit()
+        result_cache.put(query_hash, (result, versions), result_bytes, ttl=ttl)
+
+@instrument("call_llm", rows=None, size=len)
 def call_llm(prompt, max_tokens=250):
+    """Call Gemini once for identical prompts that are in flight at the same time"""
+    key = hashlib.md5(f"{max_tokens}|{prompt}".encode()).hexdigest()
+    return llm_flight.do(key, lambda: request_llm(prompt, max_tokens))
+
+def request_llm(prompt, max_tokens=250):
     """Call Google Gemini API using new SDK (if available), else return helpful error."""
     if not client:
         return "LLM not available (genai client not configured)."
     try:
         response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
+            model=LLM_MODEL,
             contents=prompt,
             config={
                 "temperature": 0.1,
@@ -101,6 +309,7 @@ def call_llm(prompt, max_tokens=250):
             return f"LLM Error: {str(e)}"
 
 
+@instrument("analyze_query", rows=None)
 def analyze_query(nl_query):
     """
     Determine query type and target databases
@@ -126,6 +335,11 @@ def analyze_query(nl_query):
     if is_llm:
         return "llm", []
 
+    # Aggregates grouped by faculty/department need DB2's course -> faculty mapping
+    aggregate, _ = extract_aggregate(q)
+    if aggregate and aggregate["group_by"] != "course":
+        return "federated", ["db1", "db2"]
+
     # Attendance special-case: DB1
     if "attendance" in q and not any(kw in q for kw in ["course name", "taught by", "professor", "faculty"]):
         return "sql", ["db1"]
@@ -146,138 +360,71 @@ def analyze_query(nl_query):
     else:
         return "sql", ["db1"]
 
+@instrument("pattern_match_query", rows=None)
 def pattern_match_query(nl_query, target_db):
     """
-    Pattern matching fallback for common query types.
-    Returns SQL string or None.
+    Pattern matching fallback for common query types (templates live in sql_templates.py).
+    Returns (sql, params) or None, also when the question has a negation or a value the template ignores.
     """
-    q = nl_query.lower().strip()
-
-    if target_db == "db1":
-        # Students with attendance > X%
-        if "student" in q and "attendance" in q and ("greater" in q or "more than" in q or ">" in q):
-            percent_match = re.search(r'(\d+)\s*(%|percent)?', q)
-            if percent_match:
-                threshold = float(percent_match.group(1)) / 100.0
-                return f"""
-SELECT DISTINCT s.student_id, s.name, s.email, s.program, s.year,
-    ROUND(100.0 * SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) / COUNT(*), 2) as attendance_percentage
-FROM Students s
-JOIN Attendance a ON s.student_id = a.student_id
-GROUP BY s.student_id, s.name, s.email, s.program, s.year
-HAVING (CAST(SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) AS FLOAT) / COUNT(*)) > {threshold};
-"""
-
-        # Students by ID
-        student_id_match = re.search(r'\bS(\d{3})\b', q)
-        if student_id_match and "student" in q:
-            student_id = 'S' + student_id_match.group(1)
-            return f"""
-SELECT a.course_id,
-       COUNT(*) as total_classes,
-       SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) as present_count,
-       ROUND(100.0 * SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) / COUNT(*), 2) as percentage
-FROM Attendance a
-WHERE a.student_id = '{student_id}'
-GROUP BY a.course_id;
-"""
-
-        # Students taking a specific course
-        course_match = re.search(r'taking\s+([a-zA-Z\s]+)', q)
-        if course_match and "student" in q:
-            course_name = course_match.group(1).strip()
-            return f"""
-SELECT s.student_id, s.name, s.email, s.program, s.year, c.course_id, c.course_name
-FROM Students s
-JOIN Enrollment e ON s.student_id = e.student_id
-JOIN Courses c ON e.course_id = c.course_id
-WHERE c.course_name LIKE '%{course_name}%';
-"""
-
-        # Default: show all students
-        if re.search(r"\bstudent'?s?\b", q) and any(kw in q for kw in ["show", "list", "get", "display", "all", "data", "info"]):
-            return "SELECT * FROM Students;"
-
-    elif target_db == "db2":
-        # Courses by faculty or department
-        if "course" in q and ("taught by" in q or "faculty" in q or "professor" in q or "by" in q):
-            faculty_match = re.search(r'(?:taught by|by|faculty|professor)\s+([a-zA-Z\s]+)(?:\s+from\s+([a-zA-Z\s]+))?', q, re.IGNORECASE)
-            if faculty_match:
-                faculty_name = faculty_match.group(1).strip()
-                department = faculty_match.group(2).strip() if faculty_match.group(2) else None
-                sql = f"""
-SELECT c.*, f.name as faculty_name
-FROM Courses c
-JOIN Faculty f ON c.faculty_id = f.faculty_id
-WHERE 1=1
-"""
-                if faculty_name:
-                    sql += f" AND f.name LIKE '%{faculty_name}%'"
-                if department:
-                    sql += f" AND f.department LIKE '%{department}%'"
-                sql += ";"
-                return sql
-
-        # Show all faculty
-        if q in ["all faculty", "show all faculty", "list all faculty"]:
-            return "SELECT * FROM Faculty;"
-
-        # Show all courses
-        if q in ["all courses", "show all courses", "list all courses"]:
-            return "SELECT * FROM Courses;"
-
-    return None
+    matched = template_match(nl_query, target_db)
+    if not matched:
+        return None
+    name, sql, params = matched
+    print(f"  Pattern matched ({name}).")
+    return sql.strip(), params
 
 
+def schema_fingerprint(target_db):
+    """Hash of everything a translation depends on: prompt schema/examples plus, for DB1, the live table DDL"""
+    if target_db == "db1":
+        parts = [DB1_SCHEMA, DB1_EXAMPLES]
+        try:
+            with get_db1_pool().connection() as conn:
+                parts.extend(row[0] or "" for row in conn.execute(
+                    "SELECT sql FROM sqlite_master WHERE type = 'table' ORDER BY name"))
+        except Exception:
+            pass
+    else:
+        parts = [DB2_SCHEMA, DB2_EXAMPLES]
+    return hashlib.md5("\n".join(parts).encode()).hexdigest()
 
 def generate_sql(nl_query, target_db):
-    """Generate SQL using pattern matching first, then LLM as fallback"""
+    """
+    Return (sql, params) for the question.
+    Regex templates are tried first, then the fuzzy intent matcher; LLM translations are
+    cached while the schema is unchanged.
+    """
     print("  Attempting pattern matching...")
-    pattern_sql = pattern_match_query(nl_query, target_db)
+    matched = pattern_match_query(nl_query, target_db)
+    if matched:
+        return matched
+
+    with span("fuzzy_match"):
+        fuzzy = fuzzy_match(nl_query, target_db)
+    if fuzzy:
+        name, sql, params, similarity = fuzzy
+        print(f"  Fuzzy matched ({name}, similarity {similarity:.2f}).")
+        return sql.strip(), params
+
+    fingerprint = schema_fingerprint(target_db)
+    key = translation_key(nl_query, target_db, fingerprint)
+    cached = get_translation(key)
+    if cached:
+        print("  Translation cache hit.")
+        return cached, ()
 
-    if pattern_sql:
-        sql = pattern_sql.strip()
-        if not sql.endswith(';'):
-            sql += ';'
-        print("  Pattern matched.")
-        return sql
+    sql = translate_sql(nl_query, target_db)
+    if "as error_message" not in sql:
+        save_translation(key, nl_query, target_db, fingerprint, sql)
+    return sql, ()
 
+def translate_sql(nl_query, target_db):
+    """Generate SQL with the LLM (used when no template matches)"""
     print("  Pattern not found. Using LLM for SQL generation...")
     if target_db == "db1":
-        schema = """
-Database: SQLite (db1_student.db)
-Tables:
-Students(student_id TEXT PRIMARY KEY, name TEXT, email TEXT, program TEXT, year INTEGER)
-Enrollment(enrollment_id INTEGER PRIMARY KEY, student_id TEXT, course_id TEXT, semester TEXT, enrollment_date DATE)
-Attendance(attendance_id INTEGER PRIMARY KEY, student_id TEXT, course_id TEXT, date DATE, status TEXT)
-"""
-        examples = """
-Q: Get all students
-A: SELECT * FROM Students;
-
-Q: Students with more than 75% attendance
-A: SELECT DISTINCT s.student_id, s.name, s.email
-   FROM Students s
-   JOIN Attendance a ON s.student_id = a.student_id
-   GROUP BY s.student_id
-   HAVING (CAST(SUM(CASE WHEN LOWER(a.status) = 'present' THEN 1 ELSE 0 END) AS FLOAT) / COUNT(*)) > 0.75;
-"""
+        schema, examples = DB1_SCHEMA, DB1_EXAMPLES
     else:
-        schema = """
-Database: MySQL (smart_campus_db2)
-Tables:
-Faculty(faculty_id INT PRIMARY KEY, name VARCHAR(100), department VARCHAR(50), email VARCHAR(100))
-Courses(course_id INT PRIMARY KEY, course_name VARCHAR(100), faculty_id INT, credits INT)
-Exams(exam_id INT PRIMARY KEY, course_id INT, exam_date DATE, eligibility_criteria TEXT)
-Remedial_Resources(resource_id INT PRIMARY KEY, course_id INT, type VARCHAR(50), description TEXT)
-"""
-        examples = """
-Q: All courses taught by Dr. Smith
-A: SELECT c.* FROM Courses c JOIN Faculty f ON c.faculty_id = f.faculty_id WHERE f.name LIKE '%Smith%';
-
-Q: Get all faculty in Computer Science
-A: SELECT * FROM Faculty WHERE department = 'Computer Science';
-"""
+        schema, examples = DB2_SCHEMA, DB2_EXAMPLES
 
     prompt = f"""Convert this question to a VALID SQL query. You MUST return a complete, executable SQL query.
 
@@ -325,59 +472,484 @@ SQL Query (complete and ready to execute):"""
 
     return sql
 
-def query_db1(sql):
-    """Query local SQLite (DB1)"""
+def cached_subquery(source, sql, params, run, store=True):
+    """
+    Second cache level below the per-question cache: one source query's result keyed by
+    (source, normalized SQL, params) and tagged with the source version read before it ran.
+    Different questions issuing the same subquery (e.g. the PC2 faculty -> courses lookup)
+    reuse it until the version changes or SUBQUERY_TTL passes. A source that cannot report a
+    version right now is neither served from nor stored in this cache.
+    """
+    key = subquery_key(source, sql, params)
+    cached = subquery_cache.get(key)
+    if cached is None and not store:
+        return run()  # nothing to validate or keep, so skip the version read
+    version = get_source_versions([source]).get(source)
+    if version is None:
+        subquery_stats["unversioned"] += 1
+    if cached is not None:
+        result, tag = cached
+        if version is not None and tag == version:
+            return result
+        subquery_stats["stale"] += 1
+        subquery_cache.invalidate(key)
+    result = run()
+    if store and version is not None and result.get("success") and isinstance(result.get("rows"), list):
+        size = sum(estimate_row_bytes(row) for row in result["rows"] if isinstance(row, dict))
+        if subquery_cache.put(key, (result, version), size):
+            subquery_stats["stored"] += 1
+    return result
+
+def subquery_cached(source, cache_args):
+    """
+    Decorator routing a DB1/DB2 query function through cached_subquery.
+    cache_args(*args, **kwargs) -> (sql, key params, store?) for the call.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            sql, params, store = cache_args(*args, **kwargs)
+            return cached_subquery(source, sql, params, lambda: fn(*args, **kwargs), store)
+        return inner
+    return wrap
+
+# a lazily streamed result is never stored, but a cached list result can answer a streaming caller
+@subquery_cached("db1", lambda sql, stream=False, params=(): (sql, params, not stream))
+@instrument("query_db1", size=result_bytes)
+def query_db1(sql, stream=False, params=()):
+    """
+    Query local SQLite (DB1) with bound `params`.
+    The statement passes the sql_guard checks first (cartesian products are rejected, a LIMIT is
+    added when missing) and runs under a DB1_QUERY_TIMEOUT_MS deadline.
+    Rows are read in fetchmany batches under a row/byte cap. With stream=True, "rows" is a
+    StreamingResult that keeps its pooled connection until it is drained or closed.
+    """
+    pool = get_db1_pool()
+    try:
+        conn = pool.acquire()
+    except Exception as e:
+        return {"success": False, "error": str(e), "sql": sql}
+    try:
+        guard = guard_query(conn, sql, params, limit=MAX_RESULT_ROWS)
+    except Exception as e:
+        pool.release(conn)
+        return {"success": False, "error": str(e), "sql": sql}
+    if guard.get("error"):
+        pool.release(conn)
+        print(f"  Guardrail: {guard['error']}")
+        return {"success": False, "rejected": True, "error": guard["error"], "sql": sql}
+    for note in guard["notes"]:
+        print(f"  Guardrail: {note}")
+
+    def release():
+        clear_deadline(conn)
+        pool.release(conn)
+
+    set_deadline(conn, DB1_QUERY_TIMEOUT_MS)
+    try:
+        cursor = conn.execute(guard["sql"], params)
+    except Exception as e:
+        release()
+        if is_interrupted(e):
+            return aborted_result(sql, DB1_QUERY_TIMEOUT_MS)
+        return {"success": False, "error": str(e), "sql": sql}
+
+    rows = StreamingResult(cursor, release=release, max_rows=MAX_RESULT_ROWS)
+    try:
+        # the first batch carries the up-front work (sorts, aggregates) and stays under the deadline
+        rows.peek(1)
+    except Exception as e:
+        rows.close()
+        if is_interrupted(e):
+            return aborted_result(sql, DB1_QUERY_TIMEOUT_MS)
+        return {"success": False, "error": str(e), "sql": sql}
+    if stream:
+        if not rows.exhausted:
+            clear_deadline(conn)  # later pages are fetched at the reader's pace
+        return {"success": True, "columns": rows.columns, "rows": rows, "streaming": True}
     try:
-        conn = sqlite3.connect("db1_student.db")
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(sql)
-        columns = [desc[0] for desc in cursor.description] if cursor.description else []
-        rows = [dict(row) for row in cursor.fetchall()]
-        conn.close()
+        result = {"success": True, "columns": rows.columns, "rows": rows.fetch_all()}
+    except Exception as e:
+        if is_interrupted(e):
+            return {**aborted_result(sql, DB1_QUERY_TIMEOUT_MS), "rows_fetched": rows.rows_fetched}
+        return {"success": False, "error": str(e), "sql": sql}
+    finally:
+        rows.close()
+    if rows.truncated:
+        result["truncated"] = True
+    return result
+
+@subquery_cached("db1", lambda sql, params: (sql, params, True))
+@instrument("query_db1", size=result_bytes)
+def query_db1_params(sql, params):
+    """Run a parameterized DB1 query and return every row (used by the federated planner)"""
+    try:
+        with get_db1_pool().connection() as conn:
+            cursor = conn.execute(sql, params)
+            columns = [desc[0] for desc in cursor.description] if cursor.description else []
+            rows = [dict(row) for row in cursor.fetchall()]
         return {"success": True, "columns": columns, "rows": rows}
     except Exception as e:
         return {"success": False, "error": str(e), "sql": sql}
 
-def query_db2(sql):
-    """Query remote MySQL (DB2) via API"""
+@subquery_cached("db1", lambda sql, column, keys, params=(), order_by=None, strategy=None:
+                 (sql, [*params, column, list(keys), order_by], True))
+@instrument("query_db1", size=result_bytes)
+def semijoin_db1(sql, column, keys, params=(), order_by=None, strategy=None):
+    """
+    Run a DB1 query restricted to `column IN keys` (see semijoin.run_semijoin).
+    Pass strategy="temp_table" for SQL that aggregates across keys, which chunking would split.
+    """
     try:
-        response = requests.post(f"{PC2_URL}/api/query", json={"sql": sql}, timeout=10)
-        if response.status_code == 200:
-            return response.json()
-        else:
-            return {"success": False, "error": f"API Error {response.status_code}"}
-    except requests.exceptions.ConnectionError:
-        return {"success": False, "error": "Cannot connect to PC2. Is the server running?"}
+        with get_db1_pool().connection() as conn:
+            result = run_semijoin(conn, sql, column, keys, params=params, order_by=order_by, strategy=strategy)
+        print(f"  DB1 semijoin: {result['key_count']} keys via {result['strategy']}")
+        return result
     except Exception as e:
-        return {"success": False, "error": str(e)}
+        return {"success": False, "error": str(e), "sql": sql}
+
+@subquery_cached("db2", lambda sql, params=(): (sql, params, True))
+def query_db2(sql, params=()):
+    """
+    Query DB2; identical SQL + params already in flight shares that request's result,
+    and a finished one is reused from the subquery cache while PC2's version is unchanged.
+    """
+    key = hashlib.md5(json.dumps([sql, list(params)], default=str).encode()).hexdigest()
+    return db2_flight.do(key, lambda: post_db2_query(sql, params))
+
+def post_db2_query(sql, params=()):
+    """
+    Query remote MySQL (DB2) via API, preferring the compact columnar format.
+    `?` parameters are sent for PC2 to bind when it advertises support; older servers, which would
+    ignore a "params" field, get the values inlined as escaped literals (see sql_templates.inline_params).
+    """
+    with span("query_db2") as stage:
+        stage["error"] = True
+        try:
+            if params and not pc2_binds_params():
+                body = {"sql": inline_params(sql, params)}
+            else:
+                body = {"sql": sql, "params": list(params)}
+            response = get_pc2_session().post(
+                f"{PC2_URL}/api/query", json=body, timeout=10,
+                headers={"Accept": CLIENT_ACCEPT, "Accept-Encoding": client_accept_encoding()})
+            stage["bytes"] = len(response.content)
+            if response.status_code == 200:
+                # columnar/binary bodies decode straight into {"columns", "rows"}; legacy JSON passes through
+                result = decode_response(response.headers.get("Content-Type"), response.content)
+                stage["rows"] = len(result.get("rows") or [])
+                stage["error"] = result.get("success") is False
+                return result
+            else:
+                return {"success": False, "error": f"API Error {response.status_code}"}
+        except requests.exceptions.ConnectionError:
+            return {"success": False, "error": "Cannot connect to PC2. Is the server running?"}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+
+def query_db2_keys(sql, column, keys, params=()):
+    """Run a DB2 query with a {semijoin} slot once per batch of DB2_IDS_PER_REQUEST keys"""
+    columns, rows = [], []
+    for start in range(0, len(keys), DB2_IDS_PER_REQUEST):
+        batch = keys[start:start + DB2_IDS_PER_REQUEST]
+        predicate = f"{column} IN ({', '.join('?' for _ in batch)})"
+        result = query_db2(sql.format(semijoin=predicate), (*params, *batch))
+        if not result.get("success"):
+            return result
+        columns = result.get("columns") or columns
+        rows.extend(result.get("rows", []))
+    return {"success": True, "columns": columns, "rows": rows}
+
+def extract_db1_filters(q):
+    """DB1-side predicates mentioned in a (lowercased) federated question"""
+    filters = {}
+    student_match = re.search(r'\bs(\d{3})\b', q)
+    if student_match:
+        filters["student_id"] = "S" + student_match.group(1)
+    year_match = re.search(r'\b(?:year\s*(\d)|(\d)(?:st|nd|rd|th)[\s-]*year)\b', q)
+    if year_match:
+        filters["year"] = int(year_match.group(1) or year_match.group(2))
+    attendance_match = re.search(r'attendance\s*(?:is\s*)?(?:below|less than|under|<)\s*(\d+(?:\.\d+)?)', q)
+    if attendance_match:
+        filters["attendance_below"] = float(attendance_match.group(1)) / 100.0
+    return filters
+
+def db1_federated_sql(db1_filters, semijoin=False):
+    """Students x Enrollment restricted by the DB1 predicate (and a {semijoin} slot when pushing course ids)"""
+    clauses, params = [], []
+    if "student_id" in db1_filters:
+        clauses.append("s.student_id = ?")
+        params.append(db1_filters["student_id"])
+    if "year" in db1_filters:
+        clauses.append("s.year = ?")
+        params.append(db1_filters["year"])
+    if "attendance_below" in db1_filters:
+        clauses.append("""s.student_id IN (
+    SELECT student_id FROM AttendanceRollup
+    GROUP BY student_id
+    HAVING CAST(SUM(present_count) AS FLOAT) / SUM(total_classes) < ?)""")
+        params.append(db1_filters["attendance_below"])
+    if semijoin:
+        clauses.append("{semijoin}")
+    # with pushed course ids, CROSS JOIN keeps Enrollment outermost so the id list probes idx_enrollment_course
+    joins = ("FROM Enrollment e\nCROSS JOIN Students s ON s.student_id = e.student_id" if semijoin
+             else "FROM Students s\nJOIN Enrollment e ON s.student_id = e.student_id")
+    sql = f"""
+SELECT s.student_id, s.name, s.email, s.program, e.course_id
+{joins}
+WHERE {" AND ".join(clauses) or "1=1"}
+ORDER BY s.student_id;
+"""
+    return sql, params
+
+def db2_courses_sql(faculty_name, department, course_ids=None,
+                    columns="c.course_id, c.course_name, f.name as faculty_name"):
+    """
+    Courses joined to their faculty, filtered by faculty name/department and optionally by course id.
+    Returns (sql, params); the text only varies with the projection, which filters are present and the id count.
+    """
+    clauses, params = [], []
+    if faculty_name:
+        clauses.append("f.name LIKE ? ESCAPE '!'")
+        params.append(like_param(faculty_name))
+    if department:
+        clauses.append("f.department LIKE ? ESCAPE '!'")
+        params.append(like_param(department))
+    if course_ids is not None:
+        clauses.append(f"c.course_id IN ({', '.join('?' for _ in course_ids)})")
+        params.extend(course_ids)
+    db2_sql = f"""
+SELECT {columns}
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id
+WHERE {" AND ".join(clauses) or "1=1"};
+"""
+    return db2_sql, params
+
+def get_db1_stats():
+    def load():
+        with get_db1_pool().connection() as conn:
+            return collect_db1_stats(conn)
+    return cached_stats("db1", load) or dict(DEFAULT_DB1_STATS)
+
+def get_db2_stats():
+    def load():
+        try:
+            response = get_pc2_session().get(f"{PC2_URL}/api/stats", timeout=2)
+            payload = response.json() if response.status_code == 200 else None
+        except Exception:
+            payload = None
+        return parse_db2_stats(payload)
+    return cached_stats("db2", load) or dict(DEFAULT_DB2_STATS)
+
+def run_db2_first(faculty_name, department, db1_filters):
+    """PC2 first, then push the matching course ids into DB1"""
+    db2_sql, db2_params = db2_courses_sql(faculty_name, department)
+    print("  DB2 SQL:", db2_sql, db2_params)
+    db2_result = query_db2(db2_sql, db2_params)
+    if not db2_result.get("success"):
+        return db2_result, None, 0
+    db2_rows = db2_result.get("rows", [])
+    course_ids = [str(row["course_id"]) for row in db2_rows if "course_id" in row]
+    if not course_ids:
+        return None, db2_rows, len(json.dumps(db2_rows))
+    db1_sql, params = db1_federated_sql(db1_filters, semijoin=True)
+    db1_result = semijoin_db1(db1_sql, "e.course_id", course_ids, params=params, order_by=("student_id",))
+    return db1_result, db2_rows, len(json.dumps(db2_rows))
+
+def run_db1_first(faculty_name, department, db1_filters):
+    """DB1 predicate first, then send the distinct course ids to PC2 in batches"""
+    db1_sql, params = db1_federated_sql(db1_filters)
+    print("  DB1 SQL:", db1_sql)
+    db1_result = query_db1_params(db1_sql, params)
+    if not db1_result.get("success"):
+        return db1_result, None, 0
+    course_ids = list(dict.fromkeys(str(row["course_id"]) for row in db1_result.get("rows", [])))
+    db2_rows, sent = [], 0
+    for start in range(0, len(course_ids), DB2_IDS_PER_REQUEST):
+        batch = course_ids[start:start + DB2_IDS_PER_REQUEST]
+        db2_sql, db2_params = db2_courses_sql(faculty_name, department, batch)
+        sent += len(db2_sql) + len(json.dumps(db2_params))
+        db2_result = query_db2(db2_sql, db2_params)
+        if not db2_result.get("success"):
+            return db2_result, None, sent
+        db2_rows.extend(db2_result.get("rows", []))
+    print(f"  DB2: {len(course_ids)} course ids pushed in {-(-len(course_ids) // DB2_IDS_PER_REQUEST)} request(s)")
+    return db1_result, db2_rows, sent + len(json.dumps(db2_rows))
+
+REPLICA_DB1_TABLES = ("Enrollment", "Students")  # DB1 tables the joined_cache replica is built from
+
+REPLICA_DB1_SQL = """
+SELECT s.student_id, s.name, s.email, s.program, e.course_id
+FROM Students s
+JOIN Enrollment e ON s.student_id = e.student_id;
+"""
+
+REPLICA_DB2_SQL = """
+SELECT c.course_id, c.course_name, f.name as faculty_name, f.department
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id;
+"""
+
+def replica_db1_version():
+    """DB1 change marker for the replica; Attendance updates do not affect it"""
+    version = get_db1_version()
+    if version is None:
+        return None
+    parts = [part for part in version.split("|") if part.split(":")[0] in REPLICA_DB1_TABLES]
+    return "|".join(parts) or None
+
+def fetch_replica_enrollments():
+    result = query_db1_params(REPLICA_DB1_SQL, ())
+    return result.get("rows", []) if result.get("success") else None
+
+def fetch_replica_courses():
+    result = query_db2(REPLICA_DB2_SQL)
+    return result.get("rows", []) if result.get("success") else None
+
+def refresh_replica(force=False, background=False):
+    """Bring joined_cache up to the current DB1/PC2 change markers"""
+    args = (replica_db1_version(), get_db2_version(), fetch_replica_enrollments, fetch_replica_courses)
+    if background:
+        return refresh_in_background(*args, force=force)
+    return refresh(*args, force=force)
+
+def extract_faculty(q):
+    """(faculty_name, department) named in a lowercased question, or None when there is no faculty filter"""
+    faculty_match = re.search(FACULTY_PATTERN, q)
+    if not faculty_match:
+        return None
+    faculty_name = faculty_match.group(1).strip()
+    # drop trailing clauses that belong to the DB1 side ("sharma in year 2" -> "sharma")
+    faculty_name = re.split(r'\s+(?:in|with|who|whose|where|and|for|of)\b', faculty_name)[0].strip()
+    department = faculty_match.group(2).strip() if faculty_match.group(2) else None
+    return faculty_name, department
 
 def process_federated_query(nl_query):
     """Handle queries spanning both databases"""
     print("\n Processing federated query...")
     q = nl_query.lower()
 
+    aggregate, rest = extract_aggregate(q)
+    if aggregate:
+        return process_aggregate_query(rest, aggregate)
+
     # Extract faculty name and/or department
-    faculty_match = re.search(r'(?:taught by|by|faculty|professor)\s+([a-zA-Z\s]+)(?:\s+from\s+([a-zA-Z\s]+))?', q)
-    if faculty_match:
-        faculty_name = faculty_match.group(1).strip()
-        department = faculty_match.group(2).strip() if faculty_match.group(2) else None
-        db2_sql = f"""
-SELECT c.course_id, c.course_name, f.name as faculty_name
-FROM Courses c
-JOIN Faculty f ON c.faculty_id = f.faculty_id
-WHERE 1=1
-"""
-        if faculty_name:
-            db2_sql += f" AND f.name LIKE '%{faculty_name}%'"
-        if department:
-            db2_sql += f" AND f.department LIKE '%{department}%'"
-        db2_sql += ";"
+    faculty = extract_faculty(q)
+    if not faculty:
+        return process_generic_federated(nl_query)
+    faculty_name, department = faculty
+    db1_filters = extract_db1_filters(q)
+
+    # The replica only holds student/course/faculty columns, so DB1 predicates go to live federation
+    if not db1_filters:
+        if is_fresh(replica_db1_version(), get_db2_version()):
+            rows = query_replica(faculty_name, department)
+            print(f"  Answered from joined_cache replica ({len(rows)} rows)")
+            return {
+                "success": True,
+                "columns": list(rows[0].keys()) if rows else [],
+                "rows": rows,
+                "federated": True,
+                "materialized": True
+            }
+        replica_stats["stale"] += 1
+        refresh_replica(background=True)
+
+    estimates = estimate_plans(get_db1_stats(), get_db2_stats(), db1_filters,
+                               {"faculty_name": faculty_name, "department": department})
+    plan = choose_plan(estimates)
+    annotate(plan=plan)
+    print(f"  Plan: {plan} (est. cost {estimates[plan]['cost']:.1f} vs "
+          + ", ".join(f"{name} {e['cost']:.1f}" for name, e in estimates.items() if name != plan) + ")")
+
+    start = time.perf_counter()
+    if plan == "db1_first":
+        db1_result, db2_rows, transferred = run_db1_first(faculty_name, department, db1_filters)
+    else:
+        db1_result, db2_rows, transferred = run_db2_first(faculty_name, department, db1_filters)
+    if db2_rows is None:
+        return db1_result
+    if db1_result is None:
+        return {"success": True, "message": "No matching courses found in DB2", "rows": []}
+    if not db1_result.get("success"):
+        return db1_result
+
+    # Combine DB1 and DB2 results (hash join on course_id)
+    with span("federated_join") as stage:
+        final_rows = hash_join(db1_result.get("rows", []), db2_rows, "course_id")
+        stage["rows"] = len(final_rows)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    try:
+        record_plan(nl_query, plan, estimates, len(db1_result.get("rows", [])), len(db2_rows),
+                    transferred, elapsed_ms)
+    except Exception as e:
+        print(f"  Plan stats warning: {e}")
+
+    return {
+        "success": True,
+        "columns": list(final_rows[0].keys()) if final_rows else [],
+        "rows": final_rows,
+        "federated": True
+    }
+
+def process_aggregate_query(q, aggregate):
+    """
+    Answer a grouped count/attendance question from pushed-down partial aggregates (see pushdown.py):
+    pruned course rows from DB2, one partial row per course from DB1, merged here per group.
+    """
+    faculty_name, department = extract_faculty(q) or (None, None)
+    db1_filters = extract_db1_filters(q)
+    annotate(plan="aggregate_pushdown")
+    print(f"  Plan: aggregate pushdown ({aggregate['measure']} per {aggregate['group_by']})")
+
+    db2_sql, db2_params = db2_courses_sql(faculty_name, department, columns=DB2_PROJECTIONS[aggregate["group_by"]])
+    print("  DB2 SQL:", db2_sql, db2_params)
+    db2_result = query_db2(db2_sql, db2_params)
+    if not db2_result.get("success"):
+        return db2_result
+    courses = db2_result.get("rows", [])
+    course_ids = [str(row["course_id"]) for row in courses if "course_id" in row]
+    if not course_ids:
+        return {"success": True, "message": "No matching courses found in DB2", "rows": []}
+
+    if aggregate["measure"] == "students":
+        # distinct students are counted per group on DB1; per-course counts cannot be summed
+        sql, params = students_sql(db1_filters, courses, aggregate["group_by"])
+        partials = query_db1_params(sql, params)
+    elif faculty_name or department:
+        sql, params = partial_sql(aggregate["measure"], db1_filters)
+        partials = semijoin_db1(sql, PARTIAL_KEY_COLUMN, course_ids, params=params, order_by=("course_id",))
     else:
-        db2_sql = generate_sql(nl_query, "db2")
+        sql, params = partial_sql(aggregate["measure"], db1_filters)
+        partials = query_db1_params(sql.format(semijoin="1=1"), params)
+    if not partials.get("success"):
+        return partials
+
+    with span("federated_join") as stage:
+        rows = combine_partials(partials.get("rows", []), courses, aggregate)
+        if aggregate["measure"] == "attendance" and "attendance_below" in db1_filters:
+            threshold = db1_filters["attendance_below"] * 100
+            rows = [row for row in rows if row["attendance_percentage"] is not None
+                    and row["attendance_percentage"] < threshold]
+        stage["rows"] = len(rows)
+    transferred = len(json.dumps(partials.get("rows", []), default=str)) + len(json.dumps(courses, default=str))
+    print(f"  Pushdown: {len(partials.get('rows', []))} partial rows from DB1 + {len(courses)} course rows "
+          f"from DB2 ({transferred} bytes) -> {len(rows)} groups")
+    return {
+        "success": True,
+        "columns": list(rows[0].keys()) if rows else [],
+        "rows": rows,
+        "federated": True,
+        "pushdown": {"db1_rows": len(partials.get("rows", [])), "db2_rows": len(courses), "bytes": transferred}
+    }
 
-    print("  DB2 SQL:", db2_sql)
-    db2_result = query_db2(db2_sql)
+def process_generic_federated(nl_query):
+    """No faculty filter recognized: let generate_sql build the DB2 side, then semijoin into DB1"""
+    db2_sql, db2_params = generate_sql(nl_query, "db2")
+    print("  DB2 SQL:", db2_sql, db2_params)
+    annotate(plan="generic_db2_first", sql=db2_sql, params=db2_params)
+    db2_result = query_db2(db2_sql, db2_params)
     if not db2_result.get("success"):
         return db2_result
 
@@ -386,27 +958,15 @@ WHERE 1=1
     if not course_ids:
         return {"success": True, "message": "No matching courses found in DB2", "rows": []}
 
-    # DB1: students in courses
-    course_list = "'" + "','".join(course_ids) + "'"
-    db1_sql = f"""
-SELECT s.student_id, s.name, s.email, s.program, e.course_id
-FROM Students s
-JOIN Enrollment e ON s.student_id = e.student_id
-WHERE e.course_id IN ({course_list})
-ORDER BY s.student_id;
-"""
-    db1_result = query_db1(db1_sql)
+    # DB1: students in courses (key transport picked from the size of the id set)
+    db1_sql, params = db1_federated_sql(extract_db1_filters(nl_query.lower()), semijoin=True)
+    db1_result = semijoin_db1(db1_sql, "e.course_id", course_ids, params=params, order_by=("student_id",))
     if not db1_result.get("success"):
         return db1_result
 
-    # Combine DB1 and DB2 results
-    final_rows = []
-    for student in db1_result.get("rows", []):
-        for course in db2_result.get("rows", []):
-            if str(student.get("course_id")) == str(course.get("course_id")):
-                combined = {**student, **course}
-                final_rows.append(combined)
-
+    with span("federated_join") as stage:
+        final_rows = hash_join(db1_result.get("rows", []), db2_result.get("rows", []), "course_id")
+        stage["rows"] = len(final_rows)
     return {
         "success": True,
         "columns": list(final_rows[0].keys()) if final_rows else [],
@@ -415,17 +975,128 @@ ORDER BY s.student_id;
     }
 
 
-def execute_query(nl_query):
-    """Main entry point for query execution"""
+def run_plan_node(node, inputs):
+    """Execute one decomposer node against DB1, PC2 or the LLM"""
+    source = node["source"]
+    if source == "llm":
+        data = "\n".join(f"{name}: unavailable ({result.get('error')})" if result.get("success") is False
+                         else f"{name} ({len(result.get('rows', []))} rows): "
+                              f"{json.dumps(result.get('rows', [])[:10], default=str)}"
+                         for name, result in inputs.items())
+        prompt = f"""You are a helpful assistant for a Smart Campus Query System.
+Answer the question using the data retrieved for it. If some data is unavailable, say so and answer from the rest.
+
+Question: {node["question"]}
+
+Data:
+{data}
+
+Keep your response focused and practical for an academic environment."""
+        return {"success": True, "type": "llm", "answer": call_llm(prompt, max_tokens=300)}
+
+    sql, params = node["sql"], node.get("params", ())
+    if node["deps"]:
+        keys = key_values(next(iter(inputs.values())), node.get("key", "course_id"))
+        if not keys:
+            return {"success": True, "columns": [], "rows": [], "message": "No matching courses"}
+        if source == "db1":
+            return semijoin_db1(sql, node["key_column"], keys, params=params,
+                                order_by=node.get("order_by", ("student_id",)), strategy=node.get("strategy"))
+        return query_db2_keys(sql, node["key_column"], keys, params)
+    if "{semijoin}" in sql:
+        sql = sql.format(semijoin="1=1")
+    if source == "db1":
+        return query_db1_params(sql, params)
+    return query_db2(sql, params)
+
+def process_decomposed_query(nl_query, plan):
+    """Run a multi-part question as a DAG of sub-queries (see decomposer.py)"""
+    print(f"\n Decomposed into {len(plan)} sub-queries: "
+          + ", ".join(f"{node['name']}[{node['source']}]" + (f"<-{'+'.join(node['deps'])}" if node["deps"] else "")
+                      for node in plan))
+    start = time.perf_counter()
+    results, timings = run_dag(plan, bind_trace(run_plan_node))  # node spans join this trace
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    critical = critical_path_ms(plan, timings)
+    print(f"  Wall {elapsed_ms:.0f} ms, critical path {critical:.0f} ms, serial sum {sum(timings.values()):.0f} ms")
+
+    # condition nodes only feed keys to the others; show what was asked for
+    parts = [{"name": node["name"], "source": node["source"], **results[node["name"]]}
+             for node in plan if node.get("part") or node["source"] == "llm"]
+    if parts and all(part.get("success") is False for part in parts):
+        return {"success": False, "error": parts[0].get("error"), "parts": parts}
+    return {
+        "success": True,
+        "decomposed": True,
+        "partial": any(part.get("success") is False for part in parts),
+        "parts": parts,
+        "timings": timings,
+        "elapsed_ms": round(elapsed_ms, 2),
+        "critical_path_ms": critical
+    }
+
+def execute_query(nl_query, stream=False):
+    """
+    Main entry point for query execution.
+    With stream=True a large DB1 result comes back lazily (see query_db1) and is not cached.
+    Concurrent callers asking the same (normalized) question share one execution; a lazily
+    streamed result cannot be shared, so waiters on one run the query themselves.
+    """
+    key = hashlib.md5(f"{stream}|{normalize_question(nl_query)}".encode()).hexdigest()
+    return query_flight.do(key, lambda: run_query(nl_query, stream),
+                           shareable=lambda out: not out[0].get("streaming"))
+
+def run_query(nl_query, stream=False):
+    """Run one question with stage tracing; uncached runs slower than SLOW_QUERY_MS are logged"""
+    start_trace()
+    start = time.perf_counter()
+    try:
+        result, from_cache = answer_query(nl_query, stream)
+    finally:
+        spans, notes = end_trace()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms >= SLOW_QUERY_MS and not from_cache:
+        record_slow_query(nl_query, elapsed_ms, spans, notes)
+    return result, from_cache
+
+def record_slow_query(nl_query, elapsed_ms, spans, notes):
+    """Write a slow question to slow_queries with its SQL and (for DB1) its query plan"""
+    plan = notes.get("plan")
+    if notes.get("target_db") == "db1" and notes.get("sql"):
+        plan = explain_db1(notes["sql"], notes.get("params", ()))
+    try:
+        log_slow_query(nl_query, notes.get("qtype"), elapsed_ms, spans, notes.get("sql"), notes.get("params"), plan)
+        print(f"  Slow query logged ({elapsed_ms:.0f} ms)")
+    except Exception as e:
+        print(f"  Slow query log warning: {e}")
+
+def explain_db1(sql, params=()):
+    try:
+        with get_db1_pool().connection() as conn:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + sql.strip().rstrip(";"), params).fetchall()
+        return "\n".join(str(row[3]) for row in rows)
+    except Exception as e:
+        return f"EXPLAIN failed: {e}"
+
+def answer_query(nl_query, stream=False):
+    """Cache lookup, routing and execution for one question"""
     query_hash = hashlib.md5(nl_query.encode()).hexdigest()
     cached = get_from_cache(query_hash)
     if cached:
         print("⚡ Retrieved from cache")
         return cached, True
 
-    qtype, sources = analyze_query(nl_query)
+    plan = decompose(nl_query)
+    if plan:
+        qtype, sources = "decomposed", sources_of(plan)
+    else:
+        qtype, sources = analyze_query(nl_query)
+    annotate(qtype=qtype)
     print(f"\n Query Type: {qtype.upper()}")
     print(f" Data Sources: {sources if sources else ['LLM']}")
+    # Read versions before executing so a concurrent change invalidates this entry;
+    # LLM answers have no source to version and keep the short CACHE_TTL
+    versions = get_source_versions(sources) if sources else None
 
     result = None
     if qtype == "llm":
@@ -439,33 +1110,61 @@ Keep your response focused and practical for an academic environment."""
         answer = call_llm(context_prompt, max_tokens=300)
         result = {"type": "llm", "answer": answer}
 
+    elif qtype == "decomposed":
+        result = process_decomposed_query(nl_query, plan)
+        annotate(plan=json.dumps({"nodes": [node["name"] for node in plan], "timings": result.get("timings")}))
+
     elif qtype == "federated":
         result = process_federated_query(nl_query)
 
     else:
         target_db = sources[0]
         print(f"\n Generating SQL for {target_db.upper()}...")
-        sql = generate_sql(nl_query, target_db)
+        sql, params = generate_sql(nl_query, target_db)
+        annotate(target_db=target_db, sql=sql, params=params)
         print(f"   SQL: {sql}")
+        if params:
+            print(f"   Params: {params}")
 
         print(f"\n Executing on {target_db.upper()}...")
         if target_db == "db1":
-            result = query_db1(sql)
+            result = query_db1(sql, stream=stream, params=params)
+            if result.get("streaming"):
+                rows = result["rows"]
+                rows.peek(DISPLAY_PAGE_SIZE + 1)
+                if not rows.exhausted or rows.truncated:
+                    return result, False
+                result = {"success": True, "columns": rows.columns, "rows": rows.fetch_all()}
         else:
-            result = query_db2(sql)
+            result = query_db2(sql, params)
 
-    save_to_cache(query_hash, nl_query, qtype, result)
+    # an answer missing some of its parts (a source was down) is not worth keeping
+    if result.get("success") is not False and not result.get("partial"):
+        save_to_cache(query_hash, nl_query, qtype, result, versions)
     return result, False
 
 def clear_cache_for_api_switch():
-    """Clear cache when switching APIs"""
+    """Clear cache only when the PC2 endpoint or LLM model changed; otherwise just drop expired rows"""
+    fingerprint = f"{PC2_URL}|{LLM_MODEL}|{HAS_GENAI}"
     try:
-        conn = sqlite3.connect(CACHE_DB)
-        cursor = conn.cursor()
-        cursor.execute("DELETE FROM query_cache")
-        conn.commit()
-        conn.close()
-        print(" Cache cleared for API switch")
+        init_cache()
+        with cache_connection() as conn:
+            row = conn.execute("SELECT value FROM cache_meta WHERE key = 'api_fingerprint'").fetchone()
+            if row and row[0] == fingerprint:
+                switched = False
+            else:
+                switched = True
+                conn.execute("DELETE FROM query_cache")
+                # a different PC2 may reuse version numbers; force the replica to re-read it
+                conn.execute("DELETE FROM cache_meta WHERE key IN (?, ?)", (META_DB1, META_DB2))
+                conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES ('api_fingerprint', ?)", (fingerprint,))
+                conn.commit()
+        if switched:
+            result_cache.clear()
+            subquery_cache.clear()
+            print(" Cache cleared for API switch")
+        else:
+            print(f" Cache kept warm ({sweep_expired()} expired entries removed)")
     except Exception as e:
         print(f" Cache clear warning: {e}")
 
@@ -479,30 +1178,83 @@ def display_results(result, from_cache=False):
     if result.get("type") == "llm":
         print(result.get("answer"))
 
+    elif result.get("success") and isinstance(result.get("rows"), StreamingResult):
+        display_page(result["rows"], show_header=True)
+
+    elif result.get("success") and result.get("parts"):
+        for part in result["parts"]:
+            print(f"\n[{part['name'].upper()}] ({part['source'].upper()})")
+            if part.get("type") == "llm":
+                print(part.get("answer"))
+            elif part.get("success") is False:
+                print(f" Error: {part.get('error')}")
+            else:
+                display_table(part)
+
     elif result.get("success"):
-        rows = result.get("rows", [])
-        columns = result.get("columns", [])
-        if rows:
-            if columns:
-                header = "  |  ".join(str(col)[:20] for col in columns)
-                print(header)
-                print("-"*len(header))
-            for row in rows[:20]:
-                if isinstance(row, dict):
-                    print("  |  ".join(str(row.get(col, ""))[:20] for col in columns))
-                else:
-                    print("  |  ".join(str(val)[:20] for val in row))
-            if len(rows) > 20:
-                print(f"\n... and {len(rows) - 20} more rows")
-            print(f"\nTotal: {len(rows)} rows")
-        else:
-            print(result.get("message", "No results found"))
+        display_table(result)
     else:
         print(f" Error: {result.get('error')}")
         if result.get('sql'):
             print(f"   SQL: {result.get('sql')}")
     print("="*80 + "\n")
 
+def display_table(result):
+    """Print the first page of a materialized row result"""
+    rows = result.get("rows", [])
+    columns = result.get("columns", [])
+    if rows:
+        if columns:
+            header = "  |  ".join(str(col)[:20] for col in columns)
+            print(header)
+            print("-"*len(header))
+        for row in rows[:DISPLAY_PAGE_SIZE]:
+            if isinstance(row, dict):
+                print("  |  ".join(str(row.get(col, ""))[:20] for col in columns))
+            else:
+                print("  |  ".join(str(val)[:20] for val in row))
+        if len(rows) > DISPLAY_PAGE_SIZE:
+            print(f"\n... and {len(rows) - DISPLAY_PAGE_SIZE} more rows")
+        print(f"\nTotal: {len(rows)} rows")
+        if result.get("truncated"):
+            print(" (result truncated at the row/byte cap)")
+    else:
+        print(result.get("message", "No results found"))
+
+def display_page(stream, show_header=False):
+    """Print the next page of a streaming result"""
+    columns = stream.columns
+    if show_header and columns:
+        header = "  |  ".join(str(col)[:20] for col in columns)
+        print(header)
+        print("-"*len(header))
+    for row in stream.fetch(DISPLAY_PAGE_SIZE):
+        print("  |  ".join(str(row.get(col, ""))[:20] for col in columns))
+    if stream.has_more():
+        print(f"\n... more rows available (shown {stream.rows_returned}); type 'more' to fetch the next page")
+    else:
+        print(f"\nTotal: {stream.rows_returned} rows")
+        if stream.truncated:
+            print(" (result truncated at the row/byte cap)")
+
+def display_stats():
+    """Print connection pool occupancy, cache counters and per-stage timings"""
+    stats = pool_stats()
+    for tier, values in cache_stats().items():
+        stats[f"cache:{tier}"] = values
+    stats["replica"] = replica_stats
+    stats["fuzzy"] = matcher_stats
+    for flight in (query_flight, db2_flight, llm_flight):
+        stats[f"flight:{flight.name}"] = flight.stats()
+    for stage, values in stage_summary().items():
+        stats[f"stage:{stage}"] = values
+    print("\n" + "="*80)
+    print(" CONNECTION POOLS / CACHE")
+    print("="*80)
+    for name, values in stats.items():
+        print(f" {name.upper():<14} " + ", ".join(f"{k}={v}" for k, v in values.items()))
+    print("="*80 + "\n")
+
 def main():
     print("="*80)
     print("FEDERATED SMART CAMPUS QUERY SYSTEM")
@@ -512,21 +1264,25 @@ def main():
     print(f" DB2 (MySQL - {PC2_URL}): Faculty, Courses, Exams, Resources")
     print(" LLM (Gemini API): Natural language explanations (if configured)")
     print("="*80)
-    print("\nType 'exit' to quit\n")
+    print("\nType 'more' for the next page of a large result, 'stats' for connection pool and cache usage,")
+    print("'refresh' to rebuild the joined_cache replica, 'exit' to quit\n")
 
     init_cache()
+    start_sweeper()
 
     # Check PC2 health (non-fatal)
     print(" Testing connection to PC2...")
     try:
-        resp = requests.get(f"{PC2_URL}/health", timeout=5)
+        resp = get_pc2_session().get(f"{PC2_URL}/health", timeout=5)
         if resp.status_code == 200:
             print(" PC2 connected successfully\n")
         else:
             print(" PC2 responded but with error\n")
     except Exception:
         print(" Cannot connect to PC2. Make sure the PC2 server is running at", PC2_URL)
+    refresh_replica(background=True)
 
+    stream = None
     while True:
         try:
             query = input(" Enter query: ").strip()
@@ -534,12 +1290,34 @@ def main():
                 continue
             if query.lower() in ['exit', 'quit', 'q']:
                 break
-            result, from_cache = execute_query(query)
+            if query.lower() == 'stats':
+                display_stats()
+                continue
+            if query.lower() == 'refresh':
+                summary = refresh_replica(force=True)
+                print(f" Replica refresh: {summary}" if summary else " Replica refresh skipped (source version unavailable)")
+                continue
+            if query.lower() == 'more':
+                if stream is not None and stream.has_more():
+                    display_page(stream)
+                else:
+                    print(" No more rows.")
+                continue
+            if stream is not None:
+                stream.close()
+                stream = None
+            result, from_cache = execute_query(query, stream=True)
+            if isinstance(result.get("rows"), StreamingResult):
+                stream = result["rows"]
             display_results(result, from_cache)
         except KeyboardInterrupt:
             break
         except Exception as e:
             print(f"\n Error: {e}\n")
+    if stream is not None:
+        stream.close()
+    stop_sweeper()
+    close_all()
 
 if __name__ == "__main__":
     clear_cache_for_api_switch()
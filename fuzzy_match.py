@@ -0,0 +1,338 @@
+"""
+Fuzzy intent matcher: routes paraphrased questions to SQL templates without the LLM.
+
+Every intent has a few canonical questions with slot markers ("attendance of student {student_id}").
+Incoming text has its slot values (ids, percentages, years, names) extracted and replaced by the
+same markers, is reduced to word unigram + bigram shingles, and is scored against the canonical
+questions by Jaccard similarity through an inverted index (shingle -> canonical questions), so
+only questions sharing at least one shingle are ever compared.
+
+Below MATCH_THRESHOLD, or when the best intent's slots are missing, the caller falls back to the LLM.
+A match is also refused when it would answer a different question than the one asked: the text
+carries a negation, a slot value the intent's SQL does not bind ("students in year 2 with attendance
+below 50%" is not attendance_below), or a keyword that only other intents use ("attendance of
+students in year 3" is not students_by_year). template_match() applies the same checks to the
+regex templates.
+"""
+import re
+import time
+
+from sql_templates import (ALL_COURSES_SQL, ALL_FACULTY_SQL, ALL_STUDENTS_SQL, ATTENDANCE_ABOVE_SQL,
+                           ATTENDANCE_BELOW_SQL, COUNT_STUDENTS_SQL, COURSES_BY_FACULTY_DEPARTMENT_SQL,
+                           COURSES_BY_FACULTY_SQL, EXAMS_FOR_COURSE_SQL, FACULTY_BY_DEPARTMENT_SQL,
+                           FACULTY_PATTERN, RESOURCES_FOR_COURSE_SQL, STUDENT_ATTENDANCE_SQL,
+                           STUDENT_COURSES_SQL, STUDENT_DETAILS_SQL, STUDENTS_BY_YEAR_SQL, TEMPLATE_SLOTS,
+                           like_param, match_template)
+
+MATCH_THRESHOLD = 0.5
+
+STOPWORDS = {"a", "an", "the", "please", "me", "us", "is", "are", "was", "do", "does", "can", "you", "i",
+             "what", "which", "who", "whose", "of", "for", "to", "there", "their", "his", "her", "my",
+             "show", "list", "get", "display", "give", "find", "tell", "see", "want", "than", "have", "we", "in"}
+
+# Words folded onto one token so paraphrases share shingles
+SYNONYMS = {
+    "attendance": "attend", "attending": "attend", "attends": "attend", "attended": "attend",
+    "below": "under", "less": "under", "lower": "under", "fewer": "under",
+    "above": "over", "more": "over", "greater": "over", "higher": "over",
+    "classes": "course", "class": "course", "subjects": "course", "subject": "course",
+    "taught": "teach", "teaches": "teach", "teaching": "teach", "handled": "teach", "handles": "teach",
+    "enrolled": "enroll", "enrollment": "enroll", "enrollments": "enroll", "registered": "enroll",
+    "taking": "enroll", "taken": "enroll", "takes": "enroll",
+    "professor": "faculty", "professors": "faculty", "teacher": "faculty", "teachers": "faculty",
+    "lecturer": "faculty", "lecturers": "faculty", "staff": "faculty", "instructors": "faculty",
+    "details": "detail", "info": "detail", "information": "detail", "profile": "detail", "record": "detail",
+    "records": "detail", "exams": "exam", "examination": "exam", "test": "exam", "tests": "exam",
+    "material": "resource", "materials": "resource", "remedial": "resource", "help": "resource",
+    "every": "all", "total": "count", "number": "count", "many": "count",
+    "pupils": "student", "learners": "student",
+}
+
+# Slot extractors, applied in this order; each match is masked before the next runs
+# so that e.g. the "2" in "year 2" is not also read as a percentage.
+NAME_STOP = r'(?:in|with|who|whose|where|and|for|of|from|teach|teaches|this|that)'
+SLOT_PATTERNS = (
+    ("student_id", re.compile(r'\bs(\d{3,})\b')),
+    ("course_id", re.compile(r'\b([a-z]{2,4}\d{2,4})\b')),
+    ("year", re.compile(r'\b(?:year\s*(\d)|(\d)(?:st|nd|rd|th)[\s-]*years?)\b')),
+    ("department", re.compile(r'\b(?:from|in)\s+(?:the\s+)?([a-z]+(?:\s+[a-z]+)?)\s+(?:department|dept)\b')),
+    ("faculty", re.compile(r'\bdoes\s+(?:dr\.?\s+|prof\.?\s+|professor\s+)?([a-z]+(?:\s+(?!teach)[a-z]+)?)\s+teach')),
+    ("faculty", re.compile(r'\b(?:dr|prof)\.?\s+([a-z]+(?:\s+(?!' + NAME_STOP + r'\b)[a-z]+)?)')),
+    ("faculty", re.compile(FACULTY_PATTERN)),
+    ("department", re.compile(r'\bfrom\s+(?:the\s+)?([a-z]+(?:\s+[a-z]+)?)\s*$')),
+    ("percent", re.compile(r'(?<![\w.])(\d+(?:\.\d+)?)\s*(?:%|percent\b|per cent\b)?')),
+)
+
+# "not above 80%" must not be answered as "above 80%"
+NEGATION_PATTERN = re.compile(r"\b(?:not|no|never|except|without)\b|n't\b")
+
+# Slots whose whole match is the value ("year 2", "75%"); the rest keep their lead-in words masked in place
+WHOLE_MATCH_SLOTS = {"student_id", "course_id", "year", "percent"}
+
+SLOT_VALUES = {
+    "student_id": lambda text: "S" + text,
+    "course_id": lambda text: text.upper(),
+    "year": int,
+    "department": like_param,
+    "faculty": like_param,
+    "percent": lambda text: float(text) / 100.0,
+}
+
+# name -> (target_db, [(slots, sql)] most specific first, canonical questions)
+INTENTS = {
+    "attendance_above": ("db1", [(("percent",), ATTENDANCE_ABOVE_SQL)], [
+        "students with attendance above {percent}",
+        "students whose attendance is more than {percent}",
+        "students with attendance greater than {percent}",
+        "students attending more than {percent} of classes",
+        "students with attendance over {percent}",
+    ]),
+    "attendance_below": ("db1", [(("percent",), ATTENDANCE_BELOW_SQL)], [
+        "students with attendance below {percent}",
+        "students whose attendance is less than {percent}",
+        "students with attendance under {percent}",
+        "students attending fewer than {percent} of classes",
+        "students at risk with attendance lower than {percent}",
+    ]),
+    "student_attendance": ("db1", [(("student_id",), STUDENT_ATTENDANCE_SQL)], [
+        "attendance of student {student_id}",
+        "attendance record for {student_id}",
+        "how is {student_id} attendance",
+        "attendance percentage per course for student {student_id}",
+        "{student_id} attendance",
+    ]),
+    "student_courses": ("db1", [(("student_id",), STUDENT_COURSES_SQL)], [
+        "courses student {student_id} is enrolled in",
+        "enrollments of student {student_id}",
+        "courses taken by {student_id}",
+        "{student_id} enrolled courses",
+    ]),
+    "student_details": ("db1", [(("student_id",), STUDENT_DETAILS_SQL)], [
+        "details of student {student_id}",
+        "student {student_id} information",
+        "profile of {student_id}",
+        "email and program of student {student_id}",
+    ]),
+    "students_by_year": ("db1", [(("year",), STUDENTS_BY_YEAR_SQL)], [
+        "students in {year}",
+        "students of {year}",
+        "all {year} students",
+    ]),
+    "count_students": ("db1", [((), COUNT_STUDENTS_SQL)], [
+        "how many students are there",
+        "number of students",
+        "count students",
+        "total student count",
+    ]),
+    "all_students": ("db1", [((), ALL_STUDENTS_SQL)], [
+        "all students",
+        "every student",
+        "student list",
+        "students in the database",
+    ]),
+    "courses_by_faculty": ("db2", [(("faculty", "department"), COURSES_BY_FACULTY_DEPARTMENT_SQL),
+                                   (("faculty",), COURSES_BY_FACULTY_SQL)], [
+        "courses taught by {faculty}",
+        "courses does {faculty} teach",
+        "classes by professor {faculty}",
+        "courses handled by {faculty}",
+        "courses taught by {faculty} from {department}",
+    ]),
+    "faculty_by_department": ("db2", [(("department",), FACULTY_BY_DEPARTMENT_SQL)], [
+        "faculty in {department} department",
+        "faculty members from {department} department",
+        "professors of {department} department",
+        "teachers in {department} department",
+    ]),
+    "exams_for_course": ("db2", [(("course_id",), EXAMS_FOR_COURSE_SQL)], [
+        "exams for course {course_id}",
+        "exam schedule of {course_id}",
+        "when is {course_id} exam",
+        "exam date and eligibility for {course_id}",
+    ]),
+    "resources_for_course": ("db2", [(("course_id",), RESOURCES_FOR_COURSE_SQL)], [
+        "remedial resources for {course_id}",
+        "study resources of course {course_id}",
+        "help material for {course_id}",
+    ]),
+    "all_faculty": ("db2", [((), ALL_FACULTY_SQL)], [
+        "all faculty",
+        "faculty members",
+        "every professor",
+        "teachers list",
+    ]),
+    "all_courses": ("db2", [((), ALL_COURSES_SQL)], [
+        "all courses",
+        "courses offered",
+        "every course",
+        "course catalog",
+    ]),
+}
+
+matcher_stats = {"matched": 0, "below_threshold": 0, "missing_slots": 0, "unused_slots": 0,
+                 "foreign_terms": 0, "negated": 0, "total_ms": 0.0}
+
+
+def normalize_word(word):
+    if word in SYNONYMS:
+        return SYNONYMS[word]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        word = word[:-1]
+    return SYNONYMS.get(word, word)
+
+
+def tokens(text):
+    """Lowercase words (slot markers like @student_id kept whole), stopwords dropped, synonyms folded"""
+    return [normalize_word(word) for word in re.findall(r'@\w+|[a-z]+', text) if word not in STOPWORDS]
+
+
+def shingles(words):
+    """Word unigrams plus adjacent bigrams"""
+    out = set(words)
+    out.update(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return out
+
+
+def extract_slots(q):
+    """Pull slot values out of a lowercased question; returns (masked text, {slot: raw text})"""
+    slots = {}
+    for name, pattern in SLOT_PATTERNS:
+        if name in slots:
+            continue
+        match = pattern.search(q)
+        if not match:
+            continue
+        group = next((i for i in range(1, (match.lastindex or 0) + 1) if match.group(i)), None)
+        if group is None:
+            continue
+        value = match.group(group).strip()
+        if name == "faculty":
+            value = re.split(r'(?:^|\s+)' + NAME_STOP + r'\b', value)[0].strip()
+            if not value:
+                continue
+        slots[name] = value
+        start, end = match.span() if name in WHOLE_MATCH_SLOTS else match.span(group)
+        q = q[:start] + f" @{name} " + q[end:]
+    return q, slots
+
+
+def canonical_shingles(question):
+    return shingles(tokens(re.sub(r'\{(\w+)\}', r'@\1', question.lower())))
+
+
+def build_index(intents=INTENTS):
+    """entries: [(intent, shingle set)]; postings: shingle -> entry positions"""
+    entries, postings = [], {}
+    for name, (_, _, questions) in intents.items():
+        for question in questions:
+            grams = canonical_shingles(question)
+            position = len(entries)
+            entries.append((name, grams))
+            for gram in grams:
+                postings.setdefault(gram, []).append(position)
+    return entries, postings
+
+
+def build_vocabulary(intents=INTENTS):
+    """intent -> words of its canonical questions"""
+    return {name: set().union(*(tokens(re.sub(r'\{(\w+)\}', r'@\1', question.lower())) for question in questions))
+            for name, (_, _, questions) in intents.items()}
+
+
+_ENTRIES, _POSTINGS = build_index()
+_VOCABULARY = build_vocabulary()
+_ALL_WORDS = set().union(*_VOCABULARY.values())
+
+
+def score(q_grams, target_db=None):
+    """Best Jaccard similarity per intent, highest first: [(similarity, intent)]"""
+    overlap = {}
+    for gram in q_grams:
+        for position in _POSTINGS.get(gram, ()):
+            overlap[position] = overlap.get(position, 0) + 1
+    best = {}
+    for position, shared in overlap.items():
+        name, grams = _ENTRIES[position]
+        if target_db and INTENTS[name][0] != target_db:
+            continue
+        similarity = shared / (len(q_grams) + len(grams) - shared)
+        if similarity > best.get(name, 0.0):
+            best[name] = similarity
+    return sorted(((sim, name) for name, sim in best.items()), reverse=True)
+
+
+def bind(name, slots):
+    """(sql, params, slots used) for the most specific variant of `name` whose slots were all extracted"""
+    for needed, sql in INTENTS[name][1]:
+        if all(slot in slots for slot in needed):
+            return sql, tuple(SLOT_VALUES[slot](slots[slot]) for slot in needed), needed
+    return None
+
+
+def has_negation(q):
+    return bool(NEGATION_PATTERN.search(q))
+
+
+def unused_slots(slots, used):
+    return sorted(set(slots) - set(used))
+
+
+def foreign_terms(words, name):
+    """Question words that belong to other intents' vocabularies but not to `name`'s (slot markers excluded)"""
+    return sorted(word for word in (set(words) & _ALL_WORDS) - _VOCABULARY[name] if not word.startswith("@"))
+
+
+def fuzzy_match(nl_query, target_db=None, threshold=MATCH_THRESHOLD):
+    """Return (intent, sql, params, similarity) or None when the LLM should handle the question"""
+    start = time.perf_counter()
+    q = nl_query.lower().strip()
+    masked, slots = extract_slots(q)
+    words = tokens(masked)
+    q_grams = shingles(words)
+    result = None
+    if has_negation(q):
+        matcher_stats["negated"] += 1
+        q_grams = set()
+    if q_grams:
+        for similarity, name in score(q_grams, target_db):
+            if similarity < threshold:
+                matcher_stats["below_threshold"] += 1
+                break
+            bound = bind(name, slots)
+            if not bound:
+                matcher_stats["missing_slots"] += 1
+                continue
+            # the best intent would drop part of the question; a weaker one would fit even less
+            if unused_slots(slots, bound[2]):
+                matcher_stats["unused_slots"] += 1
+            elif foreign_terms(words, name):
+                matcher_stats["foreign_terms"] += 1
+            else:
+                result = (name, bound[0], bound[1], similarity)
+                matcher_stats["matched"] += 1
+            break
+    matcher_stats["total_ms"] += (time.perf_counter() - start) * 1000
+    return result
+
+
+def template_match(nl_query, target_db):
+    """
+    sql_templates.match_template() with the checks of fuzzy_match() (the keyword check for templates
+    that are also intents): (name, sql, params), or None when no template matches or the match
+    would drop part of the question.
+    """
+    matched = match_template(nl_query, target_db)
+    if not matched:
+        return None
+    q = nl_query.lower().strip()
+    masked, slots = extract_slots(q)
+    if has_negation(q):
+        matcher_stats["negated"] += 1
+        return None
+    if unused_slots(slots, TEMPLATE_SLOTS.get(matched[0], ())):
+        matcher_stats["unused_slots"] += 1
+        return None
+    if matched[0] in INTENTS and foreign_terms(tokens(masked), matched[0]):
+        matcher_stats["foreign_terms"] += 1
+        return None
+    return matched
@@ -1,17 +1,231 @@
+import argparse
+import csv
+import re
 import sqlite3
+import sys
+import time
+from itertools import islice
 import pandas as pd
 
 DB_PATH = "db1_student.db"
 
-def create_tables():
+# Secondary indexes matched to the access paths of db1_api_server and the coordinator.
+# Single-column indexes keep rowid order within a key, so keyset pages (ORDER BY rowid) need no sort;
+# a composite index orders by its next column instead, hence the separate Attendance(student_id).
+INDEXES = (
+    ("idx_enrollment_course", "Enrollment(course_id)"),             # course filter, federated IN (...) semijoin
+    ("idx_enrollment_student", "Enrollment(student_id)"),           # student filter, Students join
+    ("idx_attendance_student_course_status",                        # covering: summary GROUP BY, per-student stats
+     "Attendance(student_id, course_id, status)"),
+    ("idx_attendance_student", "Attendance(student_id)"),           # student filter, keyset pages
+    ("idx_attendance_course", "Attendance(course_id)"),             # course filter
+    ("idx_attendance_status", "Attendance(status)"),                # status filter
+    ("idx_rollup_course",                                           # covering: per-group student counts
+     "AttendanceRollup(course_id, present_count, total_classes)"),
+)
+
+# Known query shapes (SQL, sample params[, tables or aliases expected to be read in full]).
+# Each must be answered without a SCAN of any other table, whether of the table itself or of a
+# whole index; keyset shapes (ORDER BY rowid) must also not sort.
+QUERY_SHAPES = {
+    "students by id": (
+        "SELECT rowid AS _rowid, * FROM Students WHERE 1=1 AND student_id = ? ORDER BY rowid", ("S001",)),
+    "enrollment by course": (
+        "SELECT rowid AS _rowid, * FROM Enrollment WHERE 1=1 AND course_id = ? ORDER BY rowid", ("CS101",)),
+    "enrollment by student": (
+        "SELECT rowid AS _rowid, * FROM Enrollment WHERE 1=1 AND student_id = ? ORDER BY rowid", ("S001",)),
+    "attendance by student": (
+        "SELECT rowid AS _rowid, * FROM Attendance WHERE 1=1 AND student_id = ? ORDER BY rowid", ("S001",)),
+    "attendance by course": (
+        "SELECT rowid AS _rowid, * FROM Attendance WHERE 1=1 AND course_id = ? ORDER BY rowid", ("CS101",)),
+    "attendance by status": (
+        "SELECT rowid AS _rowid, * FROM Attendance WHERE 1=1 AND status = ? ORDER BY rowid", ("Absent",)),
+    "attendance summary": ("""
+        SELECT student_id, course_id, total_classes, present_count
+        FROM AttendanceRollup
+        ORDER BY student_id, course_id""", (), ("AttendanceRollup",)),
+    "student attendance per course": ("""
+        SELECT r.course_id, r.total_classes, r.present_count
+        FROM AttendanceRollup r
+        WHERE r.student_id = ?""", ("S001",)),
+    "attendance threshold": ("""
+        SELECT s.student_id, s.name, r.present_count, r.total_classes
+        FROM (SELECT student_id, SUM(present_count) AS present_count, SUM(total_classes) AS total_classes
+              FROM AttendanceRollup
+              GROUP BY student_id) r
+        JOIN Students s ON s.student_id = r.student_id
+        WHERE CAST(r.present_count AS FLOAT) / r.total_classes > ?""", (0.75,), ("AttendanceRollup", "r")),
+    "students per group below attendance": ("""
+        WITH course_groups(course_id, grp) AS (SELECT key, value FROM json_each(?))
+        SELECT grp, COUNT(*) AS students
+        FROM (SELECT g.grp, r.student_id
+              FROM AttendanceRollup r
+              JOIN course_groups g ON g.course_id = r.course_id
+              WHERE 1=1
+              GROUP BY g.grp, r.student_id
+              HAVING CAST(SUM(r.present_count) AS FLOAT) / SUM(r.total_classes) < ?)
+        GROUP BY grp""", ('{"CS101": 0, "MA101": 1}', 0.6), ("json_each",)),
+    "federated semijoin": ("""
+        SELECT s.student_id, s.name, s.email, s.program, e.course_id
+        FROM Enrollment e
+        CROSS JOIN Students s ON s.student_id = e.student_id
+        WHERE e.course_id IN (?, ?, ?)
+        ORDER BY s.student_id""", ("CS101", "CS201", "MA101")),
+}
+VERSIONED_TABLES = ("Students", "Enrollment", "Attendance")
+
+
+# Natural keys used by the incremental importer to upsert instead of reloading
+NATURAL_KEYS = {
+    "Students": ("student_id",),
+    "Enrollment": ("student_id", "course_id", "semester"),
+    "Attendance": ("student_id", "course_id", "date"),
+}
+CSV_FILES = (
+    ("Students", "data/students.csv"),
+    ("Enrollment", "data/Enrollment.csv"),
+    ("Attendance", "data/Attendance.csv"),
+)
+CHUNK_SIZE = 5000
+IMPORT_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+)
+
+
+def create_version_tracking(cursor, bump=True):
+    """Per-table change counters bumped by triggers; the coordinator uses them to validate cached results"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS DataVersion (
+            table_name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    for table in VERSIONED_TABLES:
+        # Counters survive a rebuild and are bumped for it, so a version number is never reused
+        cursor.execute("INSERT OR IGNORE INTO DataVersion (table_name, version) VALUES (?, 0)", (table,))
+        if bump:
+            cursor.execute("UPDATE DataVersion SET version = version + 1 WHERE table_name = ?", (table,))
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table.lower()}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    UPDATE DataVersion SET version = version + 1 WHERE table_name = '{table}';
+                END
+            """)
+
+
+PRESENT_EXPR = "CASE WHEN LOWER({row}.status) = 'present' THEN 1 ELSE 0 END"
+
+
+def create_attendance_rollup(cursor):
+    """
+    AttendanceRollup holds total/present counts per (student_id, course_id), kept current
+    by triggers on Attendance so summaries cost O(student-course pairs), not O(attendance rows).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS AttendanceRollup (
+            student_id TEXT NOT NULL,
+            course_id TEXT NOT NULL,
+            total_classes INTEGER NOT NULL DEFAULT 0,
+            present_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (student_id, course_id)
+        ) WITHOUT ROWID
+    """)
+    add_new = f"""
+        INSERT INTO AttendanceRollup (student_id, course_id, total_classes, present_count)
+        VALUES (NEW.student_id, NEW.course_id, 1, {PRESENT_EXPR.format(row="NEW")})
+        ON CONFLICT(student_id, course_id) DO UPDATE SET
+            total_classes = total_classes + 1,
+            present_count = present_count + excluded.present_count;
+    """
+    remove_old = f"""
+        UPDATE AttendanceRollup SET
+            total_classes = total_classes - 1,
+            present_count = present_count - {PRESENT_EXPR.format(row="OLD")}
+        WHERE student_id = OLD.student_id AND course_id = OLD.course_id;
+        DELETE FROM AttendanceRollup
+        WHERE student_id = OLD.student_id AND course_id = OLD.course_id AND total_classes <= 0;
+    """
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_insert AFTER INSERT ON Attendance BEGIN {add_new} END")
+    cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_delete AFTER DELETE ON Attendance BEGIN {remove_old} END")
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_attendance_rollup_update
+        AFTER UPDATE OF student_id, course_id, status ON Attendance
+        BEGIN {remove_old} {add_new} END
+    """)
+
+
+def rebuild_attendance_rollup(cursor):
+    """Recompute the rollup from Attendance (for databases loaded before the triggers existed)"""
+    cursor.execute("DELETE FROM AttendanceRollup")
+    cursor.execute(f"""
+        INSERT INTO AttendanceRollup (student_id, course_id, total_classes, present_count)
+        SELECT student_id, course_id, COUNT(*), SUM({PRESENT_EXPR.format(row="Attendance")})
+        FROM Attendance
+        GROUP BY student_id, course_id
+    """)
+
+
+def drop_natural_key_duplicates(cursor, table, columns):
+    """
+    Delete all but the last-loaded row of each duplicated natural key (an upsert keeps the last one too),
+    printing a few of the affected keys. Rows with a NULL key column never conflict and are kept.
+    """
+    keys = ", ".join(columns)
+    not_null = " AND ".join(f"{column} IS NOT NULL" for column in columns)
+    duplicates = cursor.execute(f"SELECT {keys}, COUNT(*) FROM {table} WHERE {not_null} "
+                                f"GROUP BY {keys} HAVING COUNT(*) > 1").fetchall()
+    if not duplicates:
+        return 0
+    removed = cursor.execute(f"DELETE FROM {table} WHERE {not_null} AND rowid NOT IN "
+                             f"(SELECT MAX(rowid) FROM {table} WHERE {not_null} GROUP BY {keys})").rowcount
+    print(f" {table}: removed {removed} duplicate row(s) of ({keys}), keeping the last loaded; e.g. "
+          + "; ".join(str(row[:-1]) for row in duplicates[:5]))
+    return removed
+
+
+def create_natural_keys(cursor):
+    """Unique (natural key) indexes the incremental upsert relies on; existing duplicates are removed first"""
+    for table, columns in NATURAL_KEYS.items():
+        if table == "Students":
+            continue  # student_id is already the primary key
+        drop_natural_key_duplicates(cursor, table, columns)
+        try:
+            cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table.lower()}_natural ON {table}({', '.join(columns)})")
+        except sqlite3.IntegrityError as e:
+            raise SystemExit(f" Cannot make ({', '.join(columns)}) unique in {table}: {e}. "
+                             "Remove the duplicate rows and re-run.")
+
+
+def drop_csv_duplicates(df, table):
+    """Keep the last CSV row of each natural key, as the incremental upsert does"""
+    names = {column.strip().lower(): column for column in df.columns}
+    subset = [names[key] for key in NATURAL_KEYS[table] if key in names]
+    if len(subset) < len(NATURAL_KEYS[table]):
+        return df  # a missing key column is NULL in every row, which never conflicts
+    duplicated = df.duplicated(subset=subset, keep="last") & df[subset].notna().all(axis=1)
+    if duplicated.any():
+        print(f" {table}: skipped {int(duplicated.sum())} duplicate CSV row(s) of ({', '.join(NATURAL_KEYS[table])}), "
+              "keeping the last")
+    return df[~duplicated]
+
+
+def create_tables(rebuild=True):
+    """Create the DB1 schema. rebuild=True drops existing tables first; False keeps data (incremental mode)."""
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
 
-    cursor.execute("DROP TABLE IF EXISTS Attendance")
-    cursor.execute("DROP TABLE IF EXISTS Enrollment")
-    cursor.execute("DROP TABLE IF EXISTS Students")
+    if rebuild:
+        cursor.execute("DROP TABLE IF EXISTS AttendanceRollup")
+        cursor.execute("DROP TABLE IF EXISTS Attendance")
+        cursor.execute("DROP TABLE IF EXISTS Enrollment")
+        cursor.execute("DROP TABLE IF EXISTS Students")
     cursor.execute("""
-        CREATE TABLE Students (
+        CREATE TABLE IF NOT EXISTS Students (
             student_id TEXT PRIMARY KEY,
             name TEXT NOT NULL,
             email TEXT,
@@ -20,7 +234,7 @@ def create_tables():
         )
     """)
     cursor.execute("""
-        CREATE TABLE Enrollment (
+        CREATE TABLE IF NOT EXISTS Enrollment (
             enrollment_id INTEGER PRIMARY KEY AUTOINCREMENT,
             student_id TEXT NOT NULL,
             course_id TEXT NOT NULL,
@@ -30,7 +244,7 @@ def create_tables():
         )
     """)
     cursor.execute("""
-        CREATE TABLE Attendance (
+        CREATE TABLE IF NOT EXISTS Attendance (
             attendance_id INTEGER PRIMARY KEY AUTOINCREMENT,
             student_id TEXT NOT NULL,
             course_id TEXT NOT NULL,
@@ -39,10 +253,18 @@ def create_tables():
             FOREIGN KEY (student_id) REFERENCES Students(student_id)
         )
     """)
+    create_natural_keys(cursor)
+    create_version_tracking(cursor, bump=rebuild)
+    create_attendance_rollup(cursor)
+    # a DB1 loaded before the rollup existed gets an empty table whose triggers only see future changes
+    if (cursor.execute("SELECT 1 FROM Attendance LIMIT 1").fetchone()
+            and not cursor.execute("SELECT 1 FROM AttendanceRollup LIMIT 1").fetchone()):
+        rebuild_attendance_rollup(cursor)
+        print(" Rebuilt AttendanceRollup from existing Attendance rows")
     
     conn.commit()
     conn.close()
-    print(" Tables created successfully")
+    print(" Tables created successfully" if rebuild else " Schema verified")
 
 
 def import_data():
@@ -69,6 +291,7 @@ def import_data():
         enrollment_df['student_id'] = enrollment_df['student_id'].astype(str).str.upper()
         enrollment_df['course_id'] = enrollment_df['course_id'].astype(str).str.upper()
         
+        enrollment_df = drop_csv_duplicates(enrollment_df, "Enrollment")
         enrollment_df.to_sql('Enrollment', conn, if_exists='append', index=False)
         print(f" Imported {len(enrollment_df)} enrollments")
         
@@ -81,12 +304,15 @@ def import_data():
         attendance_df['course_id'] = attendance_df['course_id'].astype(str).str.upper()
         attendance_df['status'] = attendance_df['status'].str.capitalize()  # present -> Present
         
+        attendance_df = drop_csv_duplicates(attendance_df, "Attendance")
         attendance_df.to_sql('Attendance', conn, if_exists='append', index=False)
         print(f" Imported {len(attendance_df)} attendance records")
         
     except FileNotFoundError as e:
         print(f" Error: {e}")
         print("Make sure CSV files are in the 'data' directory")
+    except sqlite3.IntegrityError as e:
+        print(f" Error importing data: {e} (student_id must be unique in students.csv)")
     except Exception as e:
         print(f" Error importing data: {e}")
         import traceback
@@ -95,6 +321,134 @@ def import_data():
         conn.close()
 
 
+def clean_row(table, row):
+    """Same normalization as import_data, applied to one csv.DictReader row"""
+    row = {key.strip().lower(): (value.strip() if value is not None and value.strip() != "" else None)
+           for key, value in row.items() if key}
+    if row.get("student_id"):
+        row["student_id"] = row["student_id"].upper()
+    if table == "Students":
+        if row.get("email"):
+            row["email"] = row["email"].lower()
+        if row.get("year") and row["year"].lstrip("-").isdigit():
+            row["year"] = int(row["year"])
+    else:
+        if row.get("course_id"):
+            row["course_id"] = row["course_id"].upper()
+    if table == "Attendance" and row.get("status"):
+        row["status"] = row["status"].capitalize()
+    return row
+
+
+def upsert_sql(table, columns):
+    """INSERT ... ON CONFLICT(natural key) DO UPDATE that only writes rows whose values changed"""
+    keys = NATURAL_KEYS[table]
+    updates = [col for col in columns if col not in keys]
+    placeholders = ", ".join("?" for _ in columns)
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders}) ON CONFLICT({', '.join(keys)}) DO "
+    if not updates:
+        return sql + "NOTHING"
+    sql += "UPDATE SET " + ", ".join(f"{col} = excluded.{col}" for col in updates)
+    sql += " WHERE " + " OR ".join(f"{table}.{col} IS NOT excluded.{col}" for col in updates)
+    return sql
+
+
+def table_columns(conn, table):
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def import_csv_incremental(conn, table, path, chunk_size=CHUNK_SIZE):
+    """Stream one CSV in chunks, upserting each chunk in its own transaction. Returns (read, written, seconds)."""
+    start = time.perf_counter()
+    read = written = 0
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        known = set(table_columns(conn, table))
+        columns = [c for c in (h.strip().lower() for h in reader.fieldnames or []) if c in known]
+        missing = [c for c in NATURAL_KEYS[table] if c not in columns]
+        if missing:
+            raise ValueError(f"{path} is missing natural key column(s): {', '.join(missing)}")
+        sql = upsert_sql(table, columns)
+        while True:
+            chunk = [clean_row(table, row) for row in islice(reader, chunk_size)]
+            if not chunk:
+                break
+            with conn:
+                cursor = conn.executemany(sql, ([row.get(col) for col in columns] for row in chunk))
+            # rowcount excludes trigger writes and upserts skipped by the WHERE clause
+            read += len(chunk)
+            written += max(cursor.rowcount, 0)
+    return read, written, time.perf_counter() - start
+
+
+def import_data_incremental(chunk_size=CHUNK_SIZE):
+    """Upsert every CSV into the existing tables; only new or changed rows are written"""
+    conn = sqlite3.connect(DB_PATH)
+    for pragma in IMPORT_PRAGMAS:
+        conn.execute(pragma)
+    try:
+        for table, path in CSV_FILES:
+            print(f" Importing {path} incrementally...")
+            read, written, elapsed = import_csv_incremental(conn, table, path, chunk_size)
+            rate = read / elapsed if elapsed > 0 else float("inf")
+            print(f" {table}: {read} rows read, {written} rows written in {elapsed:.2f}s ({rate:,.0f} rows/sec)")
+    except FileNotFoundError as e:
+        print(f" Error: {e}")
+        print("Make sure CSV files are in the 'data' directory")
+    finally:
+        conn.close()
+
+
+def create_indexes():
+    conn = sqlite3.connect(DB_PATH)
+    for name, target in INDEXES:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+    conn.commit()
+    conn.close()
+    print(f" Created {len(INDEXES)} indexes")
+
+
+def analyze_db():
+    """Refresh sqlite_stat1 so the planner sees real cardinalities"""
+    conn = sqlite3.connect(DB_PATH)
+    conn.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+    print(" ANALYZE complete")
+
+
+SCAN_STEP = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?')
+
+
+def is_table_scan(detail, allowed=()):
+    """
+    True for a plan step that reads a whole table, with or without an index
+    ('SCAN Attendance', 'SCAN s USING INDEX sqlite_autoindex_Students_1'), unless the table or alias is allowed.
+    """
+    match = SCAN_STEP.match(detail)
+    if not match or "CONSTANT ROW" in detail:
+        return False
+    return not (match.group(1) in allowed or match.group(2) in allowed)
+
+
+def verify_query_plans():
+    """Run EXPLAIN QUERY PLAN on every known query shape; return the shapes that scan or, for keyset pages, sort"""
+    conn = sqlite3.connect(DB_PATH)
+    failures = {}
+    print("\n Query plans:")
+    for name, (sql, params, *allowed) in QUERY_SHAPES.items():
+        allowed = allowed[0] if allowed else ()
+        details = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        problems = [d for d in details if is_table_scan(d, allowed)]
+        if sql.rstrip().endswith("ORDER BY rowid"):
+            problems += [d for d in details if d.startswith("USE TEMP B-TREE FOR ORDER BY")]
+        print(f"   {'FAIL' if problems else 'ok  '} {name}: {'; '.join(details)}")
+        if problems:
+            failures[name] = details
+    conn.close()
+    return failures
+
+
 def verify_data():
     conn = sqlite3.connect(DB_PATH)
     cursor = conn.cursor()
@@ -109,6 +463,10 @@ def verify_data():
     cursor.execute("SELECT COUNT(*) FROM Attendance")
     print(f"   Attendance records: {cursor.fetchone()[0]}")
     
+    cursor.execute("SELECT COUNT(*), COALESCE(SUM(total_classes), 0) FROM AttendanceRollup")
+    pairs, rolled_up = cursor.fetchone()
+    print(f"   Attendance rollup: {pairs} student-course pairs covering {rolled_up} records")
+    
     # Show sample data
     print("\n Sample Student Data:")
     cursor.execute("SELECT * FROM Students LIMIT 3")
@@ -129,11 +487,27 @@ def verify_data():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Set up the PC1 student database")
+    parser.add_argument("--incremental", action="store_true",
+                        help="upsert CSVs in chunks into the existing tables instead of rebuilding them")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+
     print("="*60)
     print(" Setting up PC1 Student Database...")
     print("="*60)
-    create_tables()
-    import_data()
+    if args.incremental:
+        create_tables(rebuild=False)
+        import_data_incremental(args.chunk_size)
+    else:
+        create_tables()
+        import_data()
+    create_indexes()
+    analyze_db()
     verify_data()
+    failures = verify_query_plans()
+    if failures:
+        print(f"\n Query plan check failed for: {', '.join(failures)}")
+        sys.exit(1)
     print("\n PC1 Database setup complete!")
     print("="*60)
\ No newline at end of file
@@ -0,0 +1,132 @@
+"""
+Join operators for combining rows fetched from different sources
+(DB1 student rows, DB2 course rows) inside the coordinator.
+
+Rows are plain dicts, the same shape returned by query_db1 / query_db2.
+"""
+
+JOIN_TYPES = ("inner", "left", "semi")
+
+
+def normalize_key(value):
+    """Normalize a single key value so 101, 101.0, '101' and ' 101 ' compare equal"""
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _key_columns(keys):
+    if isinstance(keys, str):
+        return (keys,)
+    return tuple(keys)
+
+
+def _make_key_fn(columns):
+    """Return a function extracting a normalized (possibly composite) key from a row"""
+    if len(columns) == 1:
+        col = columns[0]
+        return lambda row: normalize_key(row.get(col))
+
+    def composite(row):
+        key = tuple(normalize_key(row.get(col)) for col in columns)
+        return None if None in key else key
+    return composite
+
+
+def build_index(rows, key_fn):
+    """Hash index: normalized key -> list of row positions. Rows with a NULL key are skipped."""
+    index = {}
+    for pos, row in enumerate(rows):
+        key = key_fn(row)
+        if key is None:
+            continue
+        bucket = index.get(key)
+        if bucket is None:
+            index[key] = [pos]
+        else:
+            bucket.append(pos)
+    return index
+
+
+def hash_join(left_rows, right_rows, left_on, right_on=None, how="inner", right_columns=None):
+    """
+    Join two lists of row dicts on equal keys.
+
+    left_on / right_on: column name or sequence of names (composite key).
+    how: 'inner' | 'left' | 'semi'
+    right_columns: columns filled with None for unmatched rows of a left join
+                   (defaults to the columns of the first right row).
+
+    The hash index is built on the smaller input and the other side probes it,
+    so the cost is O(n + m). Output keeps left-row order, matching the order the
+    old nested-loop merge produced. Merged rows are {**left, **right}.
+    """
+    if how not in JOIN_TYPES:
+        raise ValueError(f"Unsupported join type: {how}")
+
+    left_cols = _key_columns(left_on)
+    right_cols = _key_columns(right_on if right_on is not None else left_on)
+    if len(left_cols) != len(right_cols):
+        raise ValueError("left_on and right_on must have the same number of columns")
+
+    left_key = _make_key_fn(left_cols)
+    right_key = _make_key_fn(right_cols)
+
+    if len(right_rows) <= len(left_rows):
+        matches = _probe_left(left_rows, right_rows, left_key, right_key, how)
+    else:
+        matches = _probe_right(left_rows, right_rows, left_key, right_key, how)
+
+    if how == "semi":
+        return [row for row, matched in zip(left_rows, matches) if matched]
+
+    if how == "left":
+        if right_columns is None:
+            right_columns = list(right_rows[0].keys()) if right_rows else []
+        null_right = {col: None for col in right_columns}
+
+    result = []
+    for row, matched in zip(left_rows, matches):
+        if matched:
+            for other in matched:
+                result.append({**row, **other})
+        elif how == "left":
+            result.append({**null_right, **row})
+    return result
+
+
+def _probe_left(left_rows, right_rows, left_key, right_key, how):
+    """Right side is the build side; each left row probes it."""
+    if how == "semi":
+        keys = {right_key(row) for row in right_rows}
+        keys.discard(None)
+        return [left_key(row) in keys for row in left_rows]
+
+    index = build_index(right_rows, right_key)
+    matches = []
+    for row in left_rows:
+        positions = index.get(left_key(row))
+        matches.append([right_rows[p] for p in positions] if positions else None)
+    return matches
+
+
+def _probe_right(left_rows, right_rows, left_key, right_key, how):
+    """Left side is the build side; right rows probe it and results are regrouped in left order."""
+    index = build_index(left_rows, left_key)
+    if how == "semi":
+        matched = [False] * len(left_rows)
+        for row in right_rows:
+            for pos in index.get(right_key(row), ()):
+                matched[pos] = True
+        return matched
+
+    matches = [None] * len(left_rows)
+    for row in right_rows:
+        for pos in index.get(right_key(row), ()):
+            if matches[pos] is None:
+                matches[pos] = [row]
+            else:
+                matches[pos].append(row)
+    return matches
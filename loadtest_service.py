@@ -0,0 +1,185 @@
+"""
+Load test for coordinator_service.py against local stand-ins for PC2 and Gemini.
+
+Run from the directory holding db1_student.db:
+    python loadtest_service.py [concurrency] [requests] [--pc2-ms 40] [--llm-ms 800]
+
+Starts a stand-in PC2 API (Faculty/Courses in an in-memory SQLite, fixed latency per request),
+replaces the Gemini call with a fixed-latency stand-in, serves the coordinator on a local port
+and fires `requests` questions from `concurrency` client threads. Reports throughput, latency
+percentiles and how many requests were rejected (503) or timed out (504).
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import threading
+import time
+
+import requests
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+import coordinator_service
+import federated_coordinator as coordinator
+
+PC2_PORT = 5902
+SERVICE_PORT = 5903
+
+QUESTIONS = [
+    "show all courses",
+    "show all faculty",
+    "show courses taught by sharma",
+    "list all students",
+    "show students with attendance greater than 75%",
+    "show attendance for student S001",
+    "show students in courses taught by sharma",
+    "students with attendance below 60%",
+    "exam schedule for CS101",
+    "which semester had the most enrollments",  # falls through to the LLM stand-in
+]
+
+
+def start_pc2_standin(port, latency_ms):
+    app = Flask("pc2_standin")
+    db = sqlite3.connect(":memory:", check_same_thread=False)
+    db.executescript("""
+        CREATE TABLE Faculty(faculty_id INT PRIMARY KEY, name TEXT, department TEXT, email TEXT);
+        CREATE TABLE Courses(course_id TEXT PRIMARY KEY, course_name TEXT, faculty_id INT, credits INT);
+        CREATE TABLE Exams(exam_id INT PRIMARY KEY, course_id TEXT, exam_date DATE, eligibility_criteria TEXT);
+        CREATE TABLE Remedial_Resources(resource_id INT PRIMARY KEY, course_id TEXT, type TEXT, description TEXT);
+        INSERT INTO Faculty VALUES (1, 'Dr. Sharma', 'Computer Science', 'sharma@university.edu'),
+                                   (2, 'Dr. Rao', 'Mathematics', 'rao@university.edu'),
+                                   (3, 'Dr. Iyer', 'Physics', 'iyer@university.edu');
+    """)
+    try:
+        with coordinator.get_db1_pool().connection() as conn:
+            course_ids = [row[0] for row in conn.execute("SELECT DISTINCT course_id FROM Enrollment")]
+    except Exception:
+        course_ids = [f"CS{100 + i}" for i in range(10)]
+    for i, course_id in enumerate(course_ids):
+        db.execute("INSERT INTO Courses VALUES (?, ?, ?, 3)", (course_id, f"Course {course_id}", 1 + i % 3))
+        db.execute("INSERT INTO Exams VALUES (?, ?, '2025-05-01', '75% attendance')", (i, course_id))
+    db.commit()
+    lock = threading.Lock()
+
+    @app.route('/health')
+    def health():
+        return jsonify({"status": "healthy"})
+
+    @app.route('/api/version')
+    def version():
+        return jsonify({"version": "1", "params": True})
+
+    @app.route('/api/query', methods=['POST'])
+    def query():
+        time.sleep(latency_ms / 1000.0)
+        data = request.get_json()
+        try:
+            with lock:
+                cursor = db.execute(data["sql"], data.get("params") or [])
+                columns = [d[0] for d in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+            return jsonify({"success": True, "columns": columns, "rows": rows})
+        except Exception as e:
+            return jsonify({"success": False, "error": str(e)}), 400
+
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def llm_standin(prompt, latency_ms):
+    """Fixed-latency Gemini replacement returning valid SQL for whichever database the prompt targets"""
+    time.sleep(latency_ms / 1000.0)
+    if "smart_campus_db2" in prompt:
+        return "SELECT c.course_id, c.course_name, f.name FROM Courses c JOIN Faculty f ON c.faculty_id = f.faculty_id;"
+    return "SELECT semester, COUNT(*) as enrollments FROM Enrollment GROUP BY semester ORDER BY enrollments DESC;"
+
+
+def start_service(port, workers, max_queued):
+    coordinator.init_cache()
+    coordinator_service.start_pool(workers, max_queued)
+    server = make_server("127.0.0.1", port, coordinator_service.app, threaded=True)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def report(*parts):
+    print(*parts, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("concurrency", type=int, nargs="?", default=200)
+    parser.add_argument("requests", type=int, nargs="?", default=2000)
+    parser.add_argument("--pc2-ms", type=float, default=40.0)
+    parser.add_argument("--llm-ms", type=float, default=800.0)
+    parser.add_argument("--workers", type=int, default=coordinator_service.WORKERS)
+    parser.add_argument("--queue", type=int, default=coordinator_service.MAX_QUEUED)
+    parser.add_argument("--timeout", type=float, default=10.0)
+    args = parser.parse_args()
+
+    sys.stdout = open(os.devnull, "w")  # silence per-query progress output
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    coordinator.PC2_URL = f"http://127.0.0.1:{PC2_PORT}"
+    coordinator.request_llm = lambda prompt, max_tokens=250: llm_standin(prompt, args.llm_ms)
+    pc2 = start_pc2_standin(PC2_PORT, args.pc2_ms)
+    service = start_service(SERVICE_PORT, args.workers, args.queue)
+
+    url = f"http://127.0.0.1:{SERVICE_PORT}/api/ask"
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    remaining = iter(range(args.requests))
+
+    def client():
+        session = requests.Session()
+        rng = random.Random()
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            question = rng.choice(QUESTIONS)
+            if rng.random() < 0.5:
+                question += f" (dashboard {rng.randrange(1000)})"  # defeat the result cache for half the load
+            start = time.perf_counter()
+            try:
+                status = session.post(url, json={"question": question, "timeout": args.timeout}, timeout=60).status_code
+            except requests.RequestException:
+                status = "error"
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    pct = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))]
+    report(f"Requests: {len(latencies)} from {args.concurrency} clients in {wall:.1f}s "
+           f"({len(latencies) / wall:.0f} req/s); workers={args.workers} queue={args.queue}")
+    report(f"Latency ms: p50 {pct(0.5):.0f}, p95 {pct(0.95):.0f}, p99 {pct(0.99):.0f}, "
+           f"mean {statistics.mean(latencies):.0f}")
+    report(f"Status codes: {dict(sorted(statuses.items(), key=str))}")
+    report(f"Service: {coordinator_service.service_stats}")
+    report("Saved duplicate executions: " + ", ".join(
+        f"{f.name}={f.stats()['saved']}" for f in (coordinator.query_flight, coordinator.db2_flight,
+                                                    coordinator.llm_flight)))
+    service.shutdown()
+    pc2.shutdown()
+    coordinator_service.shutdown(drain_timeout=5)
+
+
+if __name__ == "__main__":
+    main()
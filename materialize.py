@@ -0,0 +1,254 @@
+"""
+Local materialized replica of the student-course-faculty join (joined_cache in cache.db).
+
+- replica_courses:     last snapshot of PC2 courses with their faculty name and department
+- replica_enrollments: last snapshot of DB1 enrollments with the student columns
+- joined_cache:        replica_enrollments joined to replica_courses, indexed on faculty_name and department
+
+Refreshes are driven by per-source change markers: the DB1 Students/Enrollment counters and
+PC2's /api/version. Only the side whose marker moved is re-read; its snapshot is diffed against
+the stored one, and joined_cache is rebuilt only for the changed courses and enrollments, so
+reads and writes are proportional to what changed.
+"""
+import sqlite3
+import threading
+import time
+
+from connections import cache_connection
+from join_ops import normalize_key
+
+META_DB1 = "joined_cache:db1_version"
+META_DB2 = "joined_cache:db2_version"
+
+_refresh_lock = threading.Lock()
+_replica_ready = False
+replica_stats = {"refreshes": 0, "hits": 0, "stale": 0, "rows_written": 0, "last_refresh_ms": 0.0}
+
+
+def ensure_replica(conn):
+    """Run init_replica once per process (at startup or on the first refresh)"""
+    global _replica_ready
+    if not _replica_ready:
+        init_replica(conn)
+        conn.commit()
+        _replica_ready = True
+
+
+def init_replica(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS joined_cache (
+            cache_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            student_id TEXT,
+            course_id TEXT,
+            student_name TEXT,
+            student_email TEXT,
+            program TEXT,
+            course_name TEXT,
+            faculty_name TEXT,
+            department TEXT,
+            created_at TIMESTAMP
+        )
+    """)
+    # joined_cache tables created by older create_cache.py lack the replica columns
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(joined_cache)")]
+    for column in ("student_email", "program", "department"):
+        if column not in columns:
+            conn.execute(f"ALTER TABLE joined_cache ADD COLUMN {column} TEXT")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_joined_cache_pair ON joined_cache(student_id, course_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_faculty ON joined_cache(faculty_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_department ON joined_cache(department, faculty_name)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_joined_cache_course ON joined_cache(course_id)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS replica_courses (
+            course_id TEXT PRIMARY KEY,
+            course_name TEXT,
+            faculty_name TEXT,
+            department TEXT
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS cache_meta (key TEXT PRIMARY KEY, value TEXT)")
+    has_enrollments = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replica_enrollments'").fetchone()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS replica_enrollments (
+            student_id TEXT,
+            course_id TEXT,
+            name TEXT,
+            email TEXT,
+            program TEXT,
+            PRIMARY KEY (student_id, course_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_replica_enrollments_course ON replica_enrollments(course_id)")
+    if not has_enrollments:
+        # replicas built before the enrollment snapshot existed are rebuilt from a fresh DB1 read
+        conn.execute("DELETE FROM joined_cache")
+        conn.execute("DELETE FROM cache_meta WHERE key = ?", (META_DB1,))
+
+
+def get_markers(conn):
+    rows = dict(conn.execute("SELECT key, value FROM cache_meta WHERE key IN (?, ?)", (META_DB1, META_DB2)).fetchall())
+    return rows.get(META_DB1), rows.get(META_DB2)
+
+
+def set_marker(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO cache_meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def is_fresh(db1_version, db2_version):
+    """True if the replica was built from exactly these source versions (a read-only marker check)"""
+    if db1_version is None or db2_version is None:
+        return False
+    with cache_connection() as conn:
+        try:
+            return get_markers(conn) == (db1_version, db2_version)
+        except sqlite3.OperationalError:
+            return False  # cache_meta does not exist until the replica is initialized
+
+
+def sync_courses(conn, course_rows):
+    """Diff a fresh PC2 course snapshot into replica_courses; returns the changed course ids"""
+    current = {row[0]: tuple(row[1:]) for row in
+               conn.execute("SELECT course_id, course_name, faculty_name, department FROM replica_courses")}
+    wanted = {}
+    for row in course_rows:
+        key = normalize_key(row.get("course_id"))
+        if key is not None:
+            wanted[key] = (row.get("course_name"), row.get("faculty_name"), row.get("department"))
+    upserts = [(key, *values) for key, values in wanted.items() if current.get(key) != values]
+    deletes = [(key,) for key in current if key not in wanted]
+    conn.executemany("INSERT OR REPLACE INTO replica_courses (course_id, course_name, faculty_name, department) "
+                     "VALUES (?, ?, ?, ?)", upserts)
+    conn.executemany("DELETE FROM replica_courses WHERE course_id = ?", deletes)
+    return {row[0] for row in upserts} | {row[0] for row in deletes}
+
+
+def sync_enrollments(conn, enrollment_rows):
+    """Diff a fresh DB1 enrollment snapshot into replica_enrollments; returns the changed (student_id, course_id) pairs"""
+    current = {(row[0], row[1]): tuple(row[2:]) for row in
+               conn.execute("SELECT student_id, course_id, name, email, program FROM replica_enrollments")}
+    wanted = {}
+    for row in enrollment_rows:
+        key = (normalize_key(row.get("student_id")), normalize_key(row.get("course_id")))
+        if None not in key:
+            wanted[key] = (row.get("name"), row.get("email"), row.get("program"))
+    upserts = [(*key, *values) for key, values in wanted.items() if current.get(key) != values]
+    deletes = [key for key in current if key not in wanted]
+    conn.executemany("INSERT OR REPLACE INTO replica_enrollments (student_id, course_id, name, email, program) "
+                     "VALUES (?, ?, ?, ?, ?)", upserts)
+    conn.executemany("DELETE FROM replica_enrollments WHERE student_id = ? AND course_id = ?", deletes)
+    return {row[:2] for row in upserts} | set(deletes)
+
+
+JOINED_INSERT_SQL = """
+INSERT INTO joined_cache (student_id, course_id, student_name, student_email, program,
+                          course_name, faculty_name, department, created_at)
+SELECT e.student_id, e.course_id, e.name, e.email, e.program, c.course_name, c.faculty_name, c.department, ?
+FROM replica_enrollments e
+JOIN replica_courses c ON c.course_id = e.course_id
+"""
+
+
+def sync_joined(conn, courses=(), pairs=()):
+    """
+    Rebuild the joined_cache rows of the changed courses and (student_id, course_id) pairs from the
+    two snapshots; rows of unchanged courses and enrollments are neither read nor written.
+    Returns rows written.
+    """
+    now = time.strftime("%Y-%m-%dT%H:%M:%S")
+    pairs = [pair for pair in pairs if pair[1] not in courses]
+    written = 0
+    for course_id in courses:
+        written += max(conn.execute("DELETE FROM joined_cache WHERE course_id = ?", (course_id,)).rowcount, 0)
+        written += max(conn.execute(JOINED_INSERT_SQL + "WHERE e.course_id = ?", (now, course_id)).rowcount, 0)
+    for student_id, course_id in pairs:
+        written += max(conn.execute("DELETE FROM joined_cache WHERE student_id = ? AND course_id = ?",
+                                    (student_id, course_id)).rowcount, 0)
+        written += max(conn.execute(JOINED_INSERT_SQL + "WHERE e.student_id = ? AND e.course_id = ?",
+                                    (now, student_id, course_id)).rowcount, 0)
+    return written
+
+
+def refresh(db1_version, db2_version, fetch_enrollments, fetch_courses, force=False):
+    """
+    Bring the replica up to the given source versions.
+    fetch_enrollments() -> DB1 rows (student_id, name, email, program, course_id)
+    fetch_courses()     -> PC2 rows (course_id, course_name, faculty_name, department)
+    Either fetcher returns None on failure; each is only called when its source's marker moved (or force).
+    Returns a summary dict, or None when another refresh is running, a marker is unknown or a fetch failed.
+    """
+    if db1_version is None or db2_version is None:
+        return None
+    if not _refresh_lock.acquire(blocking=False):
+        return None
+    try:
+        start = time.perf_counter()
+        with cache_connection() as conn:
+            ensure_replica(conn)
+            old_db1, old_db2 = get_markers(conn)
+        if not force and (old_db1, old_db2) == (db1_version, db2_version):
+            return {"changed": False, "rows_written": 0}
+
+        # Network and DB1 reads happen outside the cache lock
+        refetch_db1 = force or old_db1 != db1_version
+        refetch_db2 = force or old_db2 != db2_version
+        course_rows = fetch_courses() if refetch_db2 else None
+        enrollment_rows = fetch_enrollments() if refetch_db1 else None
+        if (refetch_db2 and course_rows is None) or (refetch_db1 and enrollment_rows is None):
+            return None
+
+        with cache_connection() as conn:
+            changed_courses = sync_courses(conn, course_rows) if refetch_db2 else set()
+            changed_pairs = sync_enrollments(conn, enrollment_rows) if refetch_db1 else set()
+            written = len(changed_courses) + len(changed_pairs)
+            written += sync_joined(conn, changed_courses, changed_pairs)
+            set_marker(conn, META_DB1, db1_version)
+            set_marker(conn, META_DB2, db2_version)
+            conn.commit()
+
+        elapsed = (time.perf_counter() - start) * 1000
+        replica_stats["refreshes"] += 1
+        replica_stats["rows_written"] += written
+        replica_stats["last_refresh_ms"] = round(elapsed, 2)
+        return {"changed": True, "rows_written": written, "elapsed_ms": elapsed,
+                "db1_refetched": refetch_db1, "db2_refetched": refetch_db2}
+    finally:
+        _refresh_lock.release()
+
+
+def refresh_in_background(*args, **kwargs):
+    """Start refresh() on a daemon thread unless one is already running"""
+    if _refresh_lock.locked():
+        return None
+    thread = threading.Thread(target=refresh, args=args, kwargs=kwargs, name="replica-refresh", daemon=True)
+    thread.start()
+    return thread
+
+
+def query_replica(faculty_name, department=None):
+    """
+    Students in courses taught by faculty matching `faculty_name` (substring, case-insensitive).
+    Matching faculty names are resolved from the faculty_name index first, so the row lookup
+    is an indexed IN (...) rather than a LIKE '%..%' scan.
+    """
+    with cache_connection() as conn:
+        if department:
+            names = conn.execute("SELECT DISTINCT department, faculty_name FROM joined_cache").fetchall()
+            matching = [name for dept, name in names
+                        if dept and department.lower() in dept.lower()
+                        and (not faculty_name or faculty_name.lower() in (name or "").lower())]
+        else:
+            names = conn.execute("SELECT DISTINCT faculty_name FROM joined_cache").fetchall()
+            matching = [row[0] for row in names if row[0] and faculty_name.lower() in row[0].lower()]
+        if not matching:
+            return []
+        placeholders = ", ".join("?" for _ in matching)
+        rows = conn.execute(f"""
+            SELECT student_id, student_name AS name, student_email AS email, program,
+                   course_id, course_name, faculty_name
+            FROM joined_cache
+            WHERE faculty_name IN ({placeholders})
+            ORDER BY student_id, course_id
+        """, matching).fetchall()
+    replica_stats["hits"] += 1
+    return [dict(row) for row in rows]
@@ -0,0 +1,222 @@
+"""
+Per-stage instrumentation for the coordinator.
+
+Each stage (analyze_query, cache_lookup, cache_store, pattern_match_query, fuzzy_match, call_llm,
+query_db1, query_db2, federated_join) records a latency histogram plus row, byte and error counters.
+render_prometheus() exposes them in the Prometheus text format (served at /metrics by
+coordinator_service.py). Questions slower than SLOW_QUERY_MS are written to slow_queries in cache.db
+with their SQL, plan and per-stage breakdown.
+"""
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from connections import cache_connection
+from streaming import estimate_row_bytes
+
+LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+SLOW_QUERY_MS = 1000
+METRIC_PREFIX = "campus"
+
+_lock = threading.Lock()
+stage_metrics = {}  # stage -> {"buckets": [...], "count", "sum_ms", "rows", "bytes", "errors"}
+_trace = threading.local()
+
+
+def _new_stage():
+    return {"buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1), "count": 0, "sum_ms": 0.0,
+            "rows": 0, "bytes": 0, "errors": 0}
+
+
+def record(stage, elapsed_ms, rows=None, size=None, error=False, spans=None):
+    """spans: the trace list to append to (default: this thread's current trace)"""
+    with _lock:
+        entry = stage_metrics.get(stage)
+        if entry is None:
+            entry = stage_metrics[stage] = _new_stage()
+        index = next((i for i, bound in enumerate(LATENCY_BUCKETS_MS) if elapsed_ms <= bound),
+                     len(LATENCY_BUCKETS_MS))
+        entry["buckets"][index] += 1
+        entry["count"] += 1
+        entry["sum_ms"] += elapsed_ms
+        entry["rows"] += rows or 0
+        entry["bytes"] += size or 0
+        entry["errors"] += 1 if error else 0
+    if spans is None:
+        spans = getattr(_trace, "spans", None)
+    if spans is not None:
+        spans.append({"stage": stage, "ms": round(elapsed_ms, 2), "rows": rows, "bytes": size})
+
+
+@contextmanager
+def span(stage):
+    """Time a block; the yielded dict may be given "rows", "bytes" and "error" before it closes"""
+    info = {}
+    start = time.perf_counter()
+    try:
+        yield info
+    except Exception:
+        info["error"] = True
+        raise
+    finally:
+        record(stage, (time.perf_counter() - start) * 1000, info.get("rows"), info.get("bytes"),
+               info.get("error", False))
+
+
+def result_rows(result):
+    if isinstance(result, dict) and isinstance(result.get("rows"), list):
+        return len(result["rows"])
+    return None
+
+
+def result_bytes(result):
+    if isinstance(result, dict) and isinstance(result.get("rows"), list):
+        return sum(estimate_row_bytes(row) for row in result["rows"] if isinstance(row, dict))
+    return None
+
+
+def instrument(stage, rows=result_rows, size=None):
+    """
+    Decorator form of span(): rows/size are computed from the return value.
+    A streaming result ({"streaming": True, "rows": StreamingResult}) is recorded when the stream
+    is drained or closed, with the rows and bytes actually fetched, in the caller's trace.
+    """
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*args, **kwargs):
+            start = time.perf_counter()
+            result, error = None, False
+            try:
+                result = fn(*args, **kwargs)
+                error = isinstance(result, dict) and result.get("success") is False
+                return result
+            except Exception:
+                error = True
+                raise
+            finally:
+                stream = result.get("rows") if isinstance(result, dict) and result.get("streaming") else None
+                if stream is not None:
+                    spans = getattr(_trace, "spans", None)
+                    stream.on_close(lambda: record(stage, (time.perf_counter() - start) * 1000, stream.rows_fetched,
+                                                   stream.bytes_fetched, error, spans=[] if spans is None else spans))
+                else:
+                    record(stage, (time.perf_counter() - start) * 1000,
+                           rows(result) if rows and result is not None else None,
+                           size(result) if size and result is not None else None, error)
+        return inner
+    return wrap
+
+
+def start_trace():
+    """Collect this thread's spans (and annotate() values) until end_trace()"""
+    _trace.spans = []
+    _trace.notes = {}
+
+
+def bind_trace(fn):
+    """
+    Wrap fn so that, on any thread, its spans go to the calling thread's current trace
+    (e.g. decomposer nodes run on a thread pool). Annotations are not shared: the workers'
+    SQL would overwrite each other's.
+    """
+    spans = getattr(_trace, "spans", None)
+
+    @functools.wraps(fn)
+    def inner(*args, **kwargs):
+        saved = getattr(_trace, "spans", None), getattr(_trace, "notes", None)
+        _trace.spans, _trace.notes = spans, None
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _trace.spans, _trace.notes = saved
+    return inner
+
+
+def annotate(**values):
+    notes = getattr(_trace, "notes", None)
+    if notes is not None:
+        notes.update(values)
+
+
+def end_trace():
+    # the same list object: a stream drained later still appends its span to it
+    spans = getattr(_trace, "spans", None)
+    spans, notes = [] if spans is None else spans, getattr(_trace, "notes", None) or {}
+    _trace.spans = None
+    _trace.notes = None
+    return spans, notes
+
+
+def init_slow_log(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS slow_queries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query_text TEXT,
+            query_type TEXT,
+            elapsed_ms REAL,
+            sql TEXT,
+            params TEXT,
+            plan TEXT,
+            stages TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_slow_queries_elapsed ON slow_queries(elapsed_ms)")
+
+
+def log_slow_query(query_text, query_type, elapsed_ms, spans, sql=None, params=None, plan=None):
+    with cache_connection() as conn:
+        conn.execute("""
+            INSERT INTO slow_queries (query_text, query_type, elapsed_ms, sql, params, plan, stages)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (query_text, query_type, round(elapsed_ms, 2), sql,
+              json.dumps(list(params), default=str) if params is not None else None,
+              plan, json.dumps(spans)))
+        conn.commit()
+
+
+def snapshot():
+    with _lock:
+        return {stage: {**entry, "buckets": list(entry["buckets"])} for stage, entry in stage_metrics.items()}
+
+
+def summary():
+    """{stage: {"count", "avg_ms", "rows", "bytes", "errors"}} for the REPL stats view"""
+    return {stage: {"count": entry["count"], "avg_ms": round(entry["sum_ms"] / max(entry["count"], 1), 2),
+                    "rows": entry["rows"], "bytes": entry["bytes"], "errors": entry["errors"]}
+            for stage, entry in snapshot().items()}
+
+
+def render_prometheus(gauges=None):
+    """
+    Prometheus text exposition of the stage metrics.
+    gauges: optional {metric_name: {label_value: number}} rendered as <prefix>_<name>{key="label"}.
+    """
+    lines = []
+    name = f"{METRIC_PREFIX}_stage_latency_ms"
+    lines.append(f"# HELP {name} Coordinator stage latency in milliseconds")
+    lines.append(f"# TYPE {name} histogram")
+    stages = snapshot()
+    for stage, entry in sorted(stages.items()):
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, entry["buckets"]):
+            cumulative += count
+            lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {entry["count"]}')
+        lines.append(f'{name}_sum{{stage="{stage}"}} {entry["sum_ms"]:.3f}')
+        lines.append(f'{name}_count{{stage="{stage}"}} {entry["count"]}')
+    for counter, help_text in (("rows", "Rows produced by the stage"), ("bytes", "Bytes moved by the stage"),
+                               ("errors", "Failed stage executions")):
+        metric = f"{METRIC_PREFIX}_stage_{counter}_total"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for stage, entry in sorted(stages.items()):
+            lines.append(f'{metric}{{stage="{stage}"}} {entry[counter]}')
+    for metric, values in (gauges or {}).items():
+        full = f"{METRIC_PREFIX}_{metric}"
+        lines.append(f"# TYPE {full} gauge")
+        for label, value in sorted(values.items()):
+            lines.append(f'{full}{{key="{label}"}} {value}')
+    return "\n".join(lines) + "\n"
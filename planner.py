@@ -0,0 +1,193 @@
+"""
+Cost-based choice of semijoin direction for federated (DB1 + DB2) queries.
+
+db2_first: fetch matching courses from PC2, push their ids into DB1 (the original plan)
+db1_first: evaluate the DB1 predicate locally, push the resulting course ids to PC2
+
+Cardinalities come from DB1's sqlite_stat1 and PC2's /api/stats. Every executed plan
+is logged with estimated and actual row/byte counts in cache.db (plan_stats) for tuning.
+"""
+import time
+
+from connections import cache_connection
+
+# Cost model, in milliseconds
+NET_ROUNDTRIP_COST = 20.0    # one HTTP request to PC2
+NET_BYTE_COST = 0.0008       # per byte over the campus link
+LOCAL_ROW_COST = 0.002       # per DB1 row read and joined locally
+
+DB2_ROW_BYTES = 120          # JSON course row (course_id, course_name, faculty_name)
+DB1_ROW_BYTES = 110          # JSON student/enrollment row
+KEY_BYTES = 12               # one quoted course id in a pushed-down IN list
+DB2_IDS_PER_REQUEST = 500
+
+STATS_TTL = 300  # seconds
+
+# Fallbacks when no statistics are available
+DEFAULT_DB1_STATS = {"Students": 1000, "Enrollment": 5000, "courses": 200, "enrollments_per_course": 25,
+                     "enrollments_per_student": 5, "years": 4}
+DEFAULT_DB2_STATS = {"Courses": 200, "Faculty": 50, "faculty_names": 50, "departments": 10}
+ATTENDANCE_BELOW_SELECTIVITY = 0.3
+
+
+def _parse_stat(stat):
+    return [int(x) for x in str(stat).split() if x.isdigit()]
+
+
+def collect_db1_stats(conn):
+    """Summarize sqlite_stat1 (written by ANALYZE in import_db1) into the numbers the model uses"""
+    stats = dict(DEFAULT_DB1_STATS)
+    try:
+        rows = conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1").fetchall()
+    except Exception:
+        rows = []
+    by_index = {}
+    for tbl, idx, stat in rows:
+        values = _parse_stat(stat)
+        if not values:
+            continue
+        stats[tbl] = values[0]
+        if idx:
+            by_index[idx] = values
+    course = by_index.get("idx_enrollment_course")
+    if course and len(course) > 1:
+        stats["enrollments_per_course"] = max(course[1], 1)
+        stats["courses"] = max(course[0] // max(course[1], 1), 1)
+    student = by_index.get("idx_enrollment_student")
+    if student and len(student) > 1:
+        stats["enrollments_per_student"] = max(student[1], 1)
+    if not rows:
+        for table in ("Students", "Enrollment"):
+            try:
+                stats[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            except Exception:
+                pass
+    return stats
+
+
+def parse_db2_stats(payload):
+    """
+    PC2 /api/stats payload:
+    {"tables": {"Courses": {"rows": n}, "Faculty": {"rows": n, "distinct": {"name": k, "department": d}}}}
+    """
+    stats = dict(DEFAULT_DB2_STATS)
+    tables = (payload or {}).get("tables") or {}
+    if "Courses" in tables:
+        stats["Courses"] = tables["Courses"].get("rows", stats["Courses"])
+    if "Faculty" in tables:
+        faculty = tables["Faculty"]
+        stats["Faculty"] = faculty.get("rows", stats["Faculty"])
+        distinct = faculty.get("distinct") or {}
+        stats["faculty_names"] = distinct.get("name", stats["Faculty"])
+        stats["departments"] = distinct.get("department", stats["departments"])
+    return stats
+
+
+_stats_cache = {}
+
+
+def cached_stats(name, loader, ttl=STATS_TTL):
+    """Memoize a stats loader for `ttl` seconds; a failing loader keeps the previous value"""
+    entry = _stats_cache.get(name)
+    now = time.time()
+    if entry and now - entry[1] < ttl:
+        return entry[0]
+    try:
+        value = loader()
+    except Exception:
+        value = entry[0] if entry else None
+    _stats_cache[name] = (value, now)
+    return value
+
+
+def db2_selectivity(db2, db2_filters):
+    sel = 1.0
+    if db2_filters.get("faculty_name"):
+        sel *= 1.0 / max(db2["faculty_names"], 1)
+    if db2_filters.get("department"):
+        sel *= 1.0 / max(db2["departments"], 1)
+    return sel
+
+
+def db1_selectivity(db1, db1_filters):
+    """Fraction of Enrollment rows that survive the DB1 predicate"""
+    sel = 1.0
+    if db1_filters.get("student_id"):
+        sel *= 1.0 / max(db1["Students"], 1)
+    if db1_filters.get("year") is not None:
+        sel *= 1.0 / max(db1["years"], 1)
+    if db1_filters.get("attendance_below") is not None:
+        sel *= ATTENDANCE_BELOW_SELECTIVITY
+    return sel
+
+
+def estimate_plans(db1, db2, db1_filters, db2_filters):
+    """Estimated rows, bytes on the wire and cost for both directions"""
+    sel2 = db2_selectivity(db2, db2_filters)
+    sel1 = db1_selectivity(db1, db1_filters)
+
+    # db2_first: every matching course crosses the network, then a local semijoin
+    db2_rows = max(db2["Courses"] * sel2, 1)
+    db1_rows = db2_rows * db1["enrollments_per_course"] * sel1
+    db2_first_bytes = db2_rows * DB2_ROW_BYTES
+    db2_first = {
+        "db1_rows": round(db1_rows, 1),
+        "db2_rows": round(db2_rows, 1),
+        "bytes": round(db2_first_bytes),
+        "cost": NET_ROUNDTRIP_COST + db2_first_bytes * NET_BYTE_COST
+                + db2_rows * db1["enrollments_per_course"] * LOCAL_ROW_COST,
+    }
+
+    # db1_first: local predicate, then the distinct course ids go to PC2 in batches
+    db1_rows_first = max(db1["Enrollment"] * sel1, 1)
+    ids = min(db1_rows_first, db1["courses"])
+    db2_rows_first = ids * sel2
+    requests = max(1, -(-int(ids) // DB2_IDS_PER_REQUEST))
+    db1_first_bytes = ids * KEY_BYTES + db2_rows_first * DB2_ROW_BYTES
+    db1_first = {
+        "db1_rows": round(db1_rows_first, 1),
+        "db2_rows": round(db2_rows_first, 1),
+        "bytes": round(db1_first_bytes),
+        "cost": requests * NET_ROUNDTRIP_COST + db1_first_bytes * NET_BYTE_COST
+                + db1_rows_first * LOCAL_ROW_COST,
+    }
+    return {"db2_first": db2_first, "db1_first": db1_first}
+
+
+def choose_plan(estimates):
+    return min(estimates, key=lambda name: estimates[name]["cost"])
+
+
+def init_plan_stats(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS plan_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            query_text TEXT,
+            plan TEXT,
+            est_cost REAL,
+            alt_cost REAL,
+            est_db1_rows REAL,
+            est_db2_rows REAL,
+            est_bytes INTEGER,
+            actual_db1_rows INTEGER,
+            actual_db2_rows INTEGER,
+            actual_bytes INTEGER,
+            elapsed_ms REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+
+
+def record_plan(query_text, plan, estimates, actual_db1_rows, actual_db2_rows, actual_bytes, elapsed_ms):
+    est = estimates[plan]
+    alt = [e["cost"] for name, e in estimates.items() if name != plan]
+    with cache_connection() as conn:
+        init_plan_stats(conn)
+        conn.execute("""
+            INSERT INTO plan_stats
+            (query_text, plan, est_cost, alt_cost, est_db1_rows, est_db2_rows, est_bytes,
+             actual_db1_rows, actual_db2_rows, actual_bytes, elapsed_ms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (query_text, plan, est["cost"], alt[0] if alt else None, est["db1_rows"], est["db2_rows"],
+              est["bytes"], actual_db1_rows, actual_db2_rows, actual_bytes, round(elapsed_ms, 2)))
+        conn.commit()
@@ -0,0 +1,177 @@
+"""
+Aggregation pushdown for federated questions.
+
+"average attendance per course taught by Sharma" is answered without moving raw fact rows:
+- DB2 returns only the course columns the grouping needs (DB2_PROJECTIONS), filtered by faculty/department
+- DB1 returns one partial aggregate row per course (SUM(present_count), SUM(total_classes) from
+  AttendanceRollup), restricted to those course ids and to any DB1 predicate (year, student id)
+- the coordinator only merges the partials into the requested groups (course, faculty or department)
+Student counts cannot be summed across courses (a student enrolled in two of a department's courses
+would count twice), so for them the course -> group mapping goes down to DB1 as one JSON parameter
+and DB1 returns COUNT(DISTINCT student_id) per group; an attendance threshold keeps only students
+whose own attendance over the group's courses is below it.
+Rows and bytes transferred therefore scale with the number of courses, not with attendance rows.
+"""
+import json
+import re
+
+# measure -> (DB1 partial SQL with {filters}; the course-id predicate goes in its {semijoin} slot)
+PARTIAL_SQL = {
+    "attendance": """
+SELECT r.course_id, SUM(r.present_count) AS present_count, SUM(r.total_classes) AS total_classes
+FROM AttendanceRollup r
+WHERE {filters}
+GROUP BY r.course_id
+ORDER BY r.course_id;
+""",
+}
+PARTIAL_KEY_COLUMN = "r.course_id"
+
+# distinct students per group; the first parameter is a JSON object {course_id: group number}
+STUDENTS_PER_GROUP_SQL = """
+WITH course_groups(course_id, grp) AS (SELECT key, value FROM json_each(?))
+SELECT g.grp, COUNT(DISTINCT r.student_id) AS students
+FROM Enrollment r
+JOIN course_groups g ON g.course_id = r.course_id
+WHERE {filters}
+GROUP BY g.grp
+ORDER BY g.grp;
+"""
+LOW_ATTENDANCE_STUDENTS_PER_GROUP_SQL = """
+WITH course_groups(course_id, grp) AS (SELECT key, value FROM json_each(?))
+SELECT grp, COUNT(*) AS students
+FROM (SELECT g.grp, r.student_id
+      FROM AttendanceRollup r
+      JOIN course_groups g ON g.course_id = r.course_id
+      WHERE {filters}
+      GROUP BY g.grp, r.student_id
+      HAVING CAST(SUM(r.present_count) AS FLOAT) / SUM(r.total_classes) < ?)
+GROUP BY grp
+ORDER BY grp;
+"""
+
+# group_by -> DB2 columns the combine step needs (projection pushdown)
+DB2_PROJECTIONS = {
+    "course": "c.course_id, c.course_name, f.name as faculty_name",
+    "faculty": "c.course_id, f.name as faculty_name, f.department",
+    "department": "c.course_id, f.department",
+}
+
+ATTENDANCE_MEASURE = r'\b(?:average|avg|mean|overall|total)\s+attendance\b|\battendance\s+(?:rate|percentage|%)\s+(?:per|by|for each|of each)\b'
+STUDENTS_MEASURE = r'\b(?:how many|number of|count of|count)\s+students\b|\bstudent\s+counts?\b|\benrollment\s+counts?\b'
+GROUP_PATTERN = r'\b(?:per|by|for each|of each|grouped by|across)\s+(course|faculty|professor|teacher|department)s?\b'
+GROUPS = {"course": "course", "faculty": "faculty", "professor": "faculty", "teacher": "faculty",
+          "department": "department"}
+
+
+def extract_aggregate(q):
+    """
+    Aggregate request in a lowercased question.
+    Returns ({"measure", "group_by"} or None, question without the grouping phrase), so that
+    "by course" is not later read as a faculty name.
+    """
+    if re.search(ATTENDANCE_MEASURE, q):
+        measure = "attendance"
+    elif re.search(STUDENTS_MEASURE, q):
+        measure = "students"
+    else:
+        return None, q
+    group = re.search(GROUP_PATTERN, q)
+    if not group:
+        return None, q
+    remaining = q[:group.start()] + " " + q[group.end():]
+    return {"measure": measure, "group_by": GROUPS[group.group(1)]}, remaining
+
+
+def filter_clauses(db1_filters):
+    clauses, params = [], []
+    if "student_id" in db1_filters:
+        clauses.append("r.student_id = ?")
+        params.append(db1_filters["student_id"])
+    if "year" in db1_filters:
+        clauses.append("r.student_id IN (SELECT student_id FROM Students WHERE year = ?)")
+        params.append(db1_filters["year"])
+    return clauses, params
+
+
+def partial_sql(measure, db1_filters):
+    """DB1 partial-aggregate SQL plus params for the DB1 predicates (which precede the {semijoin} slot)"""
+    clauses, params = filter_clauses(db1_filters)
+    clauses.append("{semijoin}")  # inserted text is not re-formatted, so run_semijoin fills it later
+    return PARTIAL_SQL[measure].format(filters=" AND ".join(clauses)), params
+
+
+def students_sql(db1_filters, courses, group_by):
+    """DB1 SQL plus params counting distinct students per group (numbered as in group_numbers)"""
+    numbers = group_numbers(courses, group_by)
+    course_groups = {str(course["course_id"]): numbers[group_key(course, group_by)] for course in courses}
+    clauses, params = filter_clauses(db1_filters)
+    filters = " AND ".join(clauses) or "1=1"
+    if "attendance_below" in db1_filters:
+        sql = LOW_ATTENDANCE_STUDENTS_PER_GROUP_SQL.format(filters=filters)
+        return sql, [json.dumps(course_groups), *params, db1_filters["attendance_below"]]
+    return STUDENTS_PER_GROUP_SQL.format(filters=filters), [json.dumps(course_groups), *params]
+
+
+def group_key(course, group_by):
+    if group_by == "faculty":
+        return (course.get("faculty_name"), course.get("department"))
+    if group_by == "department":
+        return (course.get("department"),)
+    return (str(course["course_id"]),)
+
+
+def group_numbers(courses, group_by):
+    """{group key: number} in first-seen course order"""
+    numbers = {}
+    for course in courses:
+        numbers.setdefault(group_key(course, group_by), len(numbers))
+    return numbers
+
+
+def group_columns(group_by):
+    if group_by == "faculty":
+        return ["faculty_name", "department"]
+    if group_by == "department":
+        return ["department"]
+    return ["course_id", "course_name", "faculty_name"]
+
+
+def combine_partials(partials, courses, aggregate):
+    """
+    Merge DB1 partials into one row per requested group: per-course attendance sums, or the
+    per-group student counts from students_sql. Groups without DB1 rows still appear, with zero counts.
+    """
+    measure, group_by = aggregate["measure"], aggregate["group_by"]
+    by_course = {str(row["course_id"]): row for row in partials} if measure == "attendance" else {}
+    students = {row["grp"]: row["students"] for row in partials} if measure == "students" else {}
+    numbers = group_numbers(courses, group_by)
+    labels = group_columns(group_by)
+    groups = {}
+    for course in courses:
+        key = group_key(course, group_by)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {**{column: course.get(column) for column in labels},
+                                   "courses": 0, "present_count": 0, "total_classes": 0, "students": 0}
+        partial = by_course.get(str(course["course_id"]), {})
+        group["courses"] += 1
+        group["present_count"] += partial.get("present_count") or 0
+        group["total_classes"] += partial.get("total_classes") or 0
+        group["students"] = students.get(numbers[key], 0)
+
+    rows = []
+    for key in sorted(groups, key=lambda k: tuple(str(part) for part in k)):
+        group = groups[key]
+        row = {column: group[column] for column in labels}
+        if group_by != "course":
+            row["courses"] = group["courses"]
+        if measure == "attendance":
+            row["present_count"] = group["present_count"]
+            row["total_classes"] = group["total_classes"]
+            row["attendance_percentage"] = (round(100.0 * group["present_count"] / group["total_classes"], 2)
+                                            if group["total_classes"] else None)
+        else:
+            row["students"] = group["students"]
+        rows.append(row)
+    return rows
@@ -0,0 +1,295 @@
+"""
+In-process tier of the query cache.
+
+An LRU bounded by total bytes sits in front of the query_cache table in cache.db.
+A background sweeper deletes expired query_cache rows so the table stops growing.
+
+NL->SQL translations are cached separately (sql_translation_cache) without a TTL:
+they stay valid until the schema fingerprint they were produced under changes.
+
+query_cache.result holds a compressed BLOB: CACHE_VALUE_MAGIC + format version + codec byte +
+JSON (zstd when installed, else zlib; see wire_format). Results whose JSON exceeds MAX_ENTRY_BYTES
+are not cached. Each row records its stored size, and the sweeper keeps the table under
+CACHE_DB_MAX_BYTES by evicting the rows with the largest age x size first.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from connections import cache_connection
+from wire_format import CODEC_ZLIB, CODEC_ZSTD, HAS_ZSTD, compress, decompress
+
+LRU_MAX_BYTES = 32 * 1024 * 1024
+TRANSLATION_LRU_MAX_BYTES = 4 * 1024 * 1024
+SWEEP_INTERVAL = 60  # seconds
+MAX_ENTRY_BYTES = 4 * 1024 * 1024  # serialized result size above which a result is not cached
+CACHE_DB_MAX_BYTES = 256 * 1024 * 1024  # stored bytes allowed in query_cache
+SUBQUERY_LRU_MAX_BYTES = 16 * 1024 * 1024
+SUBQUERY_TTL = 120  # seconds; entries are also dropped as soon as their source version changes
+CACHE_VALUE_MAGIC = b"QC"
+CACHE_VALUE_VERSION = 1
+CACHE_CODEC = CODEC_ZSTD if HAS_ZSTD else CODEC_ZLIB
+
+
+class LRUCache:
+    """Thread-safe LRU keyed by string, bounded by the sum of entry sizes, with per-entry TTL"""
+
+    def __init__(self, max_bytes=LRU_MAX_BYTES, default_ttl=None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rejected = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, size, expires_at = entry
+            if expires_at is not None and time.time() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size, ttl=None):
+        """Insert or replace an entry; entries larger than the whole budget are not admitted"""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            if size > self.max_bytes:
+                self.rejected += 1
+                return False
+            while self._entries and self._bytes + size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+            return True
+
+    def invalidate(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [k for k, (_, _, exp) in self._entries.items() if exp is not None and now >= exp]
+            for key in expired:
+                self._remove(key)
+            self.expirations += len(expired)
+            return len(expired)
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "rejected": self.rejected,
+            }
+
+
+result_cache = LRUCache()
+translation_cache = LRUCache(max_bytes=TRANSLATION_LRU_MAX_BYTES)
+# per-source subquery results, shared by different questions that issue the same DB1/PC2 query
+subquery_cache = LRUCache(max_bytes=SUBQUERY_LRU_MAX_BYTES, default_ttl=SUBQUERY_TTL)
+
+sqlite_stats = {"hits": 0, "misses": 0, "expired": 0, "stale": 0, "swept": 0, "evicted": 0, "too_large": 0}
+translation_stats = {"hits": 0, "misses": 0, "stored": 0}
+subquery_stats = {"stale": 0, "stored": 0, "unversioned": 0}
+
+
+def encode_cache_value(result, codec=CACHE_CODEC):
+    """Serialize a result for query_cache. Returns (blob, serialized JSON size)."""
+    body = json.dumps(result, separators=(",", ":")).encode()
+    codec, data = compress(body, codec)
+    return CACHE_VALUE_MAGIC + bytes([CACHE_VALUE_VERSION, codec]) + data, len(body)
+
+
+def decode_cache_value(value):
+    """Inverse of encode_cache_value; plain JSON TEXT written before the BLOB format still loads"""
+    if isinstance(value, str):
+        return json.loads(value)
+    if value[:2] != CACHE_VALUE_MAGIC:
+        return json.loads(value)
+    if value[2] != CACHE_VALUE_VERSION:
+        raise ValueError(f"Unsupported cache value version {value[2]}")
+    return json.loads(decompress(value[4:], value[3]))
+
+
+def enforce_size_budget(max_bytes=CACHE_DB_MAX_BYTES, now=None):
+    """
+    Delete query_cache rows until their stored bytes fit max_bytes. Rows are evicted by
+    (seconds since last use) x (stored bytes), so one large cold result goes before many small ones.
+    Returns rows deleted.
+    """
+    now = time.time() if now is None else now
+    with cache_connection() as conn:
+        total = conn.execute("SELECT COALESCE(SUM(COALESCE(stored_bytes, LENGTH(result))), 0) FROM query_cache").fetchone()[0]
+        if total <= max_bytes:
+            return 0
+        victims, freed = [], 0
+        for query_hash, size in conn.execute("""
+            SELECT query_hash, COALESCE(stored_bytes, LENGTH(result)) AS size
+            FROM query_cache
+            ORDER BY (? - COALESCE(last_used, 0)) * COALESCE(stored_bytes, LENGTH(result)) DESC
+        """, (now,)):
+            victims.append((query_hash,))
+            freed += size or 0
+            if total - freed <= max_bytes:
+                break
+        conn.executemany("DELETE FROM query_cache WHERE query_hash = ?", victims)
+        conn.commit()
+    sqlite_stats["evicted"] += len(victims)
+    return len(victims)
+
+
+def sweep_expired(now=None):
+    """Delete expired query_cache rows and expired in-memory entries, then enforce the size budget. Returns rows deleted."""
+    now = time.time() if now is None else now
+    result_cache.purge_expired()
+    with cache_connection() as conn:
+        cursor = conn.execute("DELETE FROM query_cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        conn.commit()
+        deleted = cursor.rowcount
+    sqlite_stats["swept"] += deleted
+    return deleted + enforce_size_budget(now=now)
+
+
+_sweeper = None
+_sweeper_stop = threading.Event()
+
+
+def start_sweeper(interval=SWEEP_INTERVAL):
+    """Start the background expiry sweeper (idempotent)"""
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return _sweeper
+    _sweeper_stop.clear()
+
+    def run():
+        while not _sweeper_stop.wait(interval):
+            try:
+                sweep_expired()
+            except Exception as e:
+                print(f" Cache sweep warning: {e}")
+
+    _sweeper = threading.Thread(target=run, name="cache-sweeper", daemon=True)
+    _sweeper.start()
+    return _sweeper
+
+
+def stop_sweeper():
+    _sweeper_stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout=5)
+
+
+def normalize_question(nl_query):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    q = " ".join(nl_query.lower().split())
+    return re.sub(r"[\s?.!;]+$", "", q)
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop the trailing semicolon"""
+    sql = re.sub(r"('(?:[^']|'')*')|\s+", lambda m: m.group(1) or " ", sql.strip())
+    return sql.rstrip("; ")
+
+
+def subquery_key(source, sql, params=()):
+    raw = json.dumps([source, normalize_sql(sql), list(params)], default=str)
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def translation_key(nl_query, target_db, fingerprint):
+    raw = f"{normalize_question(nl_query)}|{target_db}|{fingerprint}"
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def init_translation_cache(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS sql_translation_cache (
+            translation_key TEXT PRIMARY KEY,
+            question TEXT,
+            target_db TEXT,
+            schema_fingerprint TEXT,
+            sql TEXT,
+            created_at TIMESTAMP,
+            hit_count INTEGER DEFAULT 0
+        )
+    """)
+
+
+def get_translation(key):
+    """Return cached SQL for a translation key, or None"""
+    sql = translation_cache.get(key)
+    if sql is not None:
+        translation_stats["hits"] += 1
+        return sql
+    with cache_connection() as conn:
+        row = conn.execute("SELECT sql FROM sql_translation_cache WHERE translation_key = ?", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE sql_translation_cache SET hit_count = hit_count + 1 WHERE translation_key = ?", (key,))
+            conn.commit()
+    if not row:
+        translation_stats["misses"] += 1
+        return None
+    translation_stats["hits"] += 1
+    translation_cache.put(key, row[0], len(row[0]))
+    return row[0]
+
+
+def save_translation(key, nl_query, target_db, fingerprint, sql):
+    """Store a translation; rows for the same target produced under an older schema are dropped"""
+    with cache_connection() as conn:
+        conn.execute("DELETE FROM sql_translation_cache WHERE target_db = ? AND schema_fingerprint != ?",
+                     (target_db, fingerprint))
+        conn.execute("""
+            INSERT OR REPLACE INTO sql_translation_cache
+            (translation_key, question, target_db, schema_fingerprint, sql, created_at)
+            VALUES (?, ?, ?, ?, ?, datetime('now'))
+        """, (key, normalize_question(nl_query), target_db, fingerprint, sql))
+        conn.commit()
+    translation_cache.put(key, sql, len(sql))
+    translation_stats["stored"] += 1
+
+
+def cache_stats():
+    return {
+        "memory": result_cache.stats(),
+        "sqlite": dict(sqlite_stats),
+        "translations": {**translation_stats, "memory_entries": translation_cache.stats()["entries"]},
+        "subquery": {**subquery_cache.stats(), **subquery_stats},
+    }
@@ -0,0 +1,103 @@
+"""
+Semijoin transport: push a set of keys (e.g. course ids from DB2) into a DB1 query.
+
+Strategy is chosen from the size of the key set:
+- in_list:    one statement, `col IN (?, ?, ...)` with bound parameters
+- chunked:    the same statement run once per batch of CHUNK_SIZE keys
+- temp_table: keys bulk-inserted into an indexed TEMP table and joined with `col IN (SELECT key ...)`
+
+The SQL passed in contains a `{semijoin}` placeholder where the key predicate goes,
+e.g. "SELECT ... FROM Enrollment e WHERE {semijoin} ORDER BY e.student_id".
+Any `?` parameters in the SQL must appear before the placeholder.
+"""
+IN_LIST_MAX = 500
+CHUNK_SIZE = 500
+TEMP_TABLE_MIN = 5000
+TEMP_TABLE = "semijoin_keys"
+
+STRATEGIES = ("in_list", "chunked", "temp_table")
+
+
+def choose_strategy(key_count):
+    if key_count <= IN_LIST_MAX:
+        return "in_list"
+    if key_count < TEMP_TABLE_MIN:
+        return "chunked"
+    return "temp_table"
+
+
+def unique_keys(keys):
+    """Deduplicate keys (as text, matching DB1's TEXT columns) while keeping first-seen order"""
+    seen = set()
+    out = []
+    for key in keys:
+        if key is None:
+            continue
+        key = str(key)
+        if key not in seen:
+            seen.add(key)
+            out.append(key)
+    return out
+
+
+def _fetch(cursor):
+    columns = [desc[0] for desc in cursor.description] if cursor.description else []
+    rows = []
+    while True:
+        batch = cursor.fetchmany(500)
+        if not batch:
+            break
+        rows.extend(dict(zip(columns, row)) for row in batch)
+    return columns, rows
+
+
+def _in_list(conn, sql, column, keys, params):
+    predicate = f"{column} IN ({', '.join('?' for _ in keys)})"
+    return _fetch(conn.execute(sql.format(semijoin=predicate), (*params, *keys)))
+
+
+def _chunked(conn, sql, column, keys, params, chunk_size=CHUNK_SIZE):
+    columns, rows = [], []
+    for start in range(0, len(keys), chunk_size):
+        columns, chunk_rows = _in_list(conn, sql, column, keys[start:start + chunk_size], params)
+        rows.extend(chunk_rows)
+    return columns, rows
+
+
+def _temp_table(conn, sql, column, keys, params):
+    # The temp table lives on the pooled connection and is reused across calls,
+    # so its schema (and cached statements that read it) stays stable.
+    conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS {TEMP_TABLE} (key TEXT PRIMARY KEY) WITHOUT ROWID")
+    conn.execute(f"DELETE FROM temp.{TEMP_TABLE}")
+    conn.executemany(f"INSERT OR IGNORE INTO temp.{TEMP_TABLE} (key) VALUES (?)", ((k,) for k in keys))
+    try:
+        predicate = f"{column} IN (SELECT key FROM temp.{TEMP_TABLE})"
+        return _fetch(conn.execute(sql.format(semijoin=predicate), params))
+    finally:
+        conn.execute(f"DELETE FROM temp.{TEMP_TABLE}")
+        if conn.in_transaction:
+            conn.commit()
+
+
+def run_semijoin(conn, sql, column, keys, params=(), strategy=None, order_by=None):
+    """
+    Execute `sql` restricted to rows whose `column` is in `keys`.
+    order_by: output column names to re-sort on when results are merged from several chunks.
+    Returns {"success", "columns", "rows", "strategy", "key_count"}.
+    """
+    keys = unique_keys(keys)
+    strategy = strategy or choose_strategy(len(keys))
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown semijoin strategy: {strategy}")
+    if not keys:
+        return {"success": True, "columns": [], "rows": [], "strategy": strategy, "key_count": 0}
+
+    if strategy == "in_list":
+        columns, rows = _in_list(conn, sql, column, keys, params)
+    elif strategy == "chunked":
+        columns, rows = _chunked(conn, sql, column, keys, params)
+        if order_by:
+            rows.sort(key=lambda row: tuple((row.get(c) is not None, row.get(c) or 0) for c in order_by))
+    else:
+        columns, rows = _temp_table(conn, sql, column, keys, params)
+    return {"success": True, "columns": columns, "rows": rows, "strategy": strategy, "key_count": len(keys)}
@@ -0,0 +1,76 @@
+"""
+Single-flight coalescing: concurrent calls with the same key share one execution.
+
+The first caller for a key runs the function; callers arriving while it is in flight
+wait for that result instead of repeating the work (same question -> one DB1/PC2/Gemini
+round trip). Nothing is remembered after the call finishes; that is the caches' job.
+"""
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Per-key in-flight deduplication with counters for executions and saved duplicates"""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+        self.bypassed = 0
+
+    def do(self, key, fn, shareable=None):
+        """
+        Run fn() once per in-flight key and hand its result (or exception) to every waiter.
+        shareable(result) -> False makes waiters run fn() themselves, for results that
+        cannot be handed to several callers (e.g. a lazily streamed cursor).
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executions += 1
+
+        if leader:
+            try:
+                call.result = fn()
+                return call.result
+            except BaseException as e:
+                call.error = e
+                raise
+            finally:
+                with self._lock:
+                    self._calls.pop(key, None)
+                call.done.set()
+
+        call.done.wait()
+        if call.error is not None:
+            with self._lock:
+                self.coalesced += 1
+            raise call.error
+        if shareable is not None and not shareable(call.result):
+            with self._lock:
+                self.bypassed += 1
+                self.executions += 1
+            return fn()
+        with self._lock:
+            self.coalesced += 1
+        return call.result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+    def stats(self):
+        with self._lock:
+            return {"executions": self.executions, "saved": self.coalesced, "bypassed": self.bypassed,
+                    "in_flight": len(self._calls)}
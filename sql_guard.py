@@ -0,0 +1,129 @@
+"""
+Execution guardrails for SQL that was not written by hand (Gemini output, API clients).
+
+Before a SELECT runs on SQLite:
+- EXPLAIN QUERY PLAN is inspected; a nested-loop product of full table scans larger than
+  MAX_CARTESIAN_ROWS is rejected, and full scans of large tables are noted
+- a LIMIT is appended when the statement has none (one extra row is fetched so the caller
+  can report the result as truncated)
+While it runs, a progress handler interrupts it once its deadline passes, and the caller
+returns an "aborted" result instead of holding a worker and a connection indefinitely.
+"""
+import re
+import sqlite3
+import time
+
+AUTO_LIMIT = 10000
+QUERY_DEADLINE_MS = 5000
+PROGRESS_STEPS = 10000  # SQLite VM instructions between deadline checks
+MAX_CARTESIAN_ROWS = 1000000
+LARGE_SCAN_ROWS = 100000
+
+LIMIT_PATTERN = re.compile(r'\blimit\s+(?:\d+|\?)(?:\s*(?:,|offset)\s*(?:\d+|\?))?\s*$', re.IGNORECASE)
+# FROM/JOIN/comma-list table references; later (FROM-clause) matches win over select-list lookalikes
+TABLE_REF_PATTERN = re.compile(r'(?:\bfrom|\bjoin|,)\s+([A-Za-z_]\w*)(?:\s+(?:as\s+)?(?!(?:on|where|join|inner|left|'
+                               r'cross|natural|group|order|limit|using|from)\b)([A-Za-z_]\w*))?', re.IGNORECASE)
+SCAN_PATTERN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?')
+
+
+def has_limit(sql):
+    return bool(LIMIT_PATTERN.search(sql.strip().rstrip(';').strip()))
+
+
+def add_limit(sql, limit):
+    """Append LIMIT limit+1 to a statement without one; returns (sql, applied limit or None)"""
+    body = sql.strip().rstrip(';').strip()
+    if has_limit(body):
+        return sql, None
+    return f"{body}\nLIMIT {int(limit) + 1};", limit
+
+
+def table_aliases(sql):
+    """{alias or table name (lowercased): table name} for the tables a statement reads"""
+    aliases = {}
+    for table, alias in TABLE_REF_PATTERN.findall(sql):
+        aliases[table.lower()] = table
+        if alias:
+            aliases[alias.lower()] = table
+    return aliases
+
+
+def table_rows(conn, table):
+    """Row estimate from sqlite_stat1, else MAX(rowid); None for views, CTEs and unknown names"""
+    try:
+        row = conn.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = ? LIMIT 1", (table,)).fetchone()
+        if row and row[0]:
+            return int(row[0].split()[0])
+    except sqlite3.OperationalError:
+        pass  # ANALYZE has not been run
+    try:
+        row = conn.execute(f'SELECT MAX(rowid) FROM "{table}"').fetchone()
+        return row[0] or 0
+    except sqlite3.Error:
+        return None
+
+
+def inspect_plan(conn, sql, params=()):
+    """
+    EXPLAIN QUERY PLAN a statement and look for runaway shapes.
+    Returns (error, notes): error is a rejection message or None; notes describe large full scans.
+    """
+    plan = conn.execute("EXPLAIN QUERY PLAN " + sql.strip().rstrip(';'), params).fetchall()
+    aliases = table_aliases(sql)
+    scans = {}  # parent id -> [(table, rows)] of full scans in one join loop
+    notes = []
+    for _, parent, _, detail in plan:
+        match = SCAN_PATTERN.match(detail)
+        if not match:
+            continue
+        name = match.group(2) or match.group(1)
+        table = aliases.get(name.lower(), match.group(1))
+        rows = table_rows(conn, table)
+        if rows is None:
+            continue
+        scans.setdefault(parent, []).append((table, rows))
+        if rows > LARGE_SCAN_ROWS:
+            notes.append(f"full scan of {table} (~{rows} rows)")
+
+    for loop in scans.values():
+        if len(loop) < 2:
+            continue
+        product = 1
+        for _, rows in loop:
+            product *= max(rows, 1)
+        if product > MAX_CARTESIAN_ROWS:
+            tables = " x ".join(f"{table}({rows})" for table, rows in loop)
+            return (f"Query rejected: cartesian product {tables} would produce ~{product} rows; "
+                    f"add a join condition"), notes
+    return None, notes
+
+
+def guard_query(conn, sql, params=(), limit=AUTO_LIMIT):
+    """
+    Inspect and rewrite one SELECT before it runs.
+    Returns {"sql", "limit" (applied auto-limit or None), "notes"} or {"error"} when rejected.
+    """
+    error, notes = inspect_plan(conn, sql, params)
+    if error:
+        return {"error": error, "notes": notes}
+    sql, applied = add_limit(sql, limit) if limit else (sql, None)
+    return {"sql": sql, "limit": applied, "notes": notes}
+
+
+def set_deadline(conn, timeout_ms=QUERY_DEADLINE_MS):
+    """Interrupt statements on conn once timeout_ms has passed (until clear_deadline)"""
+    deadline = time.monotonic() + timeout_ms / 1000.0
+    conn.set_progress_handler(lambda: 1 if time.monotonic() > deadline else 0, PROGRESS_STEPS)
+
+
+def clear_deadline(conn):
+    conn.set_progress_handler(None, PROGRESS_STEPS)
+
+
+def is_interrupted(exc):
+    return isinstance(exc, sqlite3.OperationalError) and "interrupted" in str(exc).lower()
+
+
+def aborted_result(sql, timeout_ms=QUERY_DEADLINE_MS):
+    return {"success": False, "aborted": True, "sql": sql,
+            "error": f"Query aborted after exceeding its {timeout_ms} ms deadline"}
@@ -0,0 +1,228 @@
+"""
+Registry of parameterized SQL templates for the pattern-matching layer.
+
+Each template looks at the lowercased question and returns (sql, params): the SQL text is
+a module constant with `?` placeholders, so every question of the same shape produces the
+same statement (sqlite3's per-connection statement cache, and prepared statements on PC2,
+are reused) and user-supplied values never reach the SQL text.
+"""
+import re
+
+TEMPLATES = {"db1": [], "db2": []}
+TEMPLATE_SLOTS = {}  # template name -> question slots (see fuzzy_match.SLOT_PATTERNS) its SQL binds
+
+# faculty name words stop at "from", which introduces the department
+FACULTY_PATTERN = r'(?:taught by|by|faculty|professor)\s+([a-zA-Z]+(?:\s+(?!from\b)[a-zA-Z]+)*)(?:\s+from\s+([a-zA-Z\s]+))?'
+
+
+def template(target_db, slots=()):
+    """
+    Decorator: register a matcher for `target_db`; matchers are tried in registration order.
+    slots: the question values the matcher binds, so a question carrying others can be refused.
+    """
+    def register(fn):
+        TEMPLATES[target_db].append(fn)
+        TEMPLATE_SLOTS[fn.__name__] = tuple(slots)
+        return fn
+    return register
+
+
+def match_template(nl_query, target_db):
+    """Return (name, sql, params) for the first matching template, or None"""
+    q = nl_query.lower().strip()
+    for fn in TEMPLATES.get(target_db, []):
+        matched = fn(q)
+        if matched:
+            sql, params = matched
+            return fn.__name__, sql, tuple(params)
+    return None
+
+
+def like_param(value):
+    """
+    Substring LIKE argument with the wildcards in `value` escaped.
+    Pair with ESCAPE '!' (a backslash escape would need different quoting in SQLite and MySQL).
+    """
+    escaped = value.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+    return f"%{escaped}%"
+
+
+PLACEHOLDER_PATTERN = re.compile(r"'(?:[^']|'')*'|\?")
+
+
+def sql_literal(value):
+    """MySQL literal for a bound value (quotes doubled, backslashes escaped)"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def inline_params(sql, params):
+    """
+    Replace each `?` outside string literals with its value as a MySQL literal, for PC2 servers that
+    do not bind parameters. LIKE arguments keep their like_param() escaping, so ESCAPE '!' still applies.
+    """
+    values = iter(params)
+
+    def replace(match):
+        if match.group(0) != "?":
+            return match.group(0)
+        try:
+            return sql_literal(next(values))
+        except StopIteration:
+            raise ValueError("fewer params than placeholders")
+
+    inlined = PLACEHOLDER_PATTERN.sub(replace, sql)
+    if next(values, values) is not values:
+        raise ValueError("more params than placeholders")
+    return inlined
+
+
+# ---------------------------------------------------------------- DB1
+
+# The rollup is aggregated per student in primary-key order first; Students is then probed by key
+ATTENDANCE_ABOVE_SQL = """
+SELECT s.student_id, s.name, s.email, s.program, s.year,
+    ROUND(100.0 * r.present_count / r.total_classes, 2) as attendance_percentage
+FROM (SELECT student_id, SUM(present_count) AS present_count, SUM(total_classes) AS total_classes
+      FROM AttendanceRollup
+      GROUP BY student_id) r
+JOIN Students s ON s.student_id = r.student_id
+WHERE (CAST(r.present_count AS FLOAT) / r.total_classes) > ?;
+"""
+
+STUDENT_ATTENDANCE_SQL = """
+SELECT r.course_id,
+       r.total_classes,
+       r.present_count,
+       ROUND(100.0 * r.present_count / r.total_classes, 2) as percentage
+FROM AttendanceRollup r
+WHERE r.student_id = ?
+ORDER BY r.course_id;
+"""
+
+STUDENTS_TAKING_SQL = """
+SELECT s.student_id, s.name, s.email, s.program, s.year, c.course_id, c.course_name
+FROM Students s
+JOIN Enrollment e ON s.student_id = e.student_id
+JOIN Courses c ON e.course_id = c.course_id
+WHERE c.course_name LIKE ? ESCAPE '!';
+"""
+
+ALL_STUDENTS_SQL = "SELECT * FROM Students;"
+
+# Shapes only reachable through the fuzzy matcher (fuzzy_match.py)
+ATTENDANCE_BELOW_SQL = """
+SELECT s.student_id, s.name, s.email, s.program, s.year,
+    ROUND(100.0 * r.present_count / r.total_classes, 2) as attendance_percentage
+FROM (SELECT student_id, SUM(present_count) AS present_count, SUM(total_classes) AS total_classes
+      FROM AttendanceRollup
+      GROUP BY student_id) r
+JOIN Students s ON s.student_id = r.student_id
+WHERE (CAST(r.present_count AS FLOAT) / r.total_classes) < ?;
+"""
+
+STUDENT_DETAILS_SQL = "SELECT * FROM Students WHERE student_id = ?;"
+
+STUDENT_COURSES_SQL = """
+SELECT e.course_id, e.semester, e.enrollment_date
+FROM Enrollment e
+WHERE e.student_id = ?
+ORDER BY e.course_id;
+"""
+
+STUDENTS_BY_YEAR_SQL = "SELECT * FROM Students WHERE year = ? ORDER BY student_id;"
+
+COUNT_STUDENTS_SQL = "SELECT COUNT(*) as student_count FROM Students;"
+
+
+@template("db1", slots=("percent",))
+def attendance_above(q):
+    """Students with attendance > X%"""
+    if "student" in q and "attendance" in q and ("greater" in q or "more than" in q or ">" in q):
+        percent_match = re.search(r'(\d+)\s*(%|percent)?', q)
+        if percent_match:
+            return ATTENDANCE_ABOVE_SQL, (float(percent_match.group(1)) / 100.0,)
+    return None
+
+
+@template("db1", slots=("student_id",))
+def student_attendance(q):
+    """Attendance of one student by ID (S001)"""
+    student_id_match = re.search(r'\bs(\d{3})\b', q)
+    if student_id_match and "student" in q and "attendance" in q:
+        return STUDENT_ATTENDANCE_SQL, ("S" + student_id_match.group(1),)
+    return None
+
+
+@template("db1")
+def students_taking(q):
+    """Students taking a specific course"""
+    course_match = re.search(r'taking\s+([a-zA-Z\s]+)', q)
+    if course_match and "student" in q:
+        return STUDENTS_TAKING_SQL, (like_param(course_match.group(1).strip()),)
+    return None
+
+
+@template("db1")
+def all_students(q):
+    """Default: show all students"""
+    if re.search(r"\bstudent'?s?\b", q) and any(kw in q for kw in ["show", "list", "get", "display", "all", "data", "info"]):
+        return ALL_STUDENTS_SQL, ()
+    return None
+
+
+# ---------------------------------------------------------------- DB2
+
+COURSES_BY_FACULTY_SQL = """
+SELECT c.*, f.name as faculty_name
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id
+WHERE f.name LIKE ? ESCAPE '!';
+"""
+
+COURSES_BY_FACULTY_DEPARTMENT_SQL = """
+SELECT c.*, f.name as faculty_name
+FROM Courses c
+JOIN Faculty f ON c.faculty_id = f.faculty_id
+WHERE f.name LIKE ? ESCAPE '!' AND f.department LIKE ? ESCAPE '!';
+"""
+
+ALL_FACULTY_SQL = "SELECT * FROM Faculty;"
+ALL_COURSES_SQL = "SELECT * FROM Courses;"
+
+FACULTY_BY_DEPARTMENT_SQL = "SELECT * FROM Faculty WHERE department LIKE ? ESCAPE '!';"
+EXAMS_FOR_COURSE_SQL = "SELECT * FROM Exams WHERE course_id = ? ORDER BY exam_date;"
+RESOURCES_FOR_COURSE_SQL = "SELECT * FROM Remedial_Resources WHERE course_id = ?;"
+
+
+@template("db2", slots=("faculty", "department"))
+def courses_by_faculty(q):
+    """Courses by faculty or department"""
+    if "course" in q and ("taught by" in q or "faculty" in q or "professor" in q or "by" in q):
+        faculty_match = re.search(FACULTY_PATTERN, q)
+        if faculty_match:
+            faculty_name = faculty_match.group(1).strip()
+            department = faculty_match.group(2).strip() if faculty_match.group(2) else None
+            if department:
+                return COURSES_BY_FACULTY_DEPARTMENT_SQL, (like_param(faculty_name), like_param(department))
+            return COURSES_BY_FACULTY_SQL, (like_param(faculty_name),)
+    return None
+
+
+@template("db2")
+def all_faculty(q):
+    if q in ["all faculty", "show all faculty", "list all faculty"]:
+        return ALL_FACULTY_SQL, ()
+    return None
+
+
+@template("db2")
+def all_courses(q):
+    if q in ["all courses", "show all courses", "list all courses"]:
+        return ALL_COURSES_SQL, ()
+    return None
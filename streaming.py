@@ -0,0 +1,136 @@
+"""
+Streaming execution for DB1 queries.
+
+Rows are pulled from the cursor in fetchmany() batches instead of fetchall(),
+so a caller that only shows the first page never materializes the rest.
+Row and byte caps stop a runaway query from exhausting coordinator memory.
+"""
+from collections import deque
+
+FETCH_BATCH_SIZE = 200
+MAX_RESULT_ROWS = 100000
+MAX_RESULT_BYTES = 64 * 1024 * 1024
+
+
+def iter_batches(cursor, batch_size=FETCH_BATCH_SIZE):
+    """Yield lists of rows from a DB-API cursor via fetchmany"""
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+def estimate_row_bytes(row):
+    """Rough in-memory size of a row dict (values rendered as text plus per-field overhead)"""
+    return sum(len(str(value)) + 16 for value in row.values())
+
+
+class StreamingResult:
+    """
+    Lazily fetched query result.
+
+    peek(n) buffers up to n rows without consuming them, fetch(n) hands over the next
+    n rows, iteration yields the remainder. The underlying connection is released as
+    soon as the cursor is exhausted, a cap is hit, or close() is called; on_close()
+    callbacks run at that point too.
+    """
+
+    def __init__(self, cursor, release=None, batch_size=FETCH_BATCH_SIZE,
+                 max_rows=MAX_RESULT_ROWS, max_bytes=MAX_RESULT_BYTES):
+        self.columns = [desc[0] for desc in cursor.description] if cursor.description else []
+        self._cursor = cursor
+        self._batches = iter_batches(cursor, batch_size)
+        self.batch_size = batch_size
+        self._release = release
+        self._on_close = []
+        self._buffer = deque()
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.rows_returned = 0
+        self.truncated = False
+        self.exhausted = False
+
+    def _fill(self):
+        """Pull one batch into the buffer; returns False once nothing more can be fetched"""
+        if self.exhausted:
+            return False
+        batch = next(self._batches, None)
+        if batch is None:
+            self.close()
+            return False
+        for raw in batch:
+            if self.rows_fetched >= self.max_rows or self.bytes_fetched >= self.max_bytes:
+                self.truncated = True
+                self.close()
+                break
+            row = dict(raw) if not isinstance(raw, dict) else raw
+            self.rows_fetched += 1
+            self.bytes_fetched += estimate_row_bytes(row)
+            self._buffer.append(row)
+        if len(batch) < self.batch_size:
+            # a short batch means the cursor is drained; release the connection now
+            self.close()
+        return True
+
+    def peek(self, n):
+        while len(self._buffer) < n and self._fill():
+            pass
+        return [self._buffer[i] for i in range(min(n, len(self._buffer)))]
+
+    def fetch(self, n):
+        self.peek(n)
+        rows = [self._buffer.popleft() for _ in range(min(n, len(self._buffer)))]
+        self.rows_returned += len(rows)
+        return rows
+
+    def has_more(self):
+        return bool(self._buffer) or bool(self.peek(1))
+
+    def fetch_all(self):
+        rows = list(self._buffer)
+        self._buffer.clear()
+        while self._fill():
+            rows.extend(self._buffer)
+            self._buffer.clear()
+        self.rows_returned += len(rows)
+        return rows
+
+    def __iter__(self):
+        while self.has_more():
+            yield from self.fetch(len(self._buffer) or 1)
+
+    def on_close(self, callback):
+        """Call callback() once the result is drained or closed (now, if it already is)"""
+        if self.exhausted:
+            callback()
+        else:
+            self._on_close.append(callback)
+
+    def close(self):
+        if self.exhausted:
+            return
+        self.exhausted = True
+        try:
+            self._cursor.close()
+        except Exception:
+            pass
+        if self._release is not None:
+            release, self._release = self._release, None
+            release()
+        callbacks, self._on_close = self._on_close, []
+        for callback in callbacks:
+            callback()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def summary(self):
+        return {"rows_fetched": self.rows_fetched, "rows_returned": self.rows_returned,
+                "bytes_fetched": self.bytes_fetched, "truncated": self.truncated,
+                "exhausted": self.exhausted}
@@ -0,0 +1,44 @@
+import sqlite3
+
+import pytest
+
+import db1_api_server
+from connections import SQLitePool
+
+
+@pytest.fixture
+def pooled_client(tmp_path, monkeypatch):
+    """Production-mode server over a database that has Students but no AttendanceRollup"""
+    path = str(tmp_path / "db1_student.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE Students (student_id TEXT PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO Students VALUES ('S001', 'Asha')")
+    conn.commit()
+    conn.close()
+
+    pool = SQLitePool(f"file:{path}?mode=ro", size=2, pragmas=db1_api_server.READER_PRAGMAS, timeout=0.5, uri=True)
+    monkeypatch.setattr(db1_api_server, "DB_PATH", path)
+    monkeypatch.setattr(db1_api_server, "_read_pool", pool)
+    monkeypatch.setattr(db1_api_server, "_watcher", None)
+    monkeypatch.setattr(db1_api_server, "_seen_data_version", None)
+    db1_api_server.response_cache.clear()
+    yield db1_api_server.app.test_client(), pool
+    pool.close_all()
+    db1_api_server._watcher.close()
+
+
+def test_failed_statements_return_their_connection(pooled_client, monkeypatch):
+    client, pool = pooled_client
+    for _ in range(3):  # more failures than the pool has connections
+        assert client.get("/api/attendance/summary").status_code == 500
+    assert pool.stats()["in_use"] == 0
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db1_api_server, "keyset_select",
+                      lambda table, where, params: ("SELECT rowid, * FROM Missing", [], None))
+        for _ in range(3):
+            assert client.get("/api/students").status_code == 500
+    assert pool.stats()["in_use"] == 0
+
+    response = client.get("/api/students")
+    assert response.get_json()["data"] == [{"student_id": "S001", "name": "Asha"}]
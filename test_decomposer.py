@@ -0,0 +1,80 @@
+import sqlite3
+
+import pytest
+
+from decomposer import decompose, run_dag
+from semijoin import run_semijoin
+
+
+def by_name(plan):
+    return {node["name"]: node for node in plan}
+
+
+@pytest.mark.parametrize("question", [
+    "explain the importance of exams",
+    "why do students miss exams",
+    "summarize what resources are for",
+])
+def test_explanations_are_not_decomposed(question):
+    assert decompose(question) is None
+
+
+def test_entities_with_retrieval_verb_are_decomposed():
+    plan = decompose("list exams and remedial resources")
+    assert {node["name"] for node in plan} == {"exams", "resources"}
+
+
+def test_student_attendance_selects_students():
+    plan = by_name(decompose("show students with attendance below 60% and explain why"))
+    students = plan["students"]
+    assert students["source"] == "db1" and students["grain"] == "student"
+    assert students["params"] == (0.6,)
+    assert "GROUP BY student_id" in students["sql"] and "attendance_courses" not in plan
+    assert plan["answer"]["deps"] == ["students"]
+
+
+def test_course_attendance_selects_courses():
+    plan = by_name(decompose("exams and remedial resources for courses where attendance is below 60%"))
+    assert plan["attendance_courses"]["grain"] == "course"
+    assert plan["exams"]["deps"] == ["attendance_courses"]
+
+
+def test_other_entities_follow_the_selected_students_courses():
+    plan = by_name(decompose("show exams for students with attendance below 50%"))
+    assert plan["enrolled_courses"]["deps"] == ["students"]
+    assert plan["enrolled_courses"]["key"] == "student_id"
+    assert plan["exams"]["deps"] == ["enrolled_courses"]
+
+
+def test_student_attendance_sql_returns_students_under_the_threshold():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Students (student_id TEXT PRIMARY KEY, name TEXT, email TEXT);
+        CREATE TABLE AttendanceRollup (student_id TEXT, course_id TEXT, total_classes INTEGER, present_count INTEGER);
+        INSERT INTO Students VALUES ('S001', 'Asha', 'a@u.edu'), ('S002', 'Ravi', 'r@u.edu');
+        INSERT INTO AttendanceRollup VALUES ('S001', '101', 10, 9), ('S001', '201', 10, 1),
+                                            ('S002', '101', 10, 5), ('S002', '201', 10, 5);
+    """)
+    node = by_name(decompose("show students with attendance below 60% and explain why"))["students"]
+    rows = conn.execute(node["sql"].format(semijoin="1=1"), node["params"]).fetchall()
+    assert [(row["student_id"], row["attendance_percentage"]) for row in rows] == [("S001", 50.0), ("S002", 50.0)]
+
+    # restricted to course 101, only Ravi is under 60%
+    result = run_semijoin(conn, node["sql"], "course_id", ["101"], params=node["params"], strategy="temp_table")
+    assert [row["student_id"] for row in result["rows"]] == ["S002"]
+
+
+def test_llm_node_runs_when_data_parts_fail():
+    plan = decompose("list exams and remedial resources for courses where attendance is below 60% and suggest next steps")
+
+    def run_node(node, inputs):
+        if node["source"] == "db2":
+            return {"success": False, "error": "PC2 unreachable"}
+        if node["source"] == "llm":
+            return {"success": True, "answer": sorted(inputs)}
+        return {"success": True, "rows": [{"course_id": "101"}]}
+
+    results, _ = run_dag(plan, run_node)
+    assert results["exams"]["success"] is False
+    assert results["answer"] == {"success": True, "answer": ["exams", "resources"]}
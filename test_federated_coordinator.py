@@ -0,0 +1,53 @@
+import federated_coordinator as fc
+from query_cache import SUBQUERY_TTL, LRUCache
+
+
+def use_versions(monkeypatch, versions):
+    """Fresh subquery cache; get_source_versions answers from `versions` and counts its calls"""
+    reads = []
+
+    def get_source_versions(sources):
+        reads.append(sources)
+        return {source: versions.get(source) for source in sources}
+
+    monkeypatch.setattr(fc, "subquery_cache", LRUCache(max_bytes=1 << 20, default_ttl=SUBQUERY_TTL))
+    monkeypatch.setattr(fc, "get_source_versions", get_source_versions)
+    return reads
+
+
+def counting_run():
+    calls = []
+
+    def run():
+        calls.append(1)
+        return {"success": True, "rows": [{"course_id": "101"}]}
+    return calls, run
+
+
+def test_subquery_reused_until_the_version_changes(monkeypatch):
+    versions = {"db2": "v1"}
+    use_versions(monkeypatch, versions)
+    calls, run = counting_run()
+    for _ in range(2):
+        fc.cached_subquery("db2", "SELECT course_id FROM Courses", [], run)
+    assert len(calls) == 1
+
+    versions["db2"] = "v2"
+    fc.cached_subquery("db2", "SELECT course_id FROM Courses", [], run)
+    assert len(calls) == 2
+
+
+def test_unknown_version_is_a_miss(monkeypatch):
+    use_versions(monkeypatch, {"db2": None})
+    calls, run = counting_run()
+    for _ in range(2):
+        fc.cached_subquery("db2", "SELECT course_id FROM Courses", [], run)
+    assert len(calls) == 2
+    assert fc.subquery_cache.stats()["entries"] == 0
+
+
+def test_unstored_call_without_entry_skips_the_version_read(monkeypatch):
+    reads = use_versions(monkeypatch, {"db1": "Enrollment:1"})
+    calls, run = counting_run()
+    fc.cached_subquery("db1", "SELECT * FROM Enrollment", [], run, store=False)
+    assert reads == [] and len(calls) == 1
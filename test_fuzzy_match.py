@@ -0,0 +1,39 @@
+import pytest
+
+from fuzzy_match import fuzzy_match, template_match
+
+
+def route(question, target_db="db1"):
+    """Intent chosen by the regex templates, then the fuzzy matcher (None: translation cache / LLM)"""
+    matched = template_match(question, target_db) or fuzzy_match(question, target_db)
+    return matched[0] if matched else None
+
+
+@pytest.mark.parametrize("question, intent", [
+    ("Students with attendance below 60%", "attendance_below"),
+    ("Show students with attendance greater than 75%", "attendance_above"),
+    ("students in year 2", "students_by_year"),
+    ("list all 3rd year students", "students_by_year"),
+    ("Show attendance for student S001", "student_attendance"),
+    ("details of student S002", "student_details"),
+])
+def test_routes_intent(question, intent):
+    assert route(question) == intent
+
+
+@pytest.mark.parametrize("question", [
+    "students in year 2 with attendance below 50%",       # year is not bound by attendance_below
+    "students in year 2 with attendance more than 50%",   # nor by the attendance_above template
+    "attendance of students in year 3",                   # students_by_year ignores "attendance"
+    "students with attendance not above 80%",
+    "students with attendance not more than 80%",
+    "students without attendance below 40%",
+    "all students except year 1",
+])
+def test_partial_matches_fall_through(question):
+    assert template_match(question, "db1") is None
+    assert fuzzy_match(question, "db1") is None
+
+
+def test_keyword_of_another_intent_falls_through():
+    assert route("which faculty teach more than three courses", "db2") is None
@@ -0,0 +1,96 @@
+import sqlite3
+
+import pytest
+
+import import_db1
+
+ROLLUP_FROM_ATTENDANCE = """
+SELECT student_id, course_id, COUNT(*), SUM(CASE WHEN LOWER(status) = 'present' THEN 1 ELSE 0 END)
+FROM Attendance GROUP BY student_id, course_id ORDER BY student_id, course_id
+"""
+ROLLUP = "SELECT student_id, course_id, total_classes, present_count FROM AttendanceRollup ORDER BY student_id, course_id"
+
+
+def write_csvs(directory, attendance):
+    (directory / "students.csv").write_text(
+        "student_id,name,program,year,email\n"
+        "S001,Asha,CS,1,asha@university.edu\n"
+        "S002,Ravi,CS,2,ravi@university.edu\n")
+    (directory / "Enrollment.csv").write_text(
+        "student_id,course_id,semester\nS001,CS101,Fall2024\nS002,CS101,Fall2024\n")
+    (directory / "Attendance.csv").write_text("student_id,course_id,dAte,status\n" + attendance)
+
+
+@pytest.fixture
+def db1(tmp_path, monkeypatch):
+    """import_db1 run from a temporary directory holding db1_student.db and data/*.csv"""
+    (tmp_path / "data").mkdir()
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / "data"
+
+
+def old_database(attendance):
+    """A DB1 built before the rollup and the natural-key indexes existed"""
+    conn = sqlite3.connect(import_db1.DB_PATH)
+    conn.executescript("""
+        CREATE TABLE Students (student_id TEXT PRIMARY KEY, name TEXT NOT NULL, email TEXT, program TEXT, year INTEGER);
+        CREATE TABLE Enrollment (enrollment_id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL,
+                                 course_id TEXT NOT NULL, semester TEXT, enrollment_date DATE);
+        CREATE TABLE Attendance (attendance_id INTEGER PRIMARY KEY AUTOINCREMENT, student_id TEXT NOT NULL,
+                                 course_id TEXT NOT NULL, date DATE, status TEXT);
+    """)
+    conn.executemany("INSERT INTO Attendance (student_id, course_id, date, status) VALUES (?, ?, ?, ?)", attendance)
+    conn.commit()
+    conn.close()
+
+
+def test_incremental_import_backfills_rollup_of_old_database(db1):
+    old_database([("S001", "CS101", "2024-09-01", "Present"), ("S001", "CS101", "2024-09-02", "Absent"),
+                  ("S002", "CS101", "2024-09-01", "Late")])
+    write_csvs(db1, "S001,CS101,2024-09-03,Present\n")
+
+    import_db1.create_tables(rebuild=False)
+    import_db1.import_data_incremental()
+
+    conn = sqlite3.connect(import_db1.DB_PATH)
+    expected = conn.execute(ROLLUP_FROM_ATTENDANCE).fetchall()
+    assert conn.execute(ROLLUP).fetchall() == expected
+    assert expected == [("S001", "CS101", 3, 2), ("S002", "CS101", 1, 0)]
+
+
+def test_existing_duplicates_are_removed_before_the_unique_key(db1):
+    old_database([("S001", "CS101", "2024-09-01", "Absent"), ("S001", "CS101", "2024-09-01", "Present"),
+                  ("S002", "CS101", None, "Late"), ("S002", "CS101", None, "Late")])
+
+    import_db1.create_tables(rebuild=False)
+
+    conn = sqlite3.connect(import_db1.DB_PATH)
+    rows = conn.execute("SELECT student_id, date, status FROM Attendance ORDER BY attendance_id").fetchall()
+    assert rows == [("S001", "2024-09-01", "Present"), ("S002", None, "Late"), ("S002", None, "Late")]
+    assert conn.execute(ROLLUP).fetchall() == conn.execute(ROLLUP_FROM_ATTENDANCE).fetchall()
+
+
+def test_full_import_keeps_the_last_of_duplicate_csv_rows(db1):
+    write_csvs(db1, "S001,CS101,2024-09-01,Absent\nS001,CS101,2024-09-01,Present\nS002,CS101,2024-09-01,Late\n")
+
+    import_db1.create_tables()
+    import_db1.import_data()
+
+    conn = sqlite3.connect(import_db1.DB_PATH)
+    assert conn.execute("SELECT student_id, status FROM Attendance ORDER BY student_id").fetchall() == [
+        ("S001", "Present"), ("S002", "Late")]
+
+
+def test_upsert_writes_only_changed_rows(db1):
+    write_csvs(db1, "S001,CS101,2024-09-01,Present\nS001,CS101,2024-09-02,Present\n")
+    import_db1.create_tables()
+    conn = sqlite3.connect(import_db1.DB_PATH)
+    path = str(db1 / "Attendance.csv")
+    assert import_db1.import_csv_incremental(conn, "Attendance", path)[:2] == (2, 2)
+    assert import_db1.import_csv_incremental(conn, "Attendance", path)[:2] == (2, 0)
+
+    write_csvs(db1, "S001,CS101,2024-09-01,Present\nS001,CS101,2024-09-02,Absent\n")
+    assert import_db1.import_csv_incremental(conn, "Attendance", path)[:2] == (2, 1)
+    assert conn.execute("SELECT date, status FROM Attendance ORDER BY date").fetchall() == [
+        ("2024-09-01", "Present"), ("2024-09-02", "Absent")]
+    assert conn.execute(ROLLUP).fetchall() == [("S001", "CS101", 2, 1)]
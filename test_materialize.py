@@ -0,0 +1,75 @@
+import connections
+import materialize
+from materialize import is_fresh, query_replica, refresh
+
+ENROLLMENTS = [
+    {"student_id": "S001", "name": "Asha", "email": "asha@university.edu", "program": "CS", "course_id": "101"},
+    {"student_id": "S002", "name": "Ravi", "email": "ravi@university.edu", "program": "CS", "course_id": "101"},
+    {"student_id": "S002", "name": "Ravi", "email": "ravi@university.edu", "program": "CS", "course_id": "201"},
+]
+COURSES = [
+    {"course_id": 101, "course_name": "Databases", "faculty_name": "Dr. Sharma", "department": "Computer Science"},
+    {"course_id": 201, "course_name": "Algebra", "faculty_name": "Dr. Rao", "department": "Mathematics"},
+]
+
+
+def use_cache_db(tmp_path, monkeypatch):
+    conn = connections.open_sqlite(str(tmp_path / "cache.db"), connections.CACHE_PRAGMAS)
+    monkeypatch.setattr(connections, "_cache_conn", conn)
+    monkeypatch.setattr(materialize, "_replica_ready", False)
+    return conn
+
+
+def counting_fetchers(enrollments, courses):
+    calls = {"db1": 0, "db2": 0}
+
+    def fetch_enrollments():
+        calls["db1"] += 1
+        return [dict(row) for row in enrollments]
+
+    def fetch_courses():
+        calls["db2"] += 1
+        return [dict(row) for row in courses]
+
+    return calls, fetch_enrollments, fetch_courses
+
+
+def test_db2_only_change_does_not_refetch_db1(tmp_path, monkeypatch):
+    use_cache_db(tmp_path, monkeypatch)
+    courses = [dict(row) for row in COURSES]
+    calls, fetch_enrollments, fetch_courses = counting_fetchers(ENROLLMENTS, courses)
+    assert refresh("Enrollment:1", "v1", fetch_enrollments, fetch_courses)["changed"]
+    assert calls == {"db1": 1, "db2": 1}
+
+    courses[1]["faculty_name"] = "Dr. Iyer"
+    summary = refresh("Enrollment:1", "v2", fetch_enrollments, fetch_courses)
+    assert calls == {"db1": 1, "db2": 2}
+    assert summary["db1_refetched"] is False and summary["db2_refetched"] is True
+    assert [row["student_id"] for row in query_replica("iyer")] == ["S002"]
+    assert query_replica("rao") == []
+    assert [row["student_id"] for row in query_replica("sharma")] == ["S001", "S002"]
+
+
+def test_db1_only_change_does_not_refetch_db2(tmp_path, monkeypatch):
+    use_cache_db(tmp_path, monkeypatch)
+    enrollments = [dict(row) for row in ENROLLMENTS]
+    calls, fetch_enrollments, fetch_courses = counting_fetchers(enrollments, COURSES)
+    refresh("Enrollment:1", "v1", fetch_enrollments, fetch_courses)
+
+    enrollments.pop(0)
+    summary = refresh("Enrollment:2", "v1", fetch_enrollments, fetch_courses)
+    assert calls == {"db1": 2, "db2": 1}
+    assert summary["db2_refetched"] is False
+    assert [row["student_id"] for row in query_replica("sharma")] == ["S002"]
+
+
+def test_is_fresh_only_reads_markers(tmp_path, monkeypatch):
+    conn = use_cache_db(tmp_path, monkeypatch)
+    assert not is_fresh("Enrollment:1", "v1")  # nothing initialized yet
+
+    _, fetch_enrollments, fetch_courses = counting_fetchers(ENROLLMENTS, COURSES)
+    refresh("Enrollment:1", "v1", fetch_enrollments, fetch_courses)
+    writes = conn.total_changes
+    assert is_fresh("Enrollment:1", "v1")
+    assert not is_fresh("Enrollment:1", "v2")
+    assert conn.total_changes == writes
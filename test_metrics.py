@@ -0,0 +1,52 @@
+import sqlite3
+
+from decomposer import run_dag
+from metrics import bind_trace, end_trace, instrument, record, result_bytes, start_trace
+from streaming import StreamingResult
+
+
+def test_streamed_result_is_recorded_when_drained():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.execute("CREATE TABLE t (v TEXT)")
+    conn.executemany("INSERT INTO t VALUES (?)", [("row %d" % i,) for i in range(500)])
+
+    @instrument("test_stream")
+    def query():
+        return {"success": True, "streaming": True, "rows": StreamingResult(conn.execute("SELECT v FROM t"))}
+
+    start_trace()
+    rows = query()["rows"]
+    rows.peek(1)
+    spans, _ = end_trace()
+    assert spans == []  # still streaming
+
+    rows.fetch_all()
+    assert [(span["stage"], span["rows"], span["bytes"]) for span in spans] == [
+        ("test_stream", 500, rows.bytes_fetched)]
+    assert rows.bytes_fetched > 0
+
+
+def test_list_results_report_bytes():
+    @instrument("test_bytes", size=result_bytes)
+    def query():
+        return {"success": True, "rows": [{"course_id": "CS101"}, {"course_id": "MA101"}]}
+
+    start_trace()
+    query()
+    spans, _ = end_trace()
+    assert spans[0]["rows"] == 2 and spans[0]["bytes"] == 2 * (len("CS101") + 16)
+
+
+def test_dag_node_spans_join_the_callers_trace():
+    plan = [{"name": "a", "source": "db1", "deps": []}, {"name": "b", "source": "db2", "deps": []},
+            {"name": "c", "source": "db1", "deps": ["a", "b"]}]
+
+    def run_node(node, inputs):
+        record(f"query_{node['source']}", 1.0, rows=1)
+        return {"success": True, "rows": []}
+
+    start_trace()
+    run_dag(plan, bind_trace(run_node))
+    spans, _ = end_trace()
+    assert sorted(span["stage"] for span in spans) == ["query_db1", "query_db1", "query_db2"]
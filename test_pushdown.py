@@ -0,0 +1,54 @@
+import sqlite3
+
+import pytest
+
+from decomposer import decompose
+from pushdown import combine_partials, students_sql
+
+COURSES = [
+    {"course_id": "101", "faculty_name": "Dr. Sharma", "department": "Computer Science"},
+    {"course_id": "102", "faculty_name": "Dr. Sharma", "department": "Computer Science"},
+    {"course_id": "201", "faculty_name": "Dr. Rao", "department": "Mathematics"},
+]
+
+
+@pytest.fixture
+def db1():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    conn.executescript("""
+        CREATE TABLE Students (student_id TEXT PRIMARY KEY, year INTEGER);
+        CREATE TABLE Enrollment (student_id TEXT, course_id TEXT);
+        CREATE TABLE AttendanceRollup (student_id TEXT, course_id TEXT, total_classes INTEGER, present_count INTEGER);
+        INSERT INTO Students VALUES ('S001', 1), ('S002', 2);
+        INSERT INTO Enrollment VALUES ('S001', '101'), ('S001', '102'), ('S002', '101'), ('S002', '201');
+        INSERT INTO AttendanceRollup VALUES ('S001', '101', 10, 2), ('S001', '102', 10, 4),
+                                            ('S002', '101', 10, 9), ('S002', '201', 10, 3);
+    """)
+    return conn
+
+
+def count_students(conn, db1_filters, group_by):
+    sql, params = students_sql(db1_filters, COURSES, group_by)
+    partials = [dict(row) for row in conn.execute(sql, params)]
+    return combine_partials(partials, COURSES, {"measure": "students", "group_by": group_by})
+
+
+def test_students_in_several_courses_of_a_group_count_once(db1):
+    rows = count_students(db1, {}, "department")
+    assert [(row["department"], row["courses"], row["students"]) for row in rows] == [
+        ("Computer Science", 2, 2), ("Mathematics", 1, 1)]
+    rows = count_students(db1, {}, "course")
+    assert [row["students"] for row in rows] == [2, 1, 1]
+
+
+def test_attendance_threshold_applies_to_each_students_own_attendance(db1):
+    # CS: S001 attends 6/20 (kept), S002 9/10 (dropped); Mathematics: S002 3/10 (kept)
+    rows = count_students(db1, {"attendance_below": 0.6}, "faculty")
+    assert [(row["faculty_name"], row["students"]) for row in rows] == [("Dr. Rao", 1), ("Dr. Sharma", 1)]
+    rows = count_students(db1, {"attendance_below": 0.6, "year": 2}, "department")
+    assert [row["students"] for row in rows] == [0, 1]
+
+
+def test_grouped_counts_are_not_decomposed():
+    assert decompose("how many students per faculty with attendance below 80%") is None
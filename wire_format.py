@@ -0,0 +1,139 @@
+"""
+Compact columnar wire format for coordinator <-> API server transfers.
+
+Instead of a list of row objects (every row repeating every column name), results are sent as
+    {"success": true, "format": "columnar", "columns": [...], "values": [[col0...], [col1...]], "row_count": n}
+
+Media types (negotiated through the Accept header):
+- application/vnd.campus.columnar+json   the layout above as plain JSON
+- application/vnd.campus.columnar        binary frame: MAGIC + codec byte + (compressed) UTF-8 JSON layout
+The binary frame is compressed with zstd when the optional `zstandard` package is installed on both ends
+and the client lists zstd in Accept-Encoding, otherwise with zlib (gzip-compatible deflate).
+"""
+import json
+import zlib
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    zstandard = None
+    HAS_ZSTD = False
+
+COLUMNAR_JSON = "application/vnd.campus.columnar+json"
+COLUMNAR_BINARY = "application/vnd.campus.columnar"
+MAGIC = b"CCF1"
+CODEC_NONE, CODEC_ZLIB, CODEC_ZSTD = 0, 1, 2
+COMPRESS_MIN_BYTES = 512  # smaller frames are sent uncompressed
+
+# Accept header the coordinator sends: binary first, then columnar JSON, then the legacy row format
+CLIENT_ACCEPT = f"{COLUMNAR_BINARY}, {COLUMNAR_JSON};q=0.9, application/json;q=0.5"
+
+
+def client_accept_encoding():
+    return "zstd, gzip" if HAS_ZSTD else "gzip"
+
+
+def to_columnar(columns, rows):
+    """Column arrays from tuple rows (sqlite3 rows / tuples) or dict rows"""
+    values = [[] for _ in columns]
+    for row in rows:
+        if isinstance(row, dict):
+            row = [row.get(col) for col in columns]
+        for i, value in enumerate(row):
+            values[i].append(value)
+    return values
+
+
+def columnar_payload(columns, values, **extra):
+    row_count = len(values[0]) if values else 0
+    return {"success": True, "format": "columnar", "columns": list(columns), "values": values,
+            "row_count": row_count, **extra}
+
+
+def negotiate(accept_header):
+    """Pick the response media type for an Accept header: COLUMNAR_BINARY, COLUMNAR_JSON or None (legacy rows)"""
+    accept = accept_header or ""
+    best, best_q = None, 0.0
+    for part in accept.split(","):
+        fields = [f.strip() for f in part.split(";")]
+        media = fields[0].lower()
+        q = 1.0
+        for field in fields[1:]:
+            if field.startswith("q="):
+                try:
+                    q = float(field[2:])
+                except ValueError:
+                    q = 0.0
+        if media in (COLUMNAR_BINARY, COLUMNAR_JSON) and q > best_q:
+            best, best_q = media, q
+        elif media in ("application/json", "*/*") and q > best_q:
+            best, best_q = None, q
+    return best
+
+
+def pick_codec(accept_encoding):
+    accept_encoding = (accept_encoding or "").lower()
+    if HAS_ZSTD and "zstd" in accept_encoding:
+        return CODEC_ZSTD
+    if "gzip" in accept_encoding or "deflate" in accept_encoding:
+        return CODEC_ZLIB
+    return CODEC_NONE
+
+
+def encode_json(payload):
+    return json.dumps(payload, default=str, separators=(",", ":")).encode()
+
+
+def compress(body, codec):
+    """Compress bytes with a CODEC_* value; bodies under COMPRESS_MIN_BYTES stay as they are. Returns (codec, body)"""
+    if len(body) < COMPRESS_MIN_BYTES:
+        return CODEC_NONE, body
+    if codec == CODEC_ZSTD:
+        return codec, zstandard.ZstdCompressor(level=3).compress(body)
+    if codec == CODEC_ZLIB:
+        return codec, zlib.compress(body, 6)
+    return CODEC_NONE, body
+
+
+def decompress(body, codec):
+    if codec == CODEC_ZSTD:
+        if not HAS_ZSTD:
+            raise ValueError("zstd data received but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(body)
+    return body
+
+
+def encode_binary(payload, codec=CODEC_ZLIB):
+    codec, body = compress(encode_json(payload), codec)
+    return MAGIC + bytes([codec]) + body
+
+
+def decode_binary(frame):
+    if frame[:4] != MAGIC:
+        raise ValueError("Not a columnar frame")
+    return json.loads(decompress(frame[5:], frame[4]))
+
+
+def rows_from_columnar(payload):
+    """Coordinator result structure ({"success", "columns", "rows"}) straight from column arrays"""
+    columns = payload.get("columns", [])
+    values = payload.get("values", [])
+    rows = [dict(zip(columns, row)) for row in zip(*values)] if values else []
+    result = {key: value for key, value in payload.items() if key not in ("format", "values", "row_count")}
+    result["columns"] = columns
+    result["rows"] = rows
+    return result
+
+
+def decode_response(content_type, body):
+    """Decode any supported response body into the coordinator result structure"""
+    media = (content_type or "").split(";")[0].strip().lower()
+    if media == COLUMNAR_BINARY:
+        return rows_from_columnar(decode_binary(body))
+    payload = json.loads(body)
+    if payload.get("format") == "columnar":
+        return rows_from_columnar(payload)
+    return payload